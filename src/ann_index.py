@@ -0,0 +1,143 @@
+import os
+import json
+import math
+import faiss
+import numpy as np
+
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+INDEX_META_FILE = "index_meta.json"
+
+# FAISS wants ~39 training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+
+
+def index_type_from_env():
+    index_type = (os.environ.get("FAISS_INDEX_TYPE") or "flat").lower()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS_INDEX_TYPE: {index_type}. Choose one of {', '.join(INDEX_TYPES)}.")
+    return index_type
+
+
+def ivf_nlist(n_vectors):
+    configured = os.environ.get("FAISS_NLIST")
+    if configured:
+        return int(configured)
+    # ~4 * sqrt(n) lists, but never more than the training set can support
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // MIN_POINTS_PER_CENTROID))
+
+
+def pq_m(dim):
+    # number of sub-quantizers, must divide the dimension
+    m = int(os.environ.get("FAISS_PQ_M") or 48)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def training_sample(vectors, size=None, seed=0):
+    size = size or int(os.environ.get("FAISS_TRAIN_SIZE") or 50000)
+    if len(vectors) <= size:
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+    rows = np.sort(np.random.default_rng(seed).choice(len(vectors), size, replace=False))
+    return np.ascontiguousarray(vectors[rows], dtype=np.float32)
+
+
+def create_index(vectors, index_type="flat"):
+    """
+    Creates an empty FAISS index of index_type for the (n, dim) vectors, trained on a
+    sample of them when the type needs training (FAISS_TRAIN_SIZE rows at most).
+
+    IVF indexes need at least 2 * 39 vectors to train; smaller corpora get a flat index.
+    """
+    n_vectors, dim = vectors.shape
+    if index_type in ("ivf_flat", "ivf_pq") and n_vectors < 2 * MIN_POINTS_PER_CENTROID:
+        print(f"Only {n_vectors} vectors, too few to train {index_type} - using a flat index.")
+        index_type = "flat"
+
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dim)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, int(os.environ.get("FAISS_HNSW_M") or 32))
+        index.hnsw.efConstruction = int(os.environ.get("FAISS_EF_CONSTRUCTION") or 200)
+        return index
+
+    nlist = ivf_nlist(n_vectors)
+    quantizer = faiss.IndexFlatL2(dim)
+    if index_type == "ivf_flat":
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+    else:
+        # 8 bits per code when there is enough data to train 256 centroids per sub-quantizer
+        nbits = max(1, min(8, int(math.log2(n_vectors // MIN_POINTS_PER_CENTROID))))
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m(dim), nbits)
+    sample = training_sample(vectors)
+    print(f"Training {index_type} index (nlist={nlist}) on {len(sample)} vectors...")
+    index.train(sample)
+    return index
+
+
+def index_type_of(index):
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return "ivf_flat"
+    if isinstance(index, faiss.IndexHNSWFlat):
+        return "hnsw"
+    return "flat"
+
+
+def describe_index(index):
+    meta = {"index_type": index_type_of(index), "dim": index.d, "ntotal": index.ntotal}
+    if meta["index_type"] in ("ivf_flat", "ivf_pq"):
+        meta["nlist"] = index.nlist
+    if meta["index_type"] == "ivf_pq":
+        meta["pq_m"] = index.pq.M
+        meta["pq_nbits"] = index.pq.nbits
+    if meta["index_type"] == "hnsw":
+        meta["hnsw_m"] = index.hnsw.nb_neighbors(1)
+        meta["ef_construction"] = index.hnsw.efConstruction
+    return meta
+
+
+def save_index_meta(path, index):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(describe_index(index), f, indent=2)
+
+
+def load_index_meta(index_dir):
+    # indexes built before index_meta.json existed are flat
+    path = os.path.join(index_dir, INDEX_META_FILE)
+    if not os.path.exists(path):
+        return {"index_type": "flat"}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def configure_search(index, nprobe=None, ef_search=None):
+    """
+    Sets the query-time knobs: nprobe (FAISS_NPROBE) for IVF indexes, efSearch
+    (FAISS_EF_SEARCH) for HNSW. Higher values trade latency for recall.
+    """
+    index_type = index_type_of(index)
+    if index_type in ("ivf_flat", "ivf_pq"):
+        nprobe = nprobe or int(os.environ.get("FAISS_NPROBE") or 8)
+        index.nprobe = min(nprobe, index.nlist)
+    elif index_type == "hnsw":
+        index.hnsw.efSearch = ef_search or int(os.environ.get("FAISS_EF_SEARCH") or 64)
+    return index
+
+
+def read_index(path, mmap=True, index_type="flat"):
+    """
+    Reads a FAISS index, memory-mapped and read-only when mmap is set, so the vectors stay
+    in the page cache instead of the process heap and are shared between processes.
+    """
+    if not mmap:
+        return faiss.read_index(str(path))
+    if index_type in ("ivf_flat", "ivf_pq"):
+        # maps the inverted lists
+        flags = faiss.IO_FLAG_MMAP
+    else:
+        # maps the flat vector storage (also used by HNSW)
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    return faiss.read_index(str(path), flags | faiss.IO_FLAG_READ_ONLY)
@@ -0,0 +1,86 @@
+import os
+import threading
+import numpy as np
+from ttl_cache import TTLCache
+
+
+class AnswerCache:
+    """
+    Semantic cache of LLM answers.
+
+    An answer is reused when a new query embedding is within max_distance (cosine distance)
+    of a previously answered query that was grounded on the same set of retrieved chunks
+    and asked in the same scope. Answers that depend on a conversation summary are stored
+    under a per-session scope (see scope()) so they never leak into other sessions.
+    The whole cache is flushed when the index version changes.
+    """
+
+    def __init__(self, max_distance=0.05, max_size=512, ttl=3600, max_per_key=32):
+        self.max_distance = max_distance
+        self.max_per_key = max_per_key
+        # (scope, chunk_key) -> [(unit query vector, answer), ...]
+        self._entries = TTLCache(max_size, ttl)
+        self.index_version = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_distance=float(os.environ.get("ANSWER_CACHE_MAX_DISTANCE") or 0.05),
+            max_size=int(os.environ.get("ANSWER_CACHE_SIZE") or 512),
+            ttl=float(os.environ.get("ANSWER_CACHE_TTL") or 3600),
+        )
+
+    @staticmethod
+    def scope(session_id, summary):
+        # the summary is part of the prompt, so an answer is only reused under the same one
+        return ("session", session_id, summary) if summary else "global"
+
+    @staticmethod
+    def chunk_key(docs):
+        return tuple(sorted(doc.id or doc.page_content for doc in docs))
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, index_version):
+        # caller holds self._lock
+        if index_version != self.index_version:
+            self._entries.clear()
+            self.index_version = index_version
+
+    def lookup(self, query_vector, docs, scope, index_version):
+        query = self._unit(query_vector)
+        with self._lock:
+            self._check_version(index_version)
+            entries = self._entries.get((scope, self.chunk_key(docs)))
+            if entries:
+                vectors, answers = zip(*entries)
+                distances = 1.0 - np.stack(vectors) @ query
+                best = int(np.argmin(distances))
+                if distances[best] <= self.max_distance:
+                    self.hits += 1
+                    return answers[best]
+            self.misses += 1
+            return None
+
+    def store(self, query_vector, docs, scope, index_version, answer):
+        key = (scope, self.chunk_key(docs))
+        entry = (self._unit(query_vector), answer)
+        with self._lock:
+            self._check_version(index_version)
+            entries = self._entries.get(key) or []
+            self._entries.set(key, (entries + [entry])[-self.max_per_key:])
+
+    def flush(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
@@ -1,34 +1,175 @@
-import requests
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from search_client import SearchClient, SearchUnavailableError
 
 
-def google_custom_search(query, api_key=None, cse_id=None, num=5):
-    """
-    Perform a Google Custom Search API query.
-    
-    :param query: The search query string.
-    :param api_key: Your Google API key.
-    :param cse_id: Your Google Custom Search Engine ID.
-    :param num: Number of results to return (default is 5).
-    :return: List of search results.
-    """
-    url = "https://www.googleapis.com/customsearch/v1"
-    params = {
+GOOGLE_SEARCH_URL = "https://www.googleapis.com/customsearch/v1"
+SERPAPI_SEARCH_URL = "https://serpapi.com/search"
+DEFAULT_URLS = {"google": GOOGLE_SEARCH_URL, "serpapi": SERPAPI_SEARCH_URL}
+
+_clients = {}
+_clients_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("SEARCH_THREADS") or 8), thread_name_prefix="search")
+# the provider requests of hedged_search. Searches on _executor wait for them, so they
+# must not queue behind those searches in the same pool
+_provider_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("SEARCH_THREADS") or 8), thread_name_prefix="search-provider")
+_hedge_wins = {"google": 0, "serpapi": 0}
+
+
+# one pooled client per provider; GOOGLE_SEARCH_URL / SERPAPI_SEARCH_URL can point at a stub server
+def get_search_client(name):
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = _clients[name] = SearchClient.from_env(name, DEFAULT_URLS[name])
+        return client
+
+
+def _google_params(query, api_key, cse_id, num):
+    return {
         "q": query,
         "key": api_key,
         "cx": cse_id,
         "num": num
     }
-    response = requests.get(url, params=params)
-    return response.json().get('items', [])
 
-    
-def serpapi_search(query, api_key=None):
-    url = "https://serpapi.com/search"
-    params = {
+
+def _serpapi_params(query, api_key):
+    return {
         "q": query,
         "api_key": api_key,
         "engine": "google",
     }
-    response = requests.get(url, params=params)
-    return response.json().get('organic_results', [])
 
+
+def google_custom_search(query, api_key=None, cse_id=None, num=5):
+    """
+    Perform a Google Custom Search API query.
+
+    :param query: The search query string.
+    :param api_key: Your Google API key.
+    :param cse_id: Your Google Custom Search Engine ID.
+    :param num: Number of results to return (default is 5).
+    :return: List of search results, empty if the search is unavailable.
+    """
+    try:
+        data = get_search_client("google").get_json(_google_params(query, api_key, cse_id, num), (query, num))
+    except SearchUnavailableError:
+        return []
+    return data.get('items', [])
+
+
+async def google_custom_search_async(query, api_key=None, cse_id=None, num=5):
+    """
+    Async version of google_custom_search.
+    """
+    try:
+        data = await get_search_client("google").aget_json(_google_params(query, api_key, cse_id, num), (query, num))
+    except SearchUnavailableError:
+        return []
+    return data.get('items', [])
+
+
+def serpapi_search(query, api_key=None):
+    try:
+        data = get_search_client("serpapi").get_json(_serpapi_params(query, api_key), query)
+    except SearchUnavailableError:
+        return []
+    return data.get('organic_results', [])
+
+
+async def serpapi_search_async(query, api_key=None):
+    try:
+        data = await get_search_client("serpapi").aget_json(_serpapi_params(query, api_key), query)
+    except SearchUnavailableError:
+        return []
+    return data.get('organic_results', [])
+
+
+def hedge_delay():
+    """
+    How long to wait for Google before also asking SerpAPI: SEARCH_HEDGE_DELAY if set,
+    otherwise Google's recent p95 latency.
+    """
+    configured = os.environ.get("SEARCH_HEDGE_DELAY")
+    if configured:
+        return float(configured)
+    return get_search_client("google").latency.percentile(95, default=0.5)
+
+
+def search_deadline():
+    # longest a turn waits for online search results (SEARCH_DEADLINE seconds)
+    return float(os.environ.get("SEARCH_DEADLINE") or 20)
+
+
+def hedged_search(query, google_api_key=None, google_cse_id=None, serp_api_key=None, delay=None, deadline=None):
+    """
+    Asks Google first and, if it has not answered with results after `delay` seconds,
+    SerpAPI as well. Returns the first non-empty result list; both providers return
+    title/snippet items. Gives up with [] after `deadline` seconds (SEARCH_DEADLINE).
+    """
+    delay = hedge_delay() if delay is None else delay
+    end = time.monotonic() + (search_deadline() if deadline is None else deadline)
+    futures = {_provider_executor.submit(google_custom_search, query, google_api_key, google_cse_id): "google"}
+    done, _ = wait(futures, timeout=delay)
+    if serp_api_key and not any(future.result() for future in done):
+        futures[_provider_executor.submit(serpapi_search, query, serp_api_key)] = "serpapi"
+
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=max(0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            results = future.result()
+            if results:
+                _hedge_wins[futures[future]] += 1
+                return results
+    return []
+
+
+async def hedged_search_async(query, google_api_key=None, google_cse_id=None, serp_api_key=None, delay=None, deadline=None):
+    """
+    Async version of hedged_search; the slower request is cancelled once one wins.
+    """
+    delay = hedge_delay() if delay is None else delay
+    end = time.monotonic() + (search_deadline() if deadline is None else deadline)
+    tasks = {asyncio.create_task(google_custom_search_async(query, google_api_key, google_cse_id)): "google"}
+    done, _ = await asyncio.wait(tasks, timeout=delay)
+    if serp_api_key and not any(task.result() for task in done):
+        tasks[asyncio.create_task(serpapi_search_async(query, serp_api_key))] = "serpapi"
+
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=max(0, end - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                break
+            for task in done:
+                results = task.result()
+                if results:
+                    _hedge_wins[tasks[task]] += 1
+                    return results
+        return []
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def submit_search(search, *args):
+    # runs a search on the shared search threads, e.g. to overlap it with retrieval
+    # in a copy of the caller's context, so its spans belong to the caller's trace
+    return _executor.submit(contextvars.copy_context().run, search, *args)
+
+
+def search_stats():
+    return {
+        name: {**get_search_client(name).stats(), "hedge_wins": _hedge_wins[name]}
+        for name in DEFAULT_URLS
+    }
@@ -1,34 +1,26 @@
 import os
-import threading
-import gradio as gr
-import json
+import asyncio
+import time
 import socket
+import httpx
 import requests
 from pathlib import Path
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
-from langchain_community.llms import Ollama
-from api_online_search import google_custom_search
-from doc_retrieve import retrieve_documents
-from doc_ingest import ingest_documents
+from llm_provider import get_llm, stream_text, astream_text, message_text, warm_up
+from api_online_search import google_custom_search, google_custom_search_async, hedged_search, hedged_search_async, submit_search, search_deadline
+from doc_retrieve import retrieve_documents_with_distance, get_retriever
+from answer_cache import AnswerCache
+from context_builder import build_rag_context
+from session_memory import create_session_store
+from summary_worker import SummaryWorker, LiveRequests
+from log_sink import JsonMessage, configure_logging
+from llm_scheduler import get_scheduler, SchedulerBusyError, SUMMARY
+from metrics import span, observe, trace, traced, atraced, current_trace, start_metrics_server
+from startup import Readiness, start_background, health_routes, prebuilt_index
 import logging
 
 
-# memory class - for storing conversation summary
-class SummaryMemory:
-    def __init__(self):
-        self.summary = ""
-        self.lock = threading.Lock()
-
-    def get(self):
-        with self.lock:
-            return self.summary
-
-    def set(self, value):
-        with self.lock:
-            self.summary = value
-            
-
-
 def get_env_variable(var_name):
     value = os.environ.get(var_name)
     if not value:
@@ -36,38 +28,31 @@ def get_env_variable(var_name):
     return value
 
 
-def get_llm():
-    return Ollama(
-        model="llama3",
-        temperature=0.1,
-        top_k=40,
-        top_p=0.9,
-        num_predict=512
-    )
-    
-    
-def get_openai_llm(api_key):
-    from langchain_openai import ChatOpenAI
-    return ChatOpenAI(
-        model_name="gpt-4o-mini",
-        openai_api_key=api_key,
-        temperature=0.0,
-        streaming=True,
-    )
-
-
 def log_response(query, history, context, response, context_from_rag):
-    logging.info(json.dumps({
-        "query": query,
-        "history": history,
-        "context_snippet": context[:120],
-        "retrieved_titles": context_from_rag,
-        "response": response,
-    }, ensure_ascii=False))
+    record = {"query": query}
+    current = current_trace()
+    if current is not None:
+        record["trace_id"] = current.id
+    # the full history and RAG context only for sampled turns (TRACE_SAMPLE_RATE)
+    if current is None or current.sampled:
+        record["history"] = list(history)
+        record["context_snippet"] = context[:120]
+        record["retrieved_titles"] = context_from_rag
+    else:
+        record["history_turns"] = len(history)
+        record["context_snippet"] = context[:120]
+    record["response"] = response
+    # serialized on the log thread, not in the chat turn
+    logging.info(JsonMessage(record))
     
     
 # async update summary function
-def update_summary(history):
+def update_summary(history, session_id):
+    with trace(), span("summarization", turns=len(history)):
+        summarize_history(history, session_id)
+
+
+def summarize_history(history, session_id):
     llm = get_llm()
     # up to 6 rounds of conversation history
     conv_history = ""
@@ -82,98 +67,295 @@ def update_summary(history):
         {"role": "system", "content": "You are a conversation summarizer."},
         {"role": "user", "content": summary_prompt}
     ]
-    # call LLM to generate summary
-    summary = llm.invoke(messages)
-    summary_memory.set(summary)
+    # call LLM to generate summary - after any waiting chat turns
+    with get_scheduler().slot(session_id, SUMMARY):
+        summary = message_text(llm.invoke(messages))
+    summary_memory.set(session_id, summary)
 
 
-def chat_fn(query, history):
-    
-    context = ""
-    context_from_rag = ""
-    
-    try:
-        
-        llm = get_llm()
-        # llm = get_openai_llm(OPENAI_API_KEY)
+def get_session_id(request):
+    # gradio gives every browser tab its own session hash
+    return getattr(request, "session_hash", None) or "default"
 
-        # RAG search from documents
-        rag_results = retrieve_documents(INDEX_DIR, query, 10, {"rag_dist_threshold": float(RAG_DIST_THRESHOLD)})
-        context_from_rag = f"\n{'-'*80}\n".join([doc.page_content for doc in rag_results]) if rag_results else ""
-        
-        if not context_from_rag:
-            context = "There is no relevant FAQ information found. "
-            api_saerch_results = google_custom_search(query, GOOGLE_API_KEY, GOOGLE_CSE_ID)
-            context_from_api = "\n".join([f"[{item['title']}]\n{item['snippet']}\n" for item in api_saerch_results if 'snippet' in item]) if api_saerch_results else ""
-            context += f"Here are some online search results:\n{context_from_api}" if context_from_api else "Online search API is facing some problems as well. Please kindly tell user to try again later or contact customer support for assistance."
+
+def stream_cached_answer(answer):
+    words = answer.split(" ")
+    for i in range(1, len(words) + 1):
+        yield " ".join(words[:i])
+
+
+def format_search_context(api_saerch_results):
+    context = "There is no relevant FAQ information found. "
+    context_from_api = "\n".join([f"[{item['title']}]\n{item['snippet']}\n" for item in api_saerch_results if 'snippet' in item]) if api_saerch_results else ""
+    context += f"Here are some online search results:\n{context_from_api}" if context_from_api else "Online search API is facing some problems as well. Please kindly tell user to try again later or contact customer support for assistance."
+    return context
+
+
+def web_search(query):
+    # SEARCH_HEDGE=true also asks SerpAPI when Google is slow and takes the first answer
+    if not SEARCH_ENABLED:
+        return []
+    with span("web_search", hedged=SEARCH_HEDGE) as attrs:
+        if SEARCH_HEDGE:
+            results = hedged_search(query, GOOGLE_API_KEY, GOOGLE_CSE_ID, SERP_API_KEY)
         else:
-            context = f"Please answer my question based on the following information retrieved from FAQ documents only. If you cannot find the answer, please say you don't know politely." + context_from_rag
+            results = google_custom_search(query, GOOGLE_API_KEY, GOOGLE_CSE_ID)
+        attrs["results"] = len(results or [])
+        return results
 
-        # fetch the latest summary
-        summary = summary_memory.get()
-        
-        system_prompt = (
-            "You are a helpful assistant named 'Corol'. Only answer based on the provided context information."
-            "Once you answer according to FAQ documents, you need to indicate which section or content you got the information from, so that user can refer to the original document."
-            "If information is insufficient, please say you are not sure and ask for more details.\n"
-            f"[Summary] Here is the previous conversation summary (if any):\n{summary}\n"
-            f"[Context] Here is the context information you are asked to refer to solely:\n{context}"
-        )
-        user_prompt = f"{query}"
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
-        # print(messages)
 
-        bot_response = ""
-    
-        # Ollama streaming
-        for chunk in llm.stream(messages):
-            bot_response += chunk
-            yield bot_response
-        
-        # # OpenAI streaming
-        # for chunk in llm.stream(messages):
-        #     if hasattr(chunk, "content") and chunk.content:
-        #         bot_response += chunk.content
-        #         yield bot_response
-        
-    except ValueError as e:
+async def web_search_async(query):
+    if not SEARCH_ENABLED:
+        return []
+    with span("web_search", hedged=SEARCH_HEDGE) as attrs:
+        if SEARCH_HEDGE:
+            results = await hedged_search_async(query, GOOGLE_API_KEY, GOOGLE_CSE_ID, SERP_API_KEY)
+        else:
+            results = await google_custom_search_async(query, GOOGLE_API_KEY, GOOGLE_CSE_ID)
+        attrs["results"] = len(results or [])
+        return results
+
+
+def should_speculate(best_distance):
+    # start the web search early when RAG is borderline (or clearly failing)
+    return SPECULATIVE_SEARCH and best_distance is not None and best_distance >= float(RAG_DIST_THRESHOLD) - SEARCH_BAND
+
+
+def speculative_results(search_future):
+    # results of a speculative search, [] if it takes longer than SEARCH_DEADLINE
+    try:
+        return search_future.result(timeout=search_deadline())
+    except FutureTimeoutError:
+        logging.warning("Speculative web search timed out.")
+        return []
+
+
+def build_context(query, context_from_rag, search_future=None):
+    if not context_from_rag:
+        api_saerch_results = speculative_results(search_future) if search_future is not None else web_search(query)
+        return format_search_context(api_saerch_results)
+    if search_future is not None:
+        # RAG succeeded - drop the speculative search. From answer_query only a search that
+        # has not started is cancelled (a running one finishes on its thread, its results
+        # unused); the async path's future wraps a coroutine, so its request is cancelled.
+        # Neither counts against the provider's circuit breaker
+        search_future.cancel()
+    return f"Please answer my question based on the following information retrieved from FAQ documents only. If you cannot find the answer, please say you don't know politely." + context_from_rag
+
+
+async def build_context_async(query, context_from_rag, search_future=None):
+    if not context_from_rag:
+        if search_future is not None:
+            try:
+                results = await asyncio.wait_for(asyncio.wrap_future(search_future), search_deadline())
+            except asyncio.TimeoutError:
+                logging.warning("Speculative web search timed out.")
+                results = []
+            return format_search_context(results)
+        return format_search_context(await web_search_async(query))
+    return build_context(query, context_from_rag, search_future)
+
+
+def build_messages(query, summary, context):
+    with span("prompt_build"):
+        return prompt_messages(query, summary, context)
+
+
+def prompt_messages(query, summary, context):
+    system_prompt = (
+        "You are a helpful assistant named 'Corol'. Only answer based on the provided context information."
+        "Once you answer according to FAQ documents, you need to indicate which section or content you got the information from, so that user can refer to the original document."
+        "If information is insufficient, please say you are not sure and ask for more details.\n"
+        f"[Summary] Here is the previous conversation summary (if any):\n{summary}\n"
+        f"[Context] Here is the context information you are asked to refer to solely:\n{context}"
+    )
+    user_prompt = f"{query}"
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def retrieve_context(query, on_best_distance=None):
+    # RAG search from documents
+    rag_results, _ = retrieve_documents_with_distance(INDEX_DIR, query, RAG_TOP_K, {"rag_dist_threshold": float(RAG_DIST_THRESHOLD)}, on_best_distance)
+    # merge overlapping chunks and keep the prompt within CONTEXT_TOKEN_BUDGET
+    with span("context_build", chunks=len(rag_results)) as attrs:
+        context_from_rag, packed = build_rag_context(rag_results, CONTEXT_TOKEN_BUDGET)
+        attrs["packed"] = len(packed)
+    return rag_results, context_from_rag
+
+
+def lookup_cached_answer(query, rag_results, summary, session_id):
+    # answers grounded on FAQ chunks can be reused; summary-dependent ones only within the session
+    if answer_cache is None or not rag_results:
+        return None, None
+    retriever = get_retriever(INDEX_DIR)
+    scope = AnswerCache.scope(session_id, summary)
+    cache_args = (retriever.embed_query(query), rag_results, scope, retriever.version)
+    return cache_args, answer_cache.lookup(*cache_args)
+
+
+def turn_source(context, context_from_rag):
+    if context == "(cached answer)":
+        return "cache"
+    if context_from_rag:
+        return "faq"
+    return "web" if context else "error"
+
+
+def error_response(e):
+    if isinstance(e, SchedulerBusyError):
+        bot_response = "Sorry, our assistant is busy serving other users right now. Please try again later."
+        logging.warning(f"SchedulerBusyError: {str(e)}")
+    elif isinstance(e, ValueError):
         bot_response = "It seems your question is not clear or is outside the supported scope. Please clarify or rephrase."
         logging.warning(f"ValueError: {str(e)}", exc_info=True)
-        yield bot_response
-    except (requests.exceptions.Timeout, socket.timeout) as e:
+    elif isinstance(e, (requests.exceptions.Timeout, socket.timeout, httpx.TimeoutException, asyncio.TimeoutError)):
         bot_response = "Sorry, our system is experiencing a temporary network timeout. Please try again in a moment."
         logging.error(f"TimeoutError: {str(e)}", exc_info=True)
-        yield bot_response
-    except (requests.exceptions.ConnectionError, socket.gaierror) as e:
+    elif isinstance(e, (requests.exceptions.ConnectionError, socket.gaierror, httpx.ConnectError)):
         bot_response = "Sorry, our chatbot could not connect to the backend. Please try again later."
         logging.error(f"ConnectionError: {str(e)}", exc_info=True)
-        yield bot_response
-    except RuntimeError as e:
+    elif isinstance(e, RuntimeError):
         bot_response = "Sorry, the system encountered an internal error. Please try again or contact support."
         logging.error(f"RuntimeError: {str(e)}", exc_info=True)
-        yield bot_response
-    except Exception as e:
+    else:
         # 兜底处理未知异常
         bot_response = (
             "Sorry, something went wrong. "
             "Our team has been notified. Please try again or contact customer service."
         )
         logging.error(f"UnhandledException: {str(e)}", exc_info=True)
-        yield bot_response
+    return bot_response
+
+
+def chat_fn(query, history, request=None):
+    session_id = get_session_id(request)
+    # counted as live traffic until the stream ends, so summaries wait for it
+    with live_requests:
+        # one trace per turn, sampled at TRACE_SAMPLE_RATE
+        yield from traced(answer_query(query, history, session_id))
+
+
+async def chat_fn_async(query, history, request=None):
+    session_id = get_session_id(request)
+    with live_requests:
+        async for bot_response in atraced(answer_query_async(query, history, session_id)):
+            yield bot_response
+
+
+def answer_query(query, history, session_id):
+
+    start = time.perf_counter()
+    context = ""
+    context_from_rag = ""
+
+    try:
+        
+        llm = get_llm()
+
+        # speculative web search, started as soon as the vector search shows a borderline match
+        search_future = None
+
+        def speculate(best_distance):
+            nonlocal search_future
+            if should_speculate(best_distance):
+                search_future = submit_search(web_search, query)
+
+        rag_results, context_from_rag = retrieve_context(query, speculate)
+
+        # fetch the latest summary of this session
+        summary = summary_memory.get(session_id)
+        cache_args, cached_answer = lookup_cached_answer(query, rag_results, summary, session_id)
+
+        bot_response = ""
+
+        if cached_answer is not None:
+            context = "(cached answer)"
+            if search_future is not None:
+                search_future.cancel()
+            for bot_response in stream_cached_answer(cached_answer):
+                yield bot_response
+        else:
+            context = build_context(query, context_from_rag, search_future)
+            messages = build_messages(query, summary, context)
+            # print(messages)
+
+            # Ollama or OpenAI streaming, depending on LLM_PROVIDER, once a generation slot is free
+            with get_scheduler().slot(session_id):
+                for chunk in stream_text(llm, messages):
+                    bot_response += chunk
+                    yield bot_response
+
+            if cache_args is not None and bot_response:
+                answer_cache.store(*cache_args, bot_response)
         
+    except Exception as e:
+        bot_response = error_response(e)
+        yield bot_response
 
+    observe("turn", time.perf_counter() - start, source=turn_source(context, context_from_rag))
     # update history with user query and bot response
-    def update_summary_async(history):
-        try:
-            update_summary(history)
-        except Exception as e:
-            print(f"Failed to update summary: {e}")
-                
     log_response(query, history, context, bot_response, context_from_rag)
-    threading.Thread(target=update_summary_async, args=(history + [(query, bot_response)],)).start()
+    summary_worker.submit(session_id, history + [(query, bot_response)])
+
+
+async def answer_query_async(query, history, session_id):
+    """
+    Same pipeline as answer_query, but never blocks the event loop: retrieval, the
+    summary lookup and the answer cache lookup run in the default executor, the web search uses httpx and the LLM
+    is streamed with astream.
+    """
+    start = time.perf_counter()
+    context = ""
+    context_from_rag = ""
+
+    try:
+        llm = get_llm()
+        loop = asyncio.get_running_loop()
+
+        search_future = None
+
+        def speculate(best_distance):
+            # called on the executor thread - schedule the search on the event loop
+            nonlocal search_future
+            if should_speculate(best_distance):
+                search_future = asyncio.run_coroutine_threadsafe(web_search_async(query), loop)
+
+        # to_thread keeps the trace context
+        rag_results, context_from_rag = await asyncio.to_thread(retrieve_context, query, speculate)
+        summary = await asyncio.to_thread(summary_memory.get, session_id)
+        # embeds the query on a cache miss
+        cache_args, cached_answer = await asyncio.to_thread(lookup_cached_answer, query, rag_results, summary, session_id)
+
+        bot_response = ""
+
+        if cached_answer is not None:
+            context = "(cached answer)"
+            if search_future is not None:
+                search_future.cancel()
+            for bot_response in stream_cached_answer(cached_answer):
+                yield bot_response
+        else:
+            context = await build_context_async(query, context_from_rag, search_future)
+            messages = build_messages(query, summary, context)
+
+            async with get_scheduler().aslot(session_id):
+                async for chunk in astream_text(llm, messages):
+                    bot_response += chunk
+                    yield bot_response
+
+            if cache_args is not None and bot_response:
+                answer_cache.store(*cache_args, bot_response)
+
+    except Exception as e:
+        bot_response = error_response(e)
+        yield bot_response
+
+    observe("turn", time.perf_counter() - start, source=turn_source(context, context_from_rag))
+    log_response(query, history, context, bot_response, context_from_rag)
+    summary_worker.submit(session_id, history + [(query, bot_response)])
 
 
 # load environment variables
@@ -183,33 +365,73 @@ DATA_DIR = BASE_DIR / get_env_variable("DATA_DIR")
 RAG_DIR = BASE_DIR / get_env_variable("RAG_DIR")
 INDEX_DIR = BASE_DIR / get_env_variable("INDEX_DIR")
 RAG_DIST_THRESHOLD = get_env_variable("RAG_DIST_THRESHOLD")
-GOOGLE_API_KEY = get_env_variable("GOOGLE_API_KEY")
-GOOGLE_CSE_ID = get_env_variable("GOOGLE_CSE_ID")
-SERP_API_KEY = get_env_variable("SERP_API_KEY")
-OPENAI_API_KEY = get_env_variable("OPENAI_API_KEY")
+# search keys are optional - without them only the FAQ documents are used
+GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
+GOOGLE_CSE_ID = os.environ.get("GOOGLE_CSE_ID")
+SERP_API_KEY = os.environ.get("SERP_API_KEY")
+SEARCH_ENABLED = bool(GOOGLE_API_KEY and GOOGLE_CSE_ID)
+RAG_TOP_K = int(os.environ.get("RAG_TOP_K") or 5)
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET") or 1500)
+SPECULATIVE_SEARCH = os.environ.get("SPECULATIVE_SEARCH", "").lower() in ("1", "true", "yes")
+SEARCH_BAND = float(os.environ.get("SEARCH_BAND") or 0.1)
+SEARCH_HEDGE = os.environ.get("SEARCH_HEDGE", "").lower() in ("1", "true", "yes") and bool(SERP_API_KEY)
+# conversation summaries per gradio session
+summary_memory = create_session_store(sqlite_path=RAG_DIR / "sessions.db")
+# background summarization yields to live chat turns
+live_requests = LiveRequests()
+summary_worker = SummaryWorker.from_env(update_summary, is_busy=live_requests.busy)
+# opt-in semantic answer cache
+answer_cache = AnswerCache.from_env() if os.environ.get("ANSWER_CACHE_ENABLED", "").lower() in ("1", "true", "yes") else None
 
 
 
-if __name__ == "__main__":
+STARTING_UP_RESPONSE = "The assistant is still starting up. Please try again in a moment."
 
-    summary_memory = SummaryMemory()
-    logging.basicConfig(
-        filename=f"{RAG_DIR}/rag_test.log",
-        level=logging.INFO,
-        format="%(asctime)s [%(levelname)s] %(message)s"
-    )
 
-    # read and load documents into vectorstore
-    if not DATA_DIR.exists():
-        raise FileNotFoundError(f"Data directory {DATA_DIR} does not exist. Please check your environment variables.")
-    if not INDEX_DIR.exists():
-        raise FileNotFoundError(f"Index directory {INDEX_DIR} does not exist. Please check your environment variables.")
-    ingest_documents(DATA_DIR, INDEX_DIR)
+def build_ui(readiness=None):
+    """
+    The Gradio chat interface. Gradio is imported here, so importing app (tests,
+    benchmarks) does not pay for it. Until readiness is set, turns get a short "starting
+    up" reply instead of waiting.
+    """
+    import gradio as gr
+
+    def not_ready():
+        return readiness is not None and not readiness.is_ready
 
-    # Gradio chat interface
-    chatbot = gr.ChatInterface(
-        fn=chat_fn,
+    def respond(query, history, request: gr.Request):
+        if not_ready():
+            yield STARTING_UP_RESPONSE
+            return
+        yield from chat_fn(query, history, request)
+
+    async def respond_async(query, history, request: gr.Request):
+        if not_ready():
+            yield STARTING_UP_RESPONSE
+            return
+        async for bot_response in chat_fn_async(query, history, request):
+            yield bot_response
+
+    # CHAT_MODE=async serves many streams from the event loop
+    chat_mode = os.environ.get("CHAT_MODE", "sync").lower()
+    return gr.ChatInterface(
+        fn=respond_async if chat_mode == "async" else respond,
         title="Carro FAQ Chatbot - Corol",
         description="Support Streaming & Multi-window memories to provide information according to Q&A Documents and Online Search Results."
     )
-    chatbot.launch()
+
+
+if __name__ == "__main__":
+
+    # rag_test.log (or .jsonl / .msgpack with LOG_FORMAT), written by a background thread
+    configure_logging(RAG_DIR / "rag_test")
+    if not SEARCH_ENABLED:
+        logging.warning("GOOGLE_API_KEY / GOOGLE_CSE_ID not set - online search fallback is disabled.")
+
+    # ingestion, index/model loading and LLM warm-up run in the background;
+    # /readyz on the metrics port reports when the first turn can be answered
+    readiness = Readiness()
+    start_metrics_server(routes=health_routes(readiness))
+    start_background(readiness, DATA_DIR, INDEX_DIR, prebuilt=prebuilt_index(), warm_up_llm=warm_up)
+
+    build_ui(readiness).launch()
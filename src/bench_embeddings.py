@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+import numpy as np
+from dotenv import load_dotenv
+from bench_retrieval import QUESTIONS_FILE
+from embedding_backend import EMBEDDING_BACKENDS
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+SRC_DIR = Path(__file__).resolve().parent
+
+# one fresh interpreter per backend, so load time and RSS are not shared between them
+CHILD = """
+import sys, time, json, resource
+import numpy as np
+backend, workdir, repeat = sys.argv[1], sys.argv[2], int(sys.argv[3])
+with open(f"{workdir}/texts.json", "r", encoding="utf-8") as f:
+    texts = json.load(f)
+start = time.perf_counter()
+from doc_retrieve import EMBEDDING_MODEL_NAME
+from embedding_backend import create_embeddings
+embeddings = create_embeddings(EMBEDDING_MODEL_NAME, backend)
+embeddings.embed_query("warm up")
+load_seconds = time.perf_counter() - start
+
+latencies = []
+for _ in range(repeat):
+    for query in texts["queries"]:
+        start = time.perf_counter()
+        embeddings.embed_query(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+queries = [embeddings.embed_query(query) for query in texts["queries"]]
+start = time.perf_counter()
+docs = embeddings.embed_documents(texts["chunks"])
+docs_seconds = time.perf_counter() - start
+np.save(f"{workdir}/{backend}-queries.npy", np.array(queries, dtype=np.float32))
+np.save(f"{workdir}/{backend}-docs.npy", np.array(docs, dtype=np.float32))
+latencies.sort()
+print(json.dumps({
+    "load_seconds": load_seconds,
+    "query_p50_ms": latencies[len(latencies) // 2],
+    "query_p95_ms": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+    "docs_per_second": len(docs) / docs_seconds,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+
+def load_chunks(data_dir):
+    # the same chunks ingest would embed, without embedding them
+    from doc_ingest import read_pdf_file, sliding_chunk_with_metadata_delimiter
+    return [doc.page_content for doc in sliding_chunk_with_metadata_delimiter(read_pdf_file(data_dir))]
+
+
+def run_backend(backend, workdir, repeat, env):
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, backend, str(workdir), str(repeat)],
+        cwd=SRC_DIR, env=env, capture_output=True, text=True,
+    )
+    if out.returncode:
+        lines = out.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit code {out.returncode}"}
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def top_k(queries, docs, k):
+    return np.argsort(-(queries @ docs.T), axis=1)[:, :k]
+
+
+def overlap(a, b):
+    # share of the reference top-k that is also in a's top-k
+    return float(np.mean([len(set(x) & set(y)) / len(y) for x, y in zip(a, b)]))
+
+
+def agreement(workdir, backend, reference, k):
+    """
+    Compares the vectors of backend with those of the reference backend: cosine
+    similarity of the query vectors, top-k overlap when both the index and the queries
+    use backend ("own index"), and when backend queries an index built by the reference
+    ("mixed", e.g. an int8 query model serving an index built with torch).
+    """
+    queries, docs = (np.load(workdir / f"{backend}-{kind}.npy") for kind in ("queries", "docs"))
+    ref_queries, ref_docs = (np.load(workdir / f"{reference}-{kind}.npy") for kind in ("queries", "docs"))
+    if queries.shape[1] != ref_queries.shape[1]:
+        return {"cosine_mean": None, "cosine_min": None, "top_k_own": None, "top_k_mixed": None}
+    cosine = (queries * ref_queries).sum(axis=1) / (
+        np.linalg.norm(queries, axis=1) * np.linalg.norm(ref_queries, axis=1)
+    )
+    expected = top_k(ref_queries, ref_docs, k)
+    return {
+        "cosine_mean": float(cosine.mean()),
+        "cosine_min": float(cosine.min()),
+        "top_k_own": overlap(top_k(queries, docs, k), expected),
+        "top_k_mixed": overlap(top_k(queries, ref_docs, k), expected),
+    }
+
+
+def fmt(value, width, digits=2):
+    return f"{value:>{width}.{digits}f}" if value is not None else f"{'-':>{width}}"
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Compare embedding backends: latency, RSS and retrieval agreement.")
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--reference", default="torch", help="backend the others are compared with")
+    parser.add_argument("--threads", type=int, nargs="+", default=[int(os.environ.get("EMBEDDING_THREADS") or 1)],
+                        help="EMBEDDING_THREADS values to run every backend with")
+    parser.add_argument("--questions", default=str(QUESTIONS_FILE), help="JSON list of {question, expected} items")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per question")
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        queries = [item["question"] for item in json.load(f)]
+    chunks = load_chunks(BASE_DIR / (os.environ.get("DATA_DIR") or "docs"))
+    print(f"{len(queries)} queries, {len(chunks)} chunks, top-{args.k} agreement vs {args.reference}\n")
+
+    print(f"{'backend':<11}{'threads':>8}{'load s':>8}{'RSS MB':>8}{'p50 ms':>8}{'p95 ms':>8}{'docs/s':>8}"
+          f"{'cos mean':>10}{'cos min':>9}{'own':>7}{'mixed':>7}")
+    for threads in args.threads:
+        workdir = Path(tempfile.mkdtemp(prefix="faq-embeddings-"))
+        with open(workdir / "texts.json", "w", encoding="utf-8") as f:
+            json.dump({"queries": queries, "chunks": chunks}, f)
+        env = {**os.environ, "EMBEDDING_THREADS": str(threads)}
+        # the reference runs first so the others can be compared with it
+        backends = [args.reference] + [b for b in args.backends if b != args.reference]
+        results = {backend: run_backend(backend, workdir, args.repeat, env) for backend in backends}
+        reference_ok = "error" not in results[args.reference]
+        for backend, result in results.items():
+            if "error" in result:
+                print(f"{backend:<11}{threads:>8}   unavailable: {result['error']}")
+                continue
+            match = agreement(workdir, backend, args.reference, args.k) if reference_ok else {}
+            print(
+                f"{backend:<11}{threads:>8}"
+                f"{result['load_seconds']:>8.2f}{result['rss_mb']:>8.0f}"
+                f"{result['query_p50_ms']:>8.2f}{result['query_p95_ms']:>8.2f}{result['docs_per_second']:>8.0f}"
+                f"{fmt(match.get('cosine_mean'), 10, 4)}{fmt(match.get('cosine_min'), 9, 4)}"
+                f"{fmt(match.get('top_k_own'), 7)}{fmt(match.get('top_k_mixed'), 7)}"
+            )
@@ -0,0 +1,70 @@
+import os
+import json
+import time
+import argparse
+from pathlib import Path
+from dotenv import load_dotenv
+from doc_ingest import ingest_documents
+from doc_retrieve import Retriever
+from ann_index import load_index_meta
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+QUESTIONS_FILE = Path(__file__).resolve().parent / "bench_questions.json"
+
+
+def normalize(text):
+    return " ".join(text.split()).casefold()
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q / 100 * len(samples)))]
+
+
+def run(retriever, questions, k, threshold, repeat):
+    """
+    Returns recall@k (share of questions whose expected passage is in the results), the
+    average number of chunks returned and the p50/p95 latency in ms.
+    """
+    found = 0
+    returned = 0
+    latencies = []
+    for item in questions:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results = retriever.retrieve(item["question"], k, threshold)
+            latencies.append((time.perf_counter() - start) * 1000)
+        expected = normalize(item["expected"])
+        found += any(expected in normalize(doc.page_content) for doc, _ in results)
+        returned += len(results)
+    return found / len(questions), returned / len(questions), percentile(latencies, 50), percentile(latencies, 95)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Compare recall and latency of dense and hybrid retrieval.")
+    parser.add_argument("--questions", default=str(QUESTIONS_FILE), help="JSON list of {question, expected} items")
+    parser.add_argument("--k", type=int, nargs="+", default=[3, 5, 10])
+    parser.add_argument("--modes", nargs="+", default=["dense", "hybrid"])
+    parser.add_argument("--threshold", type=float, default=float(os.environ.get("RAG_DIST_THRESHOLD") or 0.8))
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per question")
+    args = parser.parse_args()
+
+    data_dir = BASE_DIR / (os.environ.get("DATA_DIR") or "docs")
+    index_dir = BASE_DIR / (os.environ.get("INDEX_DIR") or "rag/faiss_index")
+    index_dir.mkdir(parents=True, exist_ok=True)
+    ingest_documents(data_dir, index_dir)
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        questions = json.load(f)
+
+    index_type = load_index_meta(index_dir)["index_type"]
+    print(f"\n{len(questions)} questions, {index_type} index, distance threshold {args.threshold}, caches disabled\n")
+    print(f"{'mode':<8}{'k':>4}{'recall@k':>10}{'chunks':>8}{'p50 ms':>9}{'p95 ms':>9}")
+    for mode in args.modes:
+        retriever = Retriever(index_dir, cache_size=0, mode=mode)
+        retriever.retrieve("warm up", 1, args.threshold)
+        for k in args.k:
+            recall, chunks, p50, p95 = run(retriever, questions, k, args.threshold, args.repeat)
+            print(f"{mode:<8}{k:>4}{recall:>10.2f}{chunks:>8.1f}{p50:>9.2f}{p95:>9.2f}")
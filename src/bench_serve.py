@@ -0,0 +1,116 @@
+import os
+import re
+import sys
+import json
+import time
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from dotenv import load_dotenv
+from bench_retrieval import QUESTIONS_FILE, percentile
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+SRC_DIR = Path(__file__).resolve().parent
+
+BUILD = """
+import sys
+from index_versions import migrate, build_version
+migrate(sys.argv[2])
+build_version(sys.argv[1], sys.argv[2])
+"""
+
+
+def memory_kb(pid):
+    # Rss counts shared pages (mapped index, libraries) in every process, Pss splits them
+    with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+        fields = dict(re.findall(r"^(\w+):\s+(\d+) kB", f.read(), re.M))
+    return int(fields["Rss"]), int(fields["Pss"])
+
+
+def start_serving(workers, port, env):
+    process = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--port", str(port)],
+        cwd=SRC_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+    pids = [int(process.stdout.readline().split("(pid ")[1].split(")")[0]) for _ in range(workers)]
+    # keep draining the workers' output so they never block on a full pipe
+    threading.Thread(target=process.stdout.read, daemon=True).start()
+    ports = [port + i for i in range(workers)]
+    deadline = time.monotonic() + 600
+    for p in ports:
+        wait_ready(p, deadline)
+    return process, pids, ports
+
+
+def wait_ready(port, deadline):
+    while True:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/readyz", timeout=5).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Worker on port {port} did not get ready.")
+        time.sleep(0.5)
+
+
+def run_load(ports, questions, requests, concurrency):
+    clients = {port: httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=120) for port in ports}
+
+    def ask(i):
+        # distinct text per request, so no worker answers from its retrieval caches
+        body = {"message": f"{questions[i % len(questions)]} #{i}", "session_id": f"bench-{i % concurrency}"}
+        start = time.perf_counter()
+        clients[ports[i % len(ports)]].post("/api/chat", json=body).raise_for_status()
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = list(pool.map(ask, range(requests)))
+    elapsed = time.perf_counter() - start
+    for client in clients.values():
+        client.close()
+    return requests / elapsed, percentile(latencies, 50), percentile(latencies, 95)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Throughput and memory of serve.py with different worker counts.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--port", type=int, default=7900)
+    parser.add_argument("--questions", default=str(QUESTIONS_FILE), help="JSON list of {question, expected} items")
+    args = parser.parse_args()
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        questions = [item["question"] for item in json.load(f)]
+    workdir = Path(tempfile.mkdtemp(prefix="faq-serve-"))
+    env = {
+        **os.environ,
+        "DATA_DIR": str(BASE_DIR / (os.environ.get("DATA_DIR") or "docs")),
+        "RAG_DIR": str(workdir),
+        "INDEX_DIR": str(workdir / "index"),
+        "RAG_DIST_THRESHOLD": os.environ.get("RAG_DIST_THRESHOLD") or "0.8",
+        "LLM_PROVIDER": "stub",
+        "PREBUILT_INDEX": "true",
+    }
+    # one index version, shared by every run
+    subprocess.run([sys.executable, "-c", BUILD, env["DATA_DIR"], env["INDEX_DIR"]], cwd=SRC_DIR, env=env, check=True)
+
+    print(f"{'workers':<9}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'RSS MB':>9}{'PSS MB':>9}")
+    for workers in args.workers:
+        process, pids, ports = start_serving(workers, args.port, env)
+        try:
+            throughput, p50, p95 = run_load(ports, questions, args.requests, args.concurrency)
+            rss, pss = (sum(values) / 1024 for values in zip(*(memory_kb(pid) for pid in pids)))
+            print(f"{workers:<9}{throughput:>8.1f}{p50:>9.1f}{p95:>9.1f}{rss:>9.0f}{pss:>9.0f}")
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=30)
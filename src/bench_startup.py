@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from statistics import median
+from dotenv import load_dotenv
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+SRC_DIR = Path(__file__).resolve().parent
+
+# runs in a fresh interpreter, like a real (re)start of app.py without the web server
+CHILD = """
+import sys, time, json
+start = time.perf_counter()
+if sys.argv[1] == "fake":
+    import doc_retrieve
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    doc_retrieve._embeddings = DeterministicFakeEmbedding(size=384)
+    start = time.perf_counter()
+import app
+imported = time.perf_counter()
+from startup import Readiness, start_background, prebuilt_index
+readiness = Readiness()
+start_background(readiness, app.DATA_DIR, app.INDEX_DIR, prebuilt=prebuilt_index(), warm_up_llm=app.warm_up)
+import gradio
+ui_imported = time.perf_counter()
+readiness.wait()
+serving = time.perf_counter()
+timings = readiness.status()["timings"]
+print(json.dumps({
+    "import_app": imported - start,
+    "import_gradio": ui_imported - imported,
+    "time_to_ready": imported - start + timings.pop("time_to_ready"),
+    "time_to_serve": serving - start,
+    "phases": {phase: seconds for phase, seconds in timings.items() if phase != "starting"},
+}))
+"""
+
+SCENARIOS = {
+    # empty index dir: the first turn needs a full ingest
+    "cold": {},
+    # index from the previous run, PDFs checked for changes in the background
+    "restart": {},
+    # PREBUILT_INDEX=true: no ingest at all
+    "prebuilt": {"PREBUILT_INDEX": "true"},
+}
+
+
+def run_child(env, fake_embeddings):
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, "fake" if fake_embeddings else "real"],
+        cwd=SRC_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    wall = time.perf_counter() - start
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["process_to_ready"] = wall
+    return result
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Measure app import time and time-to-ready after a (re)start.")
+    parser.add_argument("--runs", type=int, default=3, help="restarts per scenario (cold always runs once)")
+    parser.add_argument("--fake-embeddings", action="store_true",
+                        help="use deterministic fake embeddings (no model load; checks the harness only)")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="faq-startup-"))
+    (workdir / "index").mkdir()
+    env = {
+        **os.environ,
+        "DATA_DIR": str(BASE_DIR / (os.environ.get("DATA_DIR") or "docs")),
+        "RAG_DIR": str(workdir),
+        "INDEX_DIR": str(workdir / "index"),
+        "RAG_DIST_THRESHOLD": os.environ.get("RAG_DIST_THRESHOLD") or "0.8",
+        "LLM_PROVIDER": "stub",
+    }
+
+    # ready: index and embedding model loaded; serve: ready and the UI imported (in parallel)
+    print(f"{'scenario':<10}{'import app':>12}{'import ui':>11}{'ready':>8}{'serve':>8}{'process':>10}   background phases (s)")
+    for name, overrides in SCENARIOS.items():
+        runs = [run_child({**env, **overrides}, args.fake_embeddings) for _ in range(1 if name == "cold" else args.runs)]
+        phases = {phase: median(r["phases"][phase] for r in runs) for phase in runs[0]["phases"]}
+        print(
+            f"{name:<10}"
+            f"{median(r['import_app'] for r in runs):>12.2f}"
+            f"{median(r['import_gradio'] for r in runs):>11.2f}"
+            f"{median(r['time_to_ready'] for r in runs):>8.2f}"
+            f"{median(r['time_to_serve'] for r in runs):>8.2f}"
+            f"{median(r['process_to_ready'] for r in runs):>10.2f}   "
+            + ", ".join(f"{phase} {seconds:.2f}" for phase, seconds in phases.items())
+        )
@@ -0,0 +1,222 @@
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from search_stub import SearchStubServer
+from bench_retrieval import normalize, percentile, QUESTIONS_FILE
+from log_sink import read_records
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+STAGES = ("ingest", "retrieval", "context", "first_token", "generation", "end_to_end")
+
+
+def summarize(samples):
+    # latencies in ms
+    if not samples:
+        return None
+    return {
+        "count": len(samples),
+        "mean": sum(samples) / len(samples),
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "p99": percentile(samples, 99),
+    }
+
+
+def peak_memory_mb():
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_questions(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_replay(path):
+    """
+    Questions from a chat log in any LOG_FORMAT (text, jsonl or msgpack, rotated backups
+    too): every record with a "query" or "question" field, plus "expected" if present.
+    """
+    questions = []
+    for record in read_records(path):
+        question = record.get("query") or record.get("question")
+        if question:
+            questions.append({"question": question, "expected": record.get("expected")})
+    return questions
+
+
+def timed_ms(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def run_chat(app, question, session_id):
+    """
+    Runs one chat turn through app.chat_fn. Returns (end to end ms, first token ms).
+    """
+    request = SimpleNamespace(session_hash=session_id)
+    start = time.perf_counter()
+    first_token = None
+    for _ in app.chat_fn(question, [], request):
+        if first_token is None:
+            first_token = (time.perf_counter() - start) * 1000
+    return (time.perf_counter() - start) * 1000, first_token
+
+
+def run_benchmark(app, questions, sessions, data_dir, index_dir):
+    from doc_ingest import ingest_documents
+    from doc_retrieve import get_retriever
+    from context_builder import build_rag_context
+    from llm_provider import get_llm, stream_text
+
+    samples = {stage: [] for stage in STAGES}
+    _, elapsed = timed_ms(ingest_documents, data_dir, index_dir, True)
+    samples["ingest"].append(elapsed)
+
+    retriever = get_retriever(index_dir)
+    threshold = float(app.RAG_DIST_THRESHOLD)
+    retriever.retrieve_with_best("warm up", app.RAG_TOP_K, threshold)
+
+    found = labeled = 0
+    llm = get_llm()
+    for item in questions:
+        (results, _), elapsed = timed_ms(retriever.retrieve_with_best, item["question"], app.RAG_TOP_K, threshold)
+        samples["retrieval"].append(elapsed)
+        docs = [doc for doc, _ in results]
+        (context, _), elapsed = timed_ms(build_rag_context, docs, app.CONTEXT_TOKEN_BUDGET)
+        samples["context"].append(elapsed)
+        if item.get("expected"):
+            labeled += 1
+            expected = normalize(item["expected"])
+            found += any(expected in normalize(doc.page_content) for doc in docs)
+
+        messages = app.build_messages(item["question"], "", context)
+        start = time.perf_counter()
+        for i, _ in enumerate(stream_text(llm, messages)):
+            if i == 0:
+                samples["first_token"].append((time.perf_counter() - start) * 1000)
+        samples["generation"].append((time.perf_counter() - start) * 1000)
+
+    # whole turns through chat_fn, sessions at a time
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        turns = executor.map(
+            lambda job: run_chat(app, job[1]["question"], f"bench-{job[0]}"),
+            [(s, item) for s in range(sessions) for item in questions],
+        )
+        samples["end_to_end"] = [total for total, _ in turns]
+    wall = time.perf_counter() - start
+    app.summary_worker.stop()
+
+    return {
+        "questions": len(questions),
+        "sessions": sessions,
+        "stages": {stage: summarize(values) for stage, values in samples.items()},
+        "throughput_qps": len(samples["end_to_end"]) / wall if wall else None,
+        "peak_memory_mb": peak_memory_mb(),
+        "recall_at_k": found / labeled if labeled else None,
+        "k": app.RAG_TOP_K,
+        "retriever": retriever.stats()["mode"],
+    }
+
+
+def check_gates(results, baseline, max_recall_drop=0.0, max_slowdown=0.25, min_slack_ms=1.0):
+    """
+    Compares results with a baseline run. Returns the list of failed gates: recall@k
+    lower than the baseline by more than max_recall_drop, or a stage p95 slower than the
+    baseline by more than max_slowdown (a fraction) and min_slack_ms, so sub-millisecond
+    stages do not fail on noise.
+    """
+    failures = []
+    if baseline.get("recall_at_k") is not None and results.get("recall_at_k") is not None:
+        if results["recall_at_k"] < baseline["recall_at_k"] - max_recall_drop:
+            failures.append(f"recall@k dropped from {baseline['recall_at_k']:.2f} to {results['recall_at_k']:.2f}")
+    for stage, stats in baseline.get("stages", {}).items():
+        current = results.get("stages", {}).get(stage)
+        if not stats or not current:
+            continue
+        if current["p95"] > max(stats["p95"] * (1 + max_slowdown), stats["p95"] + min_slack_ms):
+            failures.append(f"{stage} p95 went from {stats['p95']:.1f} ms to {current['p95']:.1f} ms")
+    return failures
+
+
+def print_results(results):
+    print(f"\n{results['questions']} questions, {results['sessions']} concurrent sessions, {results['retriever']} retrieval, k={results['k']}\n")
+    print(f"{'stage':<12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'count':>7}")
+    for stage, stats in results["stages"].items():
+        if stats:
+            print(f"{stage:<12}{stats['p50']:>10.2f}{stats['p95']:>10.2f}{stats['p99']:>10.2f}{stats['count']:>7}")
+    recall = results["recall_at_k"]
+    print(f"\nthroughput: {results['throughput_qps']:.1f} questions/s")
+    print(f"peak memory: {results['peak_memory_mb']:.0f} MB")
+    print(f"recall@{results['k']}: {recall:.2f}" if recall is not None else "recall@k: no labeled questions")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, retrieval and generation with a stub LLM and stub search.")
+    parser.add_argument("--questions", default=str(QUESTIONS_FILE), help="JSON list of {question, expected} items")
+    parser.add_argument("--replay", action="append", default=[], help="chat log to replay, e.g. rag/rag_test.jsonl (repeatable)")
+    parser.add_argument("--sessions", type=int, default=4, help="concurrent chat sessions")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to gate against")
+    parser.add_argument("--max-recall-drop", type=float, default=0.0)
+    parser.add_argument("--max-slowdown", type=float, default=0.25, help="allowed p95 increase per stage, as a fraction")
+    parser.add_argument("--min-slack-ms", type=float, default=1.0, help="p95 increase always allowed, in ms")
+    parser.add_argument("--output", help="write the results JSON here (e.g. to use as the next baseline)")
+    parser.add_argument("--fake-embeddings", action="store_true",
+                        help="use deterministic fake embeddings (checks the harness only; recall is meaningless)")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="faq-bench-"))
+    (workdir / "index").mkdir()
+    data_dir = BASE_DIR / (os.environ.get("DATA_DIR") or "docs")
+    stub = SearchStubServer().start()
+    # everything the app talks to is local and deterministic
+    os.environ.update({
+        "DATA_DIR": str(data_dir),
+        "RAG_DIR": str(workdir),
+        "INDEX_DIR": str(workdir / "index"),
+        "LLM_PROVIDER": "stub",
+        "GOOGLE_SEARCH_URL": stub.url,
+        "SERPAPI_SEARCH_URL": stub.url,
+        "RETRIEVAL_CACHE_SIZE": "0",
+        "ANSWER_CACHE_ENABLED": "false",
+    })
+    for name in ("GOOGLE_API_KEY", "GOOGLE_CSE_ID", "SERP_API_KEY", "OPENAI_API_KEY"):
+        os.environ.setdefault(name, "stub")
+    os.environ.setdefault("RAG_DIST_THRESHOLD", "0.8")
+
+    if args.fake_embeddings:
+        import doc_retrieve
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        doc_retrieve._embeddings = DeterministicFakeEmbedding(size=384)
+    import app
+
+    questions = load_questions(args.questions)
+    for path in args.replay:
+        questions += load_replay(path)
+    try:
+        results = run_benchmark(app, questions, args.sessions, data_dir, workdir / "index")
+    finally:
+        stub.stop()
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            failures = check_gates(results, json.load(f), args.max_recall_drop, args.max_slowdown, args.min_slack_ms)
+        for failure in failures:
+            print(f"REGRESSION: {failure}")
+        sys.exit(1 if failures else 0)
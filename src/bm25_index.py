@@ -0,0 +1,166 @@
+import os
+import re
+from collections import Counter
+import numpy as np
+
+
+LEXICAL_INDEX_FILE = "bm25.npz"
+
+# keeps clause numbers ("1.2"), part names ("b1") and hyphenated terms ("cooling-off") whole
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-'][a-z0-9]+)*")
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have how i if in is it its me my
+of on or our shall that the their this to us was we what when where which who will
+with you your
+""".split())
+
+
+def tokenize(text):
+    """
+    Lowercased word tokens without stopwords. Compound tokens are also split into their
+    parts, so "cooling-off" matches both "cooling-off" and "cooling off".
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[.\-']", token) if part and part not in STOPWORDS)
+    return tokens
+
+
+def _pack_strings(strings):
+    # newline separated utf-8, so the file loads without pickle
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def _unpack_strings(array):
+    text = array.tobytes().decode("utf-8")
+    return text.split("\n") if text else []
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the chunks of one FAISS index.
+
+    Postings are stored as CSR arrays: the documents of term t are
+    doc_indices[offsets[t]:offsets[t + 1]] with their term frequencies in tfs. Document
+    indices follow the FAISS order, doc_ids maps them to docstore ids.
+    """
+
+    def __init__(self, terms, doc_ids, doc_lengths, offsets, doc_indices, tfs, k1=1.5, b=0.75):
+        self.terms = {term: i for i, term in enumerate(terms)}
+        self.doc_ids = list(doc_ids)
+        self.doc_lengths = doc_lengths
+        self.offsets = offsets
+        self.doc_indices = doc_indices
+        self.tfs = tfs
+        self.k1 = k1
+        self.b = b
+
+        n_docs = len(self.doc_ids)
+        doc_freqs = np.diff(offsets)
+        self.idf = np.log1p((n_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        avg_length = float(doc_lengths.mean()) if n_docs else 0.0
+        self._length_norm = (k1 * (1 - b + b * doc_lengths / (avg_length or 1.0))).astype(np.float32)
+
+    @classmethod
+    def build(cls, doc_ids, texts, k1=1.5, b=0.75):
+        terms = {}
+        term_ids, doc_indices, tfs = [], [], []
+        doc_lengths = np.zeros(len(doc_ids), dtype=np.int32)
+        for i, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths[i] = sum(counts.values())
+            for term, tf in counts.items():
+                term_ids.append(terms.setdefault(term, len(terms)))
+                doc_indices.append(i)
+                tfs.append(tf)
+
+        term_ids = np.asarray(term_ids, dtype=np.int32)
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(terms)), out=offsets[1:])
+        return cls(
+            list(terms),
+            doc_ids,
+            doc_lengths,
+            offsets,
+            np.asarray(doc_indices, dtype=np.int32)[order],
+            np.asarray(tfs, dtype=np.uint16)[order],
+            k1,
+            b,
+        )
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore):
+        doc_ids = [vectorstore.index_to_docstore_id[i] for i in range(len(vectorstore.index_to_docstore_id))]
+        return cls.build(doc_ids, [vectorstore.docstore.search(id_).page_content for id_ in doc_ids])
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            terms=_pack_strings(self.terms),
+            doc_ids=_pack_strings(self.doc_ids),
+            doc_lengths=self.doc_lengths,
+            offsets=self.offsets,
+            doc_indices=self.doc_indices,
+            tfs=self.tfs,
+            params=np.array([self.k1, self.b]),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            k1, b = data["params"]
+            return cls(
+                _unpack_strings(data["terms"]),
+                _unpack_strings(data["doc_ids"]),
+                data["doc_lengths"],
+                data["offsets"],
+                data["doc_indices"],
+                data["tfs"],
+                float(k1),
+                float(b),
+            )
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def search(self, query, k):
+        """
+        Returns up to k (docstore id, score) pairs, best first. Chunks sharing no term
+        with the query are never returned.
+        """
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        if k <= 0:
+            return []
+        for term in set(tokenize(query)):
+            t = self.terms.get(term)
+            if t is None:
+                continue
+            start, end = self.offsets[t], self.offsets[t + 1]
+            docs = self.doc_indices[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            scores[docs] += self.idf[t] * tf * (self.k1 + 1) / (tf + self._length_norm[docs])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(self.doc_ids[i], float(scores[i])) for i in matched]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuses ranked lists of ids: every id scores sum(1 / (k + rank)) over the lists it
+    appears in. Returns (id, score) pairs, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking, start=1):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
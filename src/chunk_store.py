@@ -0,0 +1,125 @@
+import os
+import json
+from collections.abc import Mapping
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore
+
+
+CHUNK_FILES = ("chunks.bin", "chunks.npz")
+
+
+class ChunkIds(Mapping):
+    """
+    FAISS position -> docstore id, read from the ids column instead of a dict of strings.
+    """
+
+    def __init__(self, ids):
+        self._ids = ids
+
+    def __getitem__(self, position):
+        if not 0 <= position < len(self._ids):
+            raise KeyError(position)
+        return self._ids[position].decode("utf-8")
+
+    def __iter__(self):
+        return iter(range(len(self._ids)))
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class ChunkStore(Docstore):
+    """
+    Read-only docstore over the files written by write_chunk_store.
+
+    chunks.bin holds the utf-8 texts of all chunks back to back, in FAISS order, and is
+    memory-mapped. chunks.npz holds the offset table, the ids (with a sorted order for
+    lookups) and the metadata as dictionary-encoded columns. Documents are only built for
+    the chunks that are looked up.
+    """
+
+    def __init__(self, directory):
+        texts_path, table_path = (os.path.join(directory, name) for name in CHUNK_FILES)
+        size = os.path.getsize(texts_path)
+        self._texts = np.memmap(texts_path, dtype=np.uint8, mode="r") if size else np.empty(0, dtype=np.uint8)
+        with np.load(table_path, allow_pickle=False) as table:
+            self.offsets = table["offsets"]
+            self.ids = table["ids"]
+            self.id_order = table["id_order"]
+            self.codes = table["codes"]
+            columns = json.loads(table["columns"].tobytes().decode("utf-8"))
+        self.keys = columns["keys"]
+        self.values = columns["values"]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def index_to_docstore_id(self):
+        return ChunkIds(self.ids)
+
+    def row_of(self, id_):
+        key = id_.encode("utf-8")
+        i = np.searchsorted(self.ids, key, sorter=self.id_order)
+        if i < len(self.ids) and self.ids[self.id_order[i]] == key:
+            return int(self.id_order[i])
+        return None
+
+    def document(self, row):
+        text = self._texts[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+        metadata = {
+            key: self.values[col][code]
+            for col, (key, code) in enumerate(zip(self.keys, self.codes[row]))
+            if code >= 0
+        }
+        return Document(id=self.ids[row].decode("utf-8"), page_content=text, metadata=metadata)
+
+    def search(self, search):
+        row = self.row_of(search)
+        if row is None:
+            return f"ID {search} not found."
+        return self.document(row)
+
+    def documents(self):
+        for row in range(len(self)):
+            yield self.document(row)
+
+
+def write_chunk_store(directory, docs):
+    """
+    Writes the documents (in FAISS order, each with its id set) as chunks.bin and
+    chunks.npz in directory.
+    """
+    texts = [doc.page_content.encode("utf-8") for doc in docs]
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in texts], out=offsets[1:])
+    ids = np.array([doc.id.encode("utf-8") for doc in docs], dtype=bytes)
+
+    keys = sorted({key for doc in docs for key in doc.metadata})
+    values = [[] for _ in keys]
+    lookup = [{} for _ in keys]
+    codes = np.full((len(docs), len(keys)), -1, dtype=np.int32)
+    for row, doc in enumerate(docs):
+        for col, key in enumerate(keys):
+            if key not in doc.metadata:
+                continue
+            value = doc.metadata[key]
+            value_key = json.dumps(value, sort_keys=True)
+            code = lookup[col].get(value_key)
+            if code is None:
+                code = lookup[col][value_key] = len(values[col])
+                values[col].append(value)
+            codes[row, col] = code
+
+    with open(os.path.join(directory, CHUNK_FILES[0]), "wb") as f:
+        for text in texts:
+            f.write(text)
+    columns = json.dumps({"keys": keys, "values": values}, ensure_ascii=False).encode("utf-8")
+    np.savez(
+        os.path.join(directory, CHUNK_FILES[1]),
+        offsets=offsets,
+        ids=ids,
+        id_order=np.argsort(ids, kind="stable").astype(np.int64),
+        codes=codes,
+        columns=np.frombuffer(columns, dtype=np.uint8),
+    )
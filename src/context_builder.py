@@ -0,0 +1,124 @@
+import re
+import logging
+from langchain_core.documents import Document
+
+
+CHUNK_SEPARATOR = f"\n{'-'*80}\n"
+TITLE_PREFIX = re.compile(r"^\[[^\]\n]*\]\n")
+SECTION_KEYS = ("source", "level1_title", "level2_title", "level3_title")
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English text, good enough for budgeting
+    return (len(text) + 3) // 4
+
+
+def split_title(text):
+    # chunks carry a "[level1 | level2 | level3]" prefix from sliding_chunk_with_metadata_delimiter
+    match = TITLE_PREFIX.match(text)
+    return (match.group(0), text[match.end():]) if match else ("", text)
+
+
+def section_of(doc):
+    return tuple(doc.metadata.get(key) for key in SECTION_KEYS)
+
+
+def overlap_length(head, tail, min_overlap=20):
+    """
+    Length of the longest suffix of head that is also a prefix of tail (0 if shorter
+    than min_overlap).
+    """
+    if len(tail) < min_overlap:
+        return 0
+    probe = tail[:min_overlap]
+    start = head.find(probe, max(0, len(head) - len(tail)))
+    while start != -1:
+        if tail.startswith(head[start:]):
+            return len(head) - start
+        start = head.find(probe, start + 1)
+    return 0
+
+
+def join_bodies(head, tail, adjacent, min_overlap=20):
+    """
+    Joins two chunk bodies of one section, head first: drops containment and the sliding
+    window overlap. Neighbouring windows that do not overlap (the split fell on a
+    separator) are joined as running text, chunks further apart on a new line.
+    """
+    if tail in head:
+        return head
+    if head in tail:
+        return tail
+    overlap = overlap_length(head, tail, min_overlap)
+    if overlap:
+        return head + tail[overlap:]
+    if adjacent:
+        # the splitter keeps a separator at the start of the next chunk
+        return head + ("" if tail[:1] in ".!?:" else " ") + tail
+    return head + "\n" + tail
+
+
+def merge_section_chunks(docs, min_overlap=20):
+    """
+    Drops exact duplicates and merges all chunks of one section into a single chunk with
+    one title prefix, in reading order (chunk_index). Keeps the position of the best
+    ranked chunk of every section. Chunks without chunk_index (indexes built before it
+    was recorded) follow in rank order, joined where their windows overlap.
+    """
+    groups = {}
+    seen = set()
+    for doc in docs:
+        if doc.page_content in seen:
+            continue
+        seen.add(doc.page_content)
+        prefix, body = split_title(doc.page_content)
+        groups.setdefault((section_of(doc), prefix), []).append((doc.metadata.get("chunk_index"), body, doc))
+
+    merged = []
+    for (_, prefix), chunks in groups.items():
+        indexed = sorted(((position, body) for position, body, _ in chunks if position is not None), key=lambda chunk: chunk[0])
+        pieces = []
+        if indexed:
+            body = indexed[0][1]
+            for (previous, _), (position, next_body) in zip(indexed, indexed[1:]):
+                body = join_bodies(body, next_body, position == previous + 1, min_overlap)
+            pieces.append(body)
+        for body in (body for position, body, _ in chunks if position is None):
+            for i, piece in enumerate(pieces):
+                after = overlap_length(piece, body, min_overlap)
+                before = overlap_length(body, piece, min_overlap) if not after else 0
+                if body in piece or piece in body or after or before:
+                    pieces[i] = join_bodies(piece, body, False, min_overlap) if not before else body + piece[before:]
+                    break
+            else:
+                pieces.append(body)
+        best = chunks[0][2]
+        merged.append(Document(id=best.id, page_content=prefix + "\n".join(pieces), metadata=best.metadata))
+    return merged
+
+
+def build_rag_context(docs, token_budget=1500, separator=CHUNK_SEPARATOR):
+    """
+    Builds the FAQ context from retrieved chunks ordered best first: overlapping and
+    duplicate chunks are merged, then chunks are packed in rank order until token_budget
+    (estimated tokens) is used up. Returns the context string and the chunks it contains.
+    """
+    if not docs:
+        return "", []
+    naive_tokens = estimate_tokens(separator.join(doc.page_content for doc in docs))
+
+    packed = []
+    used = 0
+    separator_tokens = estimate_tokens(separator)
+    for doc in merge_section_chunks(docs):
+        cost = estimate_tokens(doc.page_content) + (separator_tokens if packed else 0)
+        if used + cost > token_budget and packed:
+            # a smaller, lower ranked chunk may still fit
+            continue
+        packed.append(doc)
+        used += cost
+
+    context = separator.join(doc.page_content for doc in packed)
+    saved = naive_tokens - estimate_tokens(context)
+    logging.info("Context builder: %d chunks -> %d, ~%d tokens, ~%d prompt tokens saved", len(docs), len(packed), estimate_tokens(context), saved)
+    return context, packed
@@ -1,12 +1,26 @@
 import os
 import re
+import json
+import hashlib
 import shutil
+import faiss
+from concurrent.futures import ProcessPoolExecutor
 from langchain_core.documents import Document
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
-        
+from doc_retrieve import get_embeddings, load_vectorstore, EMBEDDING_MODEL_NAME, INDEX_FILES
+from embedding_cache import EmbeddingCache
+from bm25_index import BM25Index, LEXICAL_INDEX_FILE
+from chunk_store import write_chunk_store
+from embedding_backend import EMBEDDING_META_FILE, describe_embeddings, save_embedding_meta
+from ann_index import INDEX_META_FILE, create_index, index_type_from_env, load_index_meta, save_index_meta
+
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+EMBEDDING_CACHE_DIR = "embedding_cache"
 
 
 def get_env_variable(var_name):
@@ -16,18 +30,79 @@ def get_env_variable(var_name):
     return value
 
 
+# line noise, compiled once; applied line by line so pages can be streamed
+URL_PATTERN = re.compile(r'https?://\S+')
+PAGE_NUMBER_PATTERN = re.compile(r'\s*\d+\s*/\d+')
+NOISE_PATTERN = re.compile(
+    # time stamps i.e. 12/31/2023, 10:30 AM
+    r'\d{1,2}/\d{1,2}/\d{2,4},\s*\d{1,2}:\d{2}\s*(?:AM|PM)?'
+    # verbose copyright notices
+    r'|(?i:Carro Malaysia Terms of Use)'
+)
+
+# the two halves of a time stamp split across lines
+DATE_AT_END_PATTERN = re.compile(r'\d{1,2}/\d{1,2}/\d{2,4},\s*$')
+TIME_PATTERN = re.compile(r'\s*\d{1,2}:\d{2}\s*(?:AM|PM)?')
+
+TITLE_PUNCTUATION = re.compile(r"[,.:;?!]")
+LEVEL2_PATTERN = re.compile(r"PART\s+[A-Z0-9]+:")
+LEVEL3_PATTERN = re.compile(r"(?:\d+|[a-zA-Z])\.\s")
+PART_LINE_PATTERN = re.compile(r"\d+\.\s*Part\s+[A-Z0-9]+")
+
+TOC_START, PART_LINE, LEVEL1, LEVEL2, LEVEL3, TEXT = range(6)
+
+
+def clean_line(line):
+    # None for a page number line
+    # every pattern but the copyright notice needs a "/"
+    if "/" in line:
+        line = URL_PATTERN.sub("", line)
+        if PAGE_NUMBER_PATTERN.fullmatch(line):
+            return None
+        line = NOISE_PATTERN.sub("", line)
+    elif "terms of use" in line.lower():
+        line = NOISE_PATTERN.sub("", line)
+    return line
+
+
+def clean_lines(pages):
+    """
+    Yields the stripped, non-empty lines of the pages with URLs, page numbers (i.e. 1/10),
+    time stamps and copyright notices removed.
+
+    A time stamp broken after the date ("12/31/2023," at the end of a line or page and
+    "10:30 AM" on the next one) is removed too: the date is carried over to the next
+    non-empty line, and if that line starts with the time both halves are dropped and
+    the rest joined into one line.
+    """
+    carried = None
+    for page in pages:
+        for line in page.split("\n"):
+            line = clean_line(line)
+            if line is None or (carried is not None and not line.strip()):
+                continue
+            if carried is not None:
+                head, date = carried
+                carried = None
+                time = TIME_PATTERN.match(line)
+                if time:
+                    # the line break was part of the time stamp
+                    line = head + line[time.end():]
+                elif (head + date).strip():
+                    yield (head + date).strip()
+            date = DATE_AT_END_PATTERN.search(line)
+            if date:
+                carried = (line[:date.start()], date.group(0))
+                continue
+            line = line.strip()
+            if line:
+                yield line
+    if carried is not None and "".join(carried).strip():
+        yield "".join(carried).strip()
+
+
 def clean_text(text):
-    # remove URL 
-    text = re.sub(r'https?://\S+', '', text)
-    # remove page number i.e. 1/10
-    text = re.sub(r'^\s*\d+\s*\/\d+$', '', text, flags=re.MULTILINE)
-    # remove time stamps i.e. 12/31/2023, 10:30 AM
-    text = re.sub(r'\d{1,2}/\d{1,2}/\d{2,4},\s*\d{1,2}:\d{2}\s*(AM|PM)?', '', text)
-    # remove verbose copyright notices
-    text = re.sub(r'Carro Malaysia Terms of Use', '', text, flags=re.IGNORECASE)
-    # remove excessive empty lines
-    text = re.sub(r'\n\s*\n', '\n', text)
-    return text.strip()
+    return "\n".join(clean_lines([text]))
 
 
 def is_level1_title(line):
@@ -35,7 +110,7 @@ def is_level1_title(line):
     line = line.strip()
     if len(line) < 4 or len(line) > 60:
         return False
-    if re.search(r"[,.:;?!]", line):
+    if TITLE_PUNCTUATION.search(line):
         return False
     words = line.split()
     if len(words) >= 2:
@@ -46,149 +121,197 @@ def is_level1_title(line):
 
 def is_level2_title(line):
     # "PART A :", "PART B1 :"" ... in a single line
-    return bool(re.match(r"^PART\s+[A-Z0-9]+:$", line.strip()))
+    return bool(LEVEL2_PATTERN.fullmatch(line.strip()))
 
 def is_level3_title(line):
     # "1. " or "a. " in a single line
-    return bool(re.match(r"^\d+\.\s", line.strip()) or re.match(r"^[a-zA-Z]\.\s", line.strip()))
+    return bool(LEVEL3_PATTERN.match(line.strip()))
 
 def is_toc_start(line):
-    return "comprises of" in line.lower() or "table of contents" in line.lower()
+    lowered = line.lower()
+    return "comprises of" in lowered or "table of contents" in lowered
 
 def is_part_line(line):
-    return bool(re.match(r"^\d+\.\s*Part\s+[A-Z0-9]+[ :]?", line.strip()))
+    return bool(PART_LINE_PATTERN.match(line.strip()))
 
 
-def chunk_pdf_text_to_docs(text, min_chunk_len=60, min_merge_len=120):
-    lines = text.split('\n')
+def classify_line(line):
+    # line is already stripped; same precedence as the checks in chunk_lines
+    if is_toc_start(line):
+        return TOC_START
+    if is_level1_title(line):
+        return LEVEL1
+    if line.startswith("PART") and is_level2_title(line):
+        return LEVEL2
+    if is_level3_title(line):
+        return LEVEL3
+    return TEXT
+
+
+def chunk_lines(lines, min_chunk_len=60, min_merge_len=120):
+    """
+    Splits cleaned, stripped lines into structural chunks in one pass, yielding them as
+    soon as the next chunk shows they are complete. Short neighbouring chunks are merged.
+    """
     level1, level2, level3 = "", "", ""
     chunk_buffer = []
-    docs = []
+    chunk_len = 0
     toc_mode = False
     toc_buffer = []
 
     # title chunk without contents
     pending_title = {"level1": None, "level2": None, "level3": None}
 
+    def toc_doc():
+        return Document(page_content="\n".join(toc_buffer), metadata={"type": "toc", "level1_title": level1})
+
     def flush_chunk():
-        nonlocal chunk_buffer, level1, level2, level3, pending_title
-        chunk_text = " ".join(chunk_buffer).strip()
+        nonlocal chunk_buffer, chunk_len, pending_title
+        chunk_text = " ".join(chunk_buffer)
+        chunk_buffer = []
+        chunk_len = 0
         if len(chunk_text) >= min_chunk_len:
             meta = {
                 "level1_title": pending_title["level1"] or level1,
                 "level2_title": pending_title["level2"] or level2,
                 "level3_title": pending_title["level3"] or level3,
             }
-            docs.append(Document(page_content=chunk_text, metadata=meta))
             pending_title = {"level1": None, "level2": None, "level3": None}
-        chunk_buffer = []
-
-    for line in lines:
-        line = line.strip()
-
-        if is_toc_start(line):
-            toc_mode = True
-            toc_buffer = [line]
-            continue
-        if toc_mode:
-            if is_part_line(line):
-                toc_buffer.append(line)
+            return Document(page_content=chunk_text, metadata=meta)
+        return None
+
+    def structural_docs():
+        nonlocal level1, level2, level3, chunk_len, toc_mode, toc_buffer
+        for line in lines:
+            kind = classify_line(line)
+            if kind == TOC_START:
+                toc_mode = True
+                toc_buffer = [line]
                 continue
-            else:
-                # end of toc mode - generate toc chunk
+            if toc_mode:
+                if is_part_line(line):
+                    toc_buffer.append(line)
+                    continue
+                # end of toc mode - generate toc chunk, then process the line
                 if toc_buffer:
-                    docs.append(Document(
-                        page_content="\n".join(toc_buffer),
-                        metadata={"type": "toc", "level1_title": level1}
-                    ))
+                    yield toc_doc()
                     toc_buffer = []
                 toc_mode = False
-                # no return here, continue processing the next line
 
-
-        if is_level1_title(line):
-            flush_chunk()
-            if chunk_buffer:
-                level1, level2, level3 = line, "", ""
-            else:
+            if kind == LEVEL1:
+                doc = flush_chunk()
+                if doc:
+                    yield doc
                 pending_title["level1"] = line
                 level1, level2, level3 = line, "", ""
-        elif is_level2_title(line):
-            flush_chunk()
-            if chunk_buffer:
-                level2, level3 = line, ""
-            else:
+            elif kind == LEVEL2:
+                doc = flush_chunk()
+                if doc:
+                    yield doc
                 pending_title["level2"] = line
                 level2, level3 = line, ""
-        elif is_level3_title(line):
-            if len(" ".join(chunk_buffer).strip()) >= min_merge_len:
-                flush_chunk()
-            if chunk_buffer:
+            elif kind == LEVEL3:
+                if chunk_len >= min_merge_len:
+                    doc = flush_chunk()
+                    if doc:
+                        yield doc
+                if not chunk_buffer:
+                    pending_title["level3"] = line
                 level3 = line
             else:
-                pending_title["level3"] = line
-                level3 = line
-        else:
-            if line:
+                # running length of " ".join(chunk_buffer)
+                chunk_len += len(line) + (1 if chunk_buffer else 0)
                 chunk_buffer.append(line)
-    
-    flush_chunk()
-    if toc_mode and toc_buffer:
-        docs.append(Document(
-            page_content="\n".join(toc_buffer),
-            metadata={"type": "toc", "level1_title": level1}
-        ))
+
+        doc = flush_chunk()
+        if doc:
+            yield doc
+        if toc_mode and toc_buffer:
+            yield toc_doc()
 
     # merge short chunk
-    merged_docs = []
-    buffer = None
-    for doc in docs:
-        if buffer is None:
-            buffer = doc
-        elif len(buffer.page_content) < min_merge_len or len(doc.page_content) < min_merge_len:
-            buffer = Document(
-                page_content=buffer.page_content + " " + doc.page_content,
-                metadata=buffer.metadata
-            )
+    parts, metadata, merged_len = None, None, 0
+    for doc in structural_docs():
+        if parts is None:
+            parts, metadata, merged_len = [doc.page_content], doc.metadata, len(doc.page_content)
+        elif merged_len < min_merge_len or len(doc.page_content) < min_merge_len:
+            parts.append(doc.page_content)
+            merged_len += 1 + len(doc.page_content)
         else:
-            merged_docs.append(buffer)
-            buffer = doc
-    if buffer:
-        merged_docs.append(buffer)
-    return merged_docs
+            yield Document(page_content=" ".join(parts), metadata=metadata)
+            parts, metadata, merged_len = [doc.page_content], doc.metadata, len(doc.page_content)
+    if parts is not None:
+        yield Document(page_content=" ".join(parts), metadata=metadata)
+
 
-def read_pdf_file(file_path):
+def chunk_pdf_text_to_docs(text, min_chunk_len=60, min_merge_len=120):
+    return list(chunk_lines(clean_lines([text]), min_chunk_len, min_merge_len))
+
+
+def load_pdf_docs(pdf_path):
+    """
+    Loads a single PDF page by page, cleans it and splits it into structural chunks.
+    """
+    filename = os.path.basename(pdf_path)
+    pages = (page.page_content for page in PyPDFLoader(str(pdf_path)).lazy_load())
+    struc_docs = list(chunk_lines(clean_lines(pages)))
+    for doc in struc_docs:
+        doc.metadata["source"] = filename
+    return struc_docs
+
+
+def list_pdf_files(file_path):
+    return sorted(filename for filename in os.listdir(file_path) if filename.endswith(".pdf"))
+
+
+def _load_pdf_docs_safe(pdf_path):
+    # runs in a worker process - errors are returned so one bad file does not stop the run
+    try:
+        return load_pdf_docs(pdf_path), None
+    except Exception as e:
+        return [], f"{type(e).__name__}: {e}"
+
+
+def iter_pdf_docs(file_path, filenames=None, workers=1):
+    """
+    Yields (filename, docs, error) for each PDF in file name order.
+
+    With workers > 1 the files are parsed, cleaned and chunked in a process pool. Results
+    are still yielded in order, and only a bounded number of files is in flight at once.
+    """
+    filenames = list_pdf_files(file_path) if filenames is None else list(filenames)
+    paths = [os.path.join(file_path, filename) for filename in filenames]
+    if workers <= 1 or len(paths) <= 1:
+        for filename, path in zip(filenames, paths):
+            docs, error = _load_pdf_docs_safe(path)
+            yield filename, docs, error
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        next_path = 0
+        for i, filename in enumerate(filenames):
+            # keep up to 2 files per worker queued
+            while next_path < len(paths) and next_path < i + 2 * workers:
+                pending.append(executor.submit(_load_pdf_docs_safe, paths[next_path]))
+                next_path += 1
+            docs, error = pending.pop(0).result()
+            yield filename, docs, error
+
+
+def read_pdf_file(file_path, filenames=None, workers=1, failures=None):
+    """
+    Reads all PDFs into structural chunks. Files that fail to load are reported and skipped;
+    pass a list as failures to collect their (filename, error) pairs.
+    """
     all_docs = []
-    for filename in os.listdir(file_path):
-        if filename.endswith(".pdf"):
-            pdf_path = os.path.join(file_path, filename)
-            loader = PyPDFLoader(pdf_path)
-            docs = loader.load()
-            if not docs:
-                continue
-            
-            union_doc = docs[0] if docs else None
-            union_doc.metadata["filetype"] = 'pdf'
-            union_doc.metadata["source"] = filename
-            union_doc.page_content = "\n".join([doc.page_content for doc in docs])  # 合并内容
-            # print(union_doc.page_content[:3000])
-            
-            clean_text_content = clean_text(union_doc.page_content)
-            # print(clean_text_content[:3000])
-            
-            struc_docs = chunk_pdf_text_to_docs(clean_text_content)
-            # for i, doc in enumerate(struc_docs[:10], 1):
-            #     title_parts = [doc.metadata.get('level1_title'), doc.metadata.get('level2_title'), doc.metadata.get('level3_title')]
-            #     title = " | ".join([x for x in title_parts if x not in (None, "")])
-            #     content = f"[{title}]\n" + doc.page_content.replace('\n', ' ')
-            #     print(f"Chunk {i}")
-            #     print(f"  Level1: {doc.metadata.get('level1_title')}")
-            #     print(f"  Level2: {doc.metadata.get('level2_title')}")
-            #     print(f"  Level3: {doc.metadata.get('level3_title')}")
-            #     print(f"  Content ({len(doc.page_content)}): {content}...")
-            #     print("-" * 80)
-                
-            all_docs.extend(struc_docs)
+    for filename, docs, error in iter_pdf_docs(file_path, filenames, workers):
+        if error:
+            print(f"Failed to ingest {filename}: {error}")
+            if failures is not None:
+                failures.append((filename, error))
+            continue
+        all_docs.extend(docs)
 
     # print(f"Loaded {len(all_docs)} documents.")
     return all_docs
@@ -201,6 +324,9 @@ def sliding_chunk_with_metadata_delimiter(all_docs, chunk_size=500, chunk_overla
         separators=["\n\n", ".", "!", "?", "\n", ":"]
     )
     all_chunks = []
+    # chunk_index: position of the chunk in its source file, so the context builder can
+    # put chunks of a section back in reading order
+    positions = {}
     for doc in all_docs:
         # title prefix
         meta = dict(doc.metadata)
@@ -209,7 +335,9 @@ def sliding_chunk_with_metadata_delimiter(all_docs, chunk_size=500, chunk_overla
         # split section
         for split in text_splitter.split_text(doc.page_content):
             chunk_text = prefix + split
-            all_chunks.append(Document(page_content=chunk_text, metadata=meta))
+            position = positions.get(meta.get("source"), 0)
+            positions[meta.get("source")] = position + 1
+            all_chunks.append(Document(page_content=chunk_text, metadata={**meta, "chunk_index": position}))
     print(f"Split into {len(all_chunks)} chunks.")
     return all_chunks
 
@@ -225,34 +353,291 @@ def simple_chunk(all_docs, chunk_size=500, chunk_overlap=50):
     return split_docs
 
 
-def faiss_embed(all_docs, index_dir):
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def group_ids_by_source(split_docs, ids):
+    ids_by_source = {}
+    for id_, doc in zip(ids, split_docs):
+        ids_by_source.setdefault(doc.metadata.get("source", ""), []).append(id_)
+    return ids_by_source
+
+
+def chunk_ids(split_docs):
+    """
+    Content-addressed chunk ids: the same text from the same file always gets the same id,
+    so unchanged chunks keep their vectors across ingests.
+    """
+    ids = []
+    seen = {}
+    for doc in split_docs:
+        key = (doc.metadata.get("source", ""), doc.page_content)
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        raw = f"{key[0]}\0{occurrence}\0{key[1]}"
+        ids.append(hashlib.sha256(raw.encode("utf-8")).hexdigest())
+    return ids
+
+
+def load_manifest(index_dir):
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("embedding_model") != EMBEDDING_MODEL_NAME:
+        return None
+    return manifest
+
+
+def save_manifest(index_dir, files):
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "files": files,
+    }
+    tmp_path = os.path.join(index_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(index_dir, MANIFEST_FILE))
+
+
+def save_vectorstore(vectorstore, index_dir):
+    """
+    Saves into a staging folder first and moves the files into place, so a running
+    retriever never reads a half-written file. The BM25 index is rebuilt from the stored
+    chunks every time, so it always matches the FAISS index; index_meta.json records the
+    FAISS index type and parameters, embedding_meta.json the embedding model and its
+    vectors for a few probe texts (for the parity check when the index is loaded).
+    """
+    staging_dir = os.path.join(index_dir, f".staging-{os.getpid()}")
+    os.makedirs(staging_dir, exist_ok=True)
+    faiss.write_index(vectorstore.index, os.path.join(staging_dir, INDEX_FILES[0]))
+    ids = vectorstore.index_to_docstore_id
+    write_chunk_store(staging_dir, [vectorstore.docstore.search(ids[i]) for i in range(len(ids))])
+    BM25Index.from_vectorstore(vectorstore).save(os.path.join(staging_dir, LEXICAL_INDEX_FILE))
+    save_index_meta(os.path.join(staging_dir, INDEX_META_FILE), vectorstore.index)
+    save_embedding_meta(os.path.join(staging_dir, EMBEDDING_META_FILE), vectorstore.embedding_function, EMBEDDING_MODEL_NAME)
+    for name in INDEX_FILES + (LEXICAL_INDEX_FILE, INDEX_META_FILE, EMBEDDING_META_FILE):
+        os.replace(os.path.join(staging_dir, name), os.path.join(index_dir, name))
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    # pickled docstore of the old index format
+    if os.path.exists(os.path.join(index_dir, "index.pkl")):
+        os.remove(os.path.join(index_dir, "index.pkl"))
+
+
+def save_lexical_index(index_dir):
+    # for indexes built before the BM25 index existed
+    BM25Index.from_vectorstore(load_vectorstore(index_dir)).save(os.path.join(index_dir, LEXICAL_INDEX_FILE))
+
+
+def index_exists(index_dir):
+    return all(os.path.exists(os.path.join(index_dir, name)) for name in INDEX_FILES)
+
+
+def embed_batch_size():
+    return int(os.environ.get("EMBED_BATCH_SIZE") or 64)
+
+
+def open_embedding_cache(index_dir, embeddings):
+    return EmbeddingCache(os.path.join(index_dir, EMBEDDING_CACHE_DIR), EMBEDDING_MODEL_NAME, describe_embeddings(embeddings))
+
+
+def compact_embedding_cache(index_dir):
+    """
+    Drops cached vectors that no chunk of the saved index uses any more: edited or deleted
+    chunks, other models or backends.
+    """
+    vectorstore = load_vectorstore(index_dir)
+    cache = open_embedding_cache(index_dir, get_embeddings())
+    texts = (vectorstore.docstore.search(id_).page_content for id_ in vectorstore.index_to_docstore_id.values())
+    dropped = cache.compact(cache.key(text) for text in texts)
+    if dropped:
+        print(f"Embedding cache: {dropped} unused vectors removed.")
+
+
+def embed_chunks(split_docs, index_dir):
+    """
+    Embeds chunk texts through the on-disk embedding cache, so only unseen texts go
+    through the model. Returns an (n, dim) float32 array.
+    """
+    embeddings = get_embeddings()
+    cache = open_embedding_cache(index_dir, embeddings)
+    vectors = cache.embed([doc.page_content for doc in split_docs], embeddings, embed_batch_size())
+    print(f"Embedding cache: {cache.hits} hits, {cache.misses} computed.")
+    return vectors
+
+
+def add_vectors(vectorstore, split_docs, ids, vectors):
+    # same bookkeeping as FAISS.add_embeddings, but takes the vectors as one numpy array
+    vectorstore.index.add(vectors)
+    vectorstore.docstore.add({
+        id_: Document(id=id_, page_content=doc.page_content, metadata=doc.metadata)
+        for id_, doc in zip(ids, split_docs)
+    })
+    start = len(vectorstore.index_to_docstore_id)
+    vectorstore.index_to_docstore_id.update({start + j: id_ for j, id_ in enumerate(ids)})
+
+
+def new_vectorstore(split_docs, ids, vectors, index_type):
+    vectorstore = FAISS(
+        embedding_function=get_embeddings(),
+        index=create_index(vectors, index_type),
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+    )
+    add_vectors(vectorstore, split_docs, ids, vectors)
+    return vectorstore
+
+
+def faiss_embed(all_docs, index_dir, index_type=None):
     """
     Creates a FAISS index from the documents and saves it to the INDEX_DIR.
+    Returns the ids of the stored chunks grouped by source file.
+
+    index_type (FAISS_INDEX_TYPE, default "flat") is one of flat, ivf_flat, ivf_pq, hnsw.
     """
     split_docs = sliding_chunk_with_metadata_delimiter(all_docs)
+    if not split_docs:
+        raise ValueError("No documents found to ingest.")
+    ids = chunk_ids(split_docs)
 
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    vectorstore = FAISS.from_documents(split_docs, embeddings)
-    vectorstore.save_local(index_dir)
+    vectors = embed_chunks(split_docs, index_dir)
+    vectorstore = new_vectorstore(split_docs, ids, vectors, index_type or index_type_from_env())
+    save_vectorstore(vectorstore, index_dir)
     
     print(f"FAISS index saved to: {index_dir}")
     print("Total Vectors: ", vectorstore.index.ntotal)
     print("Total Dimensions: ", vectorstore.index.d)
     print("Index Type: ", type(vectorstore.index))
+    return group_ids_by_source(split_docs, ids)
+
+
+def faiss_update(all_docs, index_dir, stale_ids, index_type=None):
+    """
+    Updates the saved FAISS index: removes the vectors of stale chunks and embeds only
+    chunks that are not already stored. Returns the chunk ids of the given documents
+    grouped by source file.
+
+    Flat indexes are updated in place. IVF and HNSW indexes cannot drop vectors by
+    position, so they (and indexes of another type than index_type) are rebuilt from the
+    embedding cache instead.
+    """
+    index_type = index_type or index_type_from_env()
+    split_docs = sliding_chunk_with_metadata_delimiter(all_docs) if all_docs else []
+    ids = chunk_ids(split_docs)
+
+    vectorstore = load_vectorstore(index_dir)
+    stored_ids = set(vectorstore.index_to_docstore_id.values())
+    keep_ids = set(ids)
+    to_delete = [id_ for id_ in stale_ids if id_ in stored_ids and id_ not in keep_ids]
+    new_chunks = [(id_, doc) for id_, doc in zip(ids, split_docs) if id_ not in stored_ids]
+    if index_type == "flat" and load_index_meta(index_dir)["index_type"] == "flat":
+        if to_delete:
+            vectorstore.delete(to_delete)
+        if new_chunks:
+            new_docs = [doc for _, doc in new_chunks]
+            add_vectors(vectorstore, new_docs, [id_ for id_, _ in new_chunks], embed_chunks(new_docs, index_dir))
+    else:
+        deleted = set(to_delete)
+        chunks = [
+            (id_, vectorstore.docstore.search(id_))
+            for _, id_ in sorted(vectorstore.index_to_docstore_id.items())
+            if id_ not in deleted
+        ] + new_chunks
+        if chunks:
+            docs = [doc for _, doc in chunks]
+            vectorstore = new_vectorstore(docs, [id_ for id_, _ in chunks], embed_chunks(docs, index_dir), index_type)
+        else:
+            vectorstore.index.reset()
+    if vectorstore.index.ntotal == 0:
+        raise ValueError("No documents found to ingest.")
+    save_vectorstore(vectorstore, index_dir)
+
+    print(f"FAISS index updated in: {index_dir}")
+    print(f"Removed {len(to_delete)} chunks, added {len(new_chunks)} new chunks.")
+    print("Total Vectors: ", vectorstore.index.ntotal)
+    return group_ids_by_source(split_docs, ids)
+
+
+def ingest_workers():
+    return int(os.environ.get("INGEST_WORKERS") or 1)
 
 
-def ingest_documents(data_dir, index_dir):
+def index_up_to_date(data_dir, index_dir):
+    """
+    True when the index in index_dir was built from exactly the PDFs now in DATA_DIR, with
+    the current embedding model and index type - ingest_documents would not change it.
+    """
+    manifest = load_manifest(index_dir) if index_exists(index_dir) else None
+    if manifest is None or not os.path.exists(os.path.join(index_dir, LEXICAL_INDEX_FILE)):
+        return False
+    file_hashes = {filename: file_sha256(os.path.join(data_dir, filename)) for filename in list_pdf_files(data_dir)}
+    old_hashes = {filename: entry.get("sha256") for filename, entry in manifest["files"].items()}
+    return bool(file_hashes) and file_hashes == old_hashes and load_index_meta(index_dir)["index_type"] == index_type_from_env()
+
+
+def ingest_documents(data_dir, index_dir, force=False, workers=None):
     """
     Ingests PDF documents from the DATA_DIR, splits them into chunks, and creates a FAISS index.
+
+    A manifest of file and chunk hashes is kept next to the index. Only new or changed PDFs are
+    parsed and embedded, chunks of deleted PDFs are removed, and nothing is done when the
+    manifest already matches DATA_DIR. Returns True if the index was (re)written.
+
+    PDFs are parsed with `workers` processes (INGEST_WORKERS, default 1). Files that fail to
+    parse are left out of the manifest so they are retried on the next run.
     """
-    all_docs = read_pdf_file(data_dir)
-    if not all_docs:
+    workers = workers or ingest_workers()
+    failures = []
+    file_hashes = {filename: file_sha256(os.path.join(data_dir, filename)) for filename in list_pdf_files(data_dir)}
+    if not file_hashes:
         raise ValueError("No documents found to ingest.")
 
-    # shutil.rmtree(index_dir, ignore_errors=True)
-    faiss_embed(all_docs, index_dir)
+    index_type = index_type_from_env()
+    manifest = None if force or not index_exists(index_dir) else load_manifest(index_dir)
+    if manifest is None:
+        all_docs = read_pdf_file(data_dir, list(file_hashes), workers, failures)
+        if not all_docs:
+            raise ValueError("No documents found to ingest.")
+
+        # shutil.rmtree(index_dir, ignore_errors=True)
+        ids_by_source = faiss_embed(all_docs, index_dir, index_type)
+        files = {}
+    else:
+        old_files = manifest["files"]
+        changed = [f for f, sha in file_hashes.items() if old_files.get(f, {}).get("sha256") != sha]
+        deleted = [f for f in old_files if f not in file_hashes]
+        retype = load_index_meta(index_dir)["index_type"] != index_type
+        if not changed and not deleted and not retype:
+            if not os.path.exists(os.path.join(index_dir, LEXICAL_INDEX_FILE)):
+                save_lexical_index(index_dir)
+                print(f"BM25 index built for {index_dir}.")
+            print(f"Index at {index_dir} is up to date, skipping ingestion.")
+            return False
+
+        print(f"Incremental ingest: {len(changed)} new/changed, {len(deleted)} deleted PDF(s).")
+        if retype:
+            print(f"Rebuilding the index as {index_type}.")
+        stale_ids = [id_ for f in changed + deleted for id_ in old_files.get(f, {}).get("chunks", [])]
+        ids_by_source = faiss_update(read_pdf_file(data_dir, changed, workers, failures), index_dir, stale_ids, index_type)
+        files = {f: entry for f, entry in old_files.items() if f in file_hashes and f not in changed}
+
+    failed = {filename for filename, _ in failures}
+    for filename, sha in file_hashes.items():
+        if filename not in files and filename not in failed:
+            files[filename] = {"sha256": sha, "chunks": ids_by_source.get(filename, [])}
+    save_manifest(index_dir, files)
+    compact_embedding_cache(index_dir)
     
     # from doc_retrieve import list_chunks
     # list_chunks(index_dir)
-
-
+    return True
@@ -1,36 +1,299 @@
+import os
+import logging
+import threading
+import time
+from pathlib import Path
 from langchain_core.documents import Document
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from ttl_cache import TTLCache
+from ann_index import read_index, configure_search, index_type_of, load_index_meta
+from chunk_store import ChunkStore, CHUNK_FILES
+from bm25_index import BM25Index, LEXICAL_INDEX_FILE, reciprocal_rank_fusion
+from metrics import observe
+from embedding_backend import create_embeddings, check_embedding_parity
 
 
-def load_vectorstore(index_dir):
-    
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
-    return FAISS.load_local(
-        str(index_dir),
-        embeddings=embeddings,
-        allow_dangerous_deserialization=True
-    )
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+INDEX_FILES = ("index.faiss",) + CHUNK_FILES
+RETRIEVAL_MODES = ("dense", "hybrid")
+
+_embeddings = None
+_embeddings_lock = threading.Lock()
+_retrievers = {}
+_retrievers_lock = threading.Lock()
+logger = logging.getLogger(__name__)
+
+
+# one embedding model per process (EMBEDDING_BACKEND), shared by every retriever
+def get_embeddings():
+    global _embeddings
+    with _embeddings_lock:
+        if _embeddings is None:
+            _embeddings = create_embeddings(EMBEDDING_MODEL_NAME)
+        return _embeddings
+
+
+def normalize_query(query):
+    return " ".join(query.split()).casefold()
+
+
+def load_vectorstore(index_dir, embeddings=None, mmap=False):
+    """
+    Loads the FAISS index and chunk store saved by doc_ingest. With mmap both are
+    memory-mapped read-only and Documents are built only for hits (serving); without it
+    everything is read into memory so the index can be updated.
+    """
+    index_dir = Path(index_dir)
+    index_type = load_index_meta(index_dir)["index_type"]
+    index = configure_search(read_index(index_dir / INDEX_FILES[0], mmap, index_type))
+    chunks = ChunkStore(index_dir)
+    if mmap:
+        return FAISS(embeddings or get_embeddings(), index, chunks, chunks.index_to_docstore_id())
+    docs = list(chunks.documents())
+    docstore = InMemoryDocstore({doc.id: doc for doc in docs})
+    return FAISS(embeddings or get_embeddings(), index, docstore, {i: doc.id for i, doc in enumerate(docs)})
+
+
+def mmap_enabled():
+    return os.environ.get("FAISS_MMAP", "true").lower() in ("1", "true", "yes")
+
+
+class Retriever:
+    """
+    Long-lived retriever that keeps one loaded FAISS index for an index directory.
+
+    The vectorstore is swapped in as a whole, so concurrent searches always see either
+    the old or the new index, never a half-loaded one. The index is reloaded when the
+    files on disk change or a versioned INDEX_DIR is switched to a new version (see
+    index_versions.py), and memory-mapped unless FAISS_MMAP=false.
+
+    Query embeddings and retrieval results are cached (RETRIEVAL_CACHE_SIZE entries,
+    RETRIEVAL_CACHE_TTL seconds); cached results are tied to the index version.
+
+    In "hybrid" mode (RETRIEVAL_MODE, the default) the vector hits within the distance
+    threshold and the BM25 hits scoring at least BM25_MIN_SCORE are fused with reciprocal
+    rank fusion, each list taking up to RETRIEVAL_CANDIDATES chunks. Indexes without a BM25
+    file fall back to "dense".
+
+    Every loaded index is checked against the query embedding model (see
+    check_embedding_parity); an index built with an incompatible model is never served.
+    """
+
+    def __init__(self, index_dir, cache_size=None, cache_ttl=None, mode=None, candidates=None, bm25_min_score=None):
+        self.index_dir = Path(index_dir)
+        cache_size = cache_size if cache_size is not None else int(os.environ.get("RETRIEVAL_CACHE_SIZE") or 1024)
+        cache_ttl = cache_ttl if cache_ttl is not None else float(os.environ.get("RETRIEVAL_CACHE_TTL") or 600)
+        self.mode = (mode or os.environ.get("RETRIEVAL_MODE") or "hybrid").lower()
+        if self.mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown RETRIEVAL_MODE: {self.mode}. Choose one of {', '.join(RETRIEVAL_MODES)}.")
+        self.candidates = candidates or int(os.environ.get("RETRIEVAL_CANDIDATES") or 30)
+        self.bm25_min_score = bm25_min_score if bm25_min_score is not None else float(os.environ.get("BM25_MIN_SCORE") or 5.0)
+        self.mmap = mmap_enabled()
+        self.query_cache = TTLCache(cache_size, cache_ttl)
+        self.result_cache = TTLCache(cache_size, cache_ttl)
+        # (vectorstore, bm25, signature, version) - replaced atomically on reload
+        self._state = (None, None, None, 0)
+        # (signature, error) of the last index files that failed to load - not retried until they change
+        self._failed = (None, None)
+        self._reload_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "load_count": 0,
+            "load_seconds": 0.0,
+            "last_load_seconds": 0.0,
+            "search_count": 0,
+            "search_seconds": 0.0,
+            "last_search_seconds": 0.0,
+            "bm25_count": 0,
+            "bm25_seconds": 0.0,
+            "last_bm25_seconds": 0.0,
+            "embedding_parity": None,
+        }
+
+    @property
+    def version(self):
+        return self._state[3]
+
+    def _index_signature(self, index_dir):
+        # the resolved directory first: a versioned INDEX_DIR is a symlink swapped to a new version
+        signature = [str(index_dir)]
+        for name in INDEX_FILES:
+            st = os.stat(index_dir / name)
+            signature.append((st.st_ino, st.st_size, st.st_mtime_ns))
+        try:
+            st = os.stat(index_dir / LEXICAL_INDEX_FILE)
+            signature.append((st.st_ino, st.st_size, st.st_mtime_ns))
+        except FileNotFoundError:
+            signature.append(None)
+        return tuple(signature)
+
+    def _record(self, kind, elapsed):
+        with self._stats_lock:
+            self._stats[f"{kind}_count"] += 1
+            self._stats[f"{kind}_seconds"] += elapsed
+            self._stats[f"last_{kind}_seconds"] = elapsed
+
+    def get_vectorstore(self):
+        return self._current()[0]
+
+    def _load_bm25(self, vectorstore, index_dir):
+        path = index_dir / LEXICAL_INDEX_FILE
+        if self.mode != "hybrid" or not path.exists():
+            return None
+        bm25 = BM25Index.load(path)
+        if len(bm25) != vectorstore.index.ntotal:
+            raise RuntimeError(f"BM25 and FAISS indexes in {index_dir} are out of sync.")
+        return bm25
+
+    def _current(self):
+        # returns (vectorstore, bm25, version), reloading the indexes if the files changed;
+        # the symlink is resolved once, so all files come from the same index version
+        index_dir = Path(os.path.realpath(self.index_dir))
+        signature = self._index_signature(index_dir)
+        vectorstore, bm25, loaded_signature, version = self._state
+        if vectorstore is not None and signature == loaded_signature:
+            return vectorstore, bm25, version
+        if signature == self._failed[0]:
+            return self._after_failed_load(vectorstore, bm25, version)
+
+        with self._reload_lock:
+            # another thread may have reloaded (or failed to) while we were waiting
+            vectorstore, bm25, loaded_signature, version = self._state
+            if vectorstore is not None and signature == loaded_signature:
+                return vectorstore, bm25, version
+            if signature == self._failed[0]:
+                return self._after_failed_load(vectorstore, bm25, version)
+            start = time.perf_counter()
+            try:
+                new_vectorstore = load_vectorstore(index_dir, mmap=self.mmap)
+                if new_vectorstore.index.ntotal != len(new_vectorstore.index_to_docstore_id):
+                    raise RuntimeError(f"FAISS index and docstore in {index_dir} are out of sync.")
+                new_bm25 = self._load_bm25(new_vectorstore, index_dir)
+                parity = check_embedding_parity(index_dir, new_vectorstore.embedding_function)
+            except Exception as e:
+                # index is being rewritten or was built with other embeddings - keep serving
+                # the old one; these files are not loaded again, a rewrite changes the signature
+                self._failed = (signature, e)
+                logger.warning(f"Could not load the index in {index_dir}: {e}")
+                return self._after_failed_load(vectorstore, bm25, version)
+            with self._stats_lock:
+                self._stats["embedding_parity"] = parity
+            elapsed = time.perf_counter() - start
+            self._record("load", elapsed)
+            observe("index_load", elapsed, version=version + 1, mmap=self.mmap)
+            self._state = (new_vectorstore, new_bm25, signature, version + 1)
+            # results of the old index are never looked up again
+            self.result_cache.clear()
+            print(f"Loaded FAISS index from {index_dir} (version {version + 1}{', with BM25' if new_bm25 else ''}).")
+            return new_vectorstore, new_bm25, version + 1
+
+    def _after_failed_load(self, vectorstore, bm25, version):
+        if vectorstore is None:
+            raise self._failed[1]
+        return vectorstore, bm25, version
+
+    def embed_query(self, query: str):
+        key = normalize_query(query)
+        embedding = self.query_cache.get(key)
+        if embedding is None:
+            start = time.perf_counter()
+            embedding = get_embeddings().embed_query(query)
+            observe("query_embed", time.perf_counter() - start)
+            self.query_cache.set(key, embedding)
+        return embedding
+
+    def search(self, query: str, k: int):
+        vectorstore, _, _ = self._current()
+        embedding = self.embed_query(query)
+        start = time.perf_counter()
+        results = vectorstore.similarity_search_with_score_by_vector(embedding, k=k)
+        elapsed = time.perf_counter() - start
+        self._record("search", elapsed)
+        observe("faiss_search", elapsed, k=k, hits=len(results))
+        return results
+
+    def retrieve(self, query: str, k: int, threshold: float):
+        """
+        Returns the (doc, distance) pairs among the top k whose distance is within threshold.
+        """
+        return self.retrieve_with_best(query, k, threshold)[0]
+
+    def retrieve_with_best(self, query: str, k: int, threshold: float, on_best_distance=None):
+        """
+        Like retrieve, but also returns the best distance found (None for an empty index),
+        whether or not it passed the threshold. on_best_distance is called with it as soon
+        as the vector search is done.
+
+        In hybrid mode chunks found only by BM25 are returned with a distance of None.
+        """
+        vectorstore, bm25, version = self._current()
+        key = (normalize_query(query), k, threshold, version)
+        cached = self.result_cache.get(key)
+        if cached is None:
+            results = []
+            hits = self.search(query, max(k, self.candidates) if bm25 else k)
+            if on_best_distance is not None:
+                on_best_distance(float(hits[0][1]) if hits else None)
+            for doc, score in hits:
+                if score > threshold:
+                    break
+                results.append((doc, score))
+            if bm25 is not None:
+                results = self._fuse(vectorstore, bm25, query, results, k)
+            cached = (results, float(hits[0][1]) if hits else None)
+            self.result_cache.set(key, cached)
+        elif on_best_distance is not None:
+            on_best_distance(cached[1])
+        results, best_distance = cached
+        return list(results), best_distance
+
+    def _fuse(self, vectorstore, bm25, query, dense_results, k):
+        start = time.perf_counter()
+        lexical_ids = [id_ for id_, score in bm25.search(query, self.candidates) if score >= self.bm25_min_score]
+        elapsed = time.perf_counter() - start
+        self._record("bm25", elapsed)
+        observe("bm25_search", elapsed, hits=len(lexical_ids))
+        dense = {doc.id: (doc, score) for doc, score in dense_results}
+        fused = reciprocal_rank_fusion([list(dense), lexical_ids])[:k]
+        return [dense.get(id_) or (vectorstore.docstore.search(id_), None) for id_, _ in fused]
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["version"] = self.version
+        stats["mode"] = self.mode
+        vectorstore = self._state[0]
+        stats["index_type"] = index_type_of(vectorstore.index) if vectorstore is not None else None
+        stats["query_cache"] = self.query_cache.stats()
+        stats["result_cache"] = self.result_cache.stats()
+        return stats
+
+
+def get_retriever(index_dir):
+    # not resolved: a versioned INDEX_DIR must keep following its symlink
+    key = os.path.abspath(index_dir)
+    with _retrievers_lock:
+        retriever = _retrievers.get(key)
+        if retriever is None:
+            retriever = _retrievers[key] = Retriever(key)
+        return retriever
 
 
 # list chunks in vectorstore
 def list_chunks(index_dir, limit=10):
-    vectorstore = load_vectorstore(index_dir)
-    all_docs = vectorstore.docstore._dict 
-    print(f"Total chunks: {len(all_docs)}\n")
-    for i, (doc_id, doc) in enumerate(all_docs.items()):
+    vectorstore = get_retriever(index_dir).get_vectorstore()
+    ids = vectorstore.index_to_docstore_id
+    print(f"Total chunks: {len(ids)}\n")
+    for i in range(min(limit, len(ids))):
+        doc = vectorstore.docstore.search(ids[i])
         print(f"--- Chunk {i+1} [{doc.metadata.get('source')}] ---")
         print(doc.page_content + "\n")
-        if i + 1 >= limit:
-            break
-        
-        
+
+
 # chunks retrieval
 def search_documents(index_dir, query: str, k: int) -> list[Document]:
-    vectorstore = load_vectorstore(index_dir)
-    search_documents = vectorstore.similarity_search_with_score(query, k=k)
+    search_documents = get_retriever(index_dir).search(query, k)
     docs = [doc for doc, _ in search_documents]
     scores = [score for _, score in search_documents]
     return docs, scores
@@ -38,21 +301,23 @@ def search_documents(index_dir, query: str, k: int) -> list[Document]:
 
 # document retrieval
 def retrieve_documents(index_dir, query: str, k: int = 15, params: dict = None) -> list[Document]:
-    
+    return retrieve_documents_with_distance(index_dir, query, k, params)[0]
+
+
+# document retrieval, also returning the best distance (even if above the threshold)
+def retrieve_documents_with_distance(index_dir, query: str, k: int = 15, params: dict = None, on_best_distance=None):
+
     threshold = params.get("rag_dist_threshold", 0.8) if params else 0.8
-    docs, scores = search_documents(index_dir, query, k)
     rag_content = []
-    for i, doc in enumerate(docs):
-        if scores[i] > threshold:
-            break
+    results, best_distance = get_retriever(index_dir).retrieve_with_best(query, k, threshold, on_best_distance)
+    # LOG_LEVEL=DEBUG logs every retrieved chunk
+    debug = logger.isEnabledFor(logging.DEBUG)
+    for i, (doc, score) in enumerate(results):
         rag_content.append(doc)
-        print(f"\n===== Result {i+1} ({len(doc.page_content)})=====")
-        print(doc.page_content)
-        print("Score (distance):", scores[i])
-        
+        if debug:
+            logger.debug("Result %d (%d chars, distance %s):\n%s", i + 1, len(doc.page_content), score, doc.page_content)
+
     if not rag_content:
-        print("No relevant documents found within the distance threshold.")
-        
-    return rag_content
+        logger.debug("No relevant documents found within the distance threshold.")
 
-        
\ No newline at end of file
+    return rag_content, best_distance
@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import platform
+import argparse
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx_int8")
+EMBEDDING_META_FILE = "embedding_meta.json"
+
+# embedded when an index is saved and again when it is loaded, to catch a query model
+# that does not match the vectors in the index
+PARITY_TEXTS = (
+    "How do I get my booking fee refunded?",
+    "What documents do I need for a test drive?",
+    "Carro inspects every used car before it is listed.",
+    "PART B2 : SELLING YOUR USED VEHICLE TO OUR PARTNER BUYERS",
+)
+
+
+def embedding_backend_from_env():
+    backend = (os.environ.get("EMBEDDING_BACKEND") or "torch").lower()
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}. Choose one of {', '.join(EMBEDDING_BACKENDS)}.")
+    return backend
+
+
+def embedding_threads():
+    return int(os.environ.get("EMBEDDING_THREADS") or min(4, os.cpu_count() or 1))
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence-transformers model exported to ONNX, run with ONNX Runtime on the CPU.
+
+    Same output as the torch model: token embeddings are mean-pooled over the attention
+    mask and L2-normalized. Batches are grouped by length to keep padding small, and
+    ONNX Runtime uses `threads` intra-op threads (EMBEDDING_THREADS).
+    """
+
+    def __init__(self, model_path, tokenizer_path, threads=None, max_length=256, batch_size=32, backend="onnx"):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.backend = backend
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(str(tokenizer_path))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id("[PAD]") or 0)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads or embedding_threads()
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _embed(self, texts):
+        encodings = self.tokenizer.encode_batch(list(texts))
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": mask,
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {name: value for name, value in feeds.items() if name in self.input_names})[0]
+        weights = mask[:, :, None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+    def embed_array(self, texts):
+        # (n, dim) float32, batched by length
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = np.zeros((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            rows = order[start:start + self.batch_size]
+            batch = self._embed([texts[i] for i in rows])
+            if not vectors.shape[1]:
+                vectors = np.zeros((len(texts), batch.shape[1]), dtype=np.float32)
+            vectors[rows] = batch
+        return vectors
+
+    def embed_documents(self, texts):
+        return self.embed_array(list(texts)).tolist()
+
+    def embed_query(self, text):
+        return self._embed([text])[0].tolist()
+
+
+def onnx_model_files(model_name, backend):
+    """
+    (model.onnx, tokenizer.json) for the backend: from EMBEDDING_ONNX_DIR when set
+    (EMBEDDING_ONNX_FILE names the model file, default model.onnx / model_int8.onnx),
+    otherwise the exports published with the model on the Hugging Face Hub.
+    """
+    local_dir = os.environ.get("EMBEDDING_ONNX_DIR")
+    if local_dir:
+        default = "model_int8.onnx" if backend == "onnx_int8" else "model.onnx"
+        model_file = os.path.join(local_dir, os.environ.get("EMBEDDING_ONNX_FILE") or default)
+        return model_file, os.path.join(local_dir, "tokenizer.json")
+
+    from huggingface_hub import hf_hub_download
+    if backend == "onnx_int8":
+        # int8 weights, quantized for the instruction set of this CPU family
+        arm = platform.machine().lower() in ("arm64", "aarch64")
+        default = "onnx/model_qint8_arm64.onnx" if arm else "onnx/model_quint8_avx2.onnx"
+    else:
+        default = "onnx/model.onnx"
+    model_file = hf_hub_download(model_name, os.environ.get("EMBEDDING_ONNX_FILE") or default)
+    return model_file, hf_hub_download(model_name, "tokenizer.json")
+
+
+def create_embeddings(model_name, backend=None):
+    """
+    The embedding model for EMBEDDING_BACKEND: "torch" (sentence-transformers, the
+    default), "onnx" or "onnx_int8" (ONNX Runtime, no torch needed).
+    """
+    backend = backend or embedding_backend_from_env()
+    if backend == "torch":
+        # sentence-transformers / torch are only imported when this backend is used
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        if os.environ.get("EMBEDDING_THREADS"):
+            import torch
+            torch.set_num_threads(embedding_threads())
+        return HuggingFaceEmbeddings(model_name=model_name)
+    model_file, tokenizer_file = onnx_model_files(model_name, backend)
+    return OnnxEmbeddings(model_file, tokenizer_file, backend=backend)
+
+
+def describe_embeddings(embeddings):
+    return getattr(embeddings, "backend", None) or type(embeddings).__name__
+
+
+def save_embedding_meta(path, embeddings, model_name):
+    meta = {
+        "model": model_name,
+        "backend": describe_embeddings(embeddings),
+        "probe": [embeddings.embed_query(text) for text in PARITY_TEXTS],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def parity_min_similarity():
+    return float(os.environ.get("EMBEDDING_PARITY_MIN") or 0.98)
+
+
+def check_embedding_parity(index_dir, embeddings, min_similarity=None):
+    """
+    Embeds PARITY_TEXTS with the query model and compares them with the vectors the
+    index was built with. Raises RuntimeError when the lowest cosine similarity is below
+    min_similarity (EMBEDDING_PARITY_MIN, 0.98 by default): the index and the queries
+    come from different models. Returns the lowest similarity, or None for indexes saved
+    without embedding_meta.json.
+    """
+    path = os.path.join(index_dir, EMBEDDING_META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    min_similarity = parity_min_similarity() if min_similarity is None else min_similarity
+
+    expected = np.array(meta["probe"], dtype=np.float32)
+    actual = np.array([embeddings.embed_query(text) for text in PARITY_TEXTS], dtype=np.float32)
+    if expected.shape != actual.shape:
+        raise RuntimeError(
+            f"Index in {index_dir} was embedded with {meta['model']} ({meta['backend']}, dim {expected.shape[1]}), "
+            f"but queries use {describe_embeddings(embeddings)} with dim {actual.shape[1]}."
+        )
+    expected /= np.maximum(np.linalg.norm(expected, axis=1, keepdims=True), 1e-12)
+    actual /= np.maximum(np.linalg.norm(actual, axis=1, keepdims=True), 1e-12)
+    similarity = float((expected * actual).sum(axis=1).min())
+    if similarity < min_similarity:
+        raise RuntimeError(
+            f"Query embeddings ({describe_embeddings(embeddings)}) do not match the index in {index_dir} "
+            f"({meta['model']}, {meta['backend']}): cosine similarity {similarity:.3f} < {min_similarity}."
+        )
+    return similarity
+
+
+def quantize_model(model_path, output_path):
+    """
+    Dynamic int8 quantization of an exported model: weights are stored as int8 and
+    activations quantized on the fly, ~4x smaller and faster on CPUs with int8 support.
+    """
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(str(model_path), str(output_path), weight_type=QuantType.QInt8)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quantize an exported ONNX embedding model to int8.")
+    parser.add_argument("model", help="exported model.onnx (e.g. onnx/model.onnx of the model repo)")
+    parser.add_argument("output", help="where to write the int8 model, e.g. model_int8.onnx in EMBEDDING_ONNX_DIR")
+    args = parser.parse_args()
+    quantize_model(args.model, args.output)
+    print(f"Quantized {args.model} -> {args.output} ({os.path.getsize(args.output) / 2**20:.1f} MB)", file=sys.stderr)
@@ -0,0 +1,131 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    On-disk cache of chunk embeddings keyed by sha256(model name + backend + chunk text).
+
+    Vectors live in one append-only float32 file that is memory-mapped for reads; the keys
+    are stored line by line in the same order. Only texts that are not cached yet are sent
+    to the embedding model.
+    """
+
+    def __init__(self, cache_dir, model_name, backend=""):
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        # the same model run by another backend (e.g. int8 ONNX) gives slightly different vectors
+        self.backend = backend
+        self.keys_path = os.path.join(cache_dir, "keys.txt")
+        self.vectors_path = os.path.join(cache_dir, "vectors.f32")
+        self.meta_path = os.path.join(cache_dir, "meta.json")
+        self.dim = None
+        self.rows = {}
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    def _remove_files(self):
+        for path in (self.meta_path, self.keys_path, self.vectors_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            # meta.json is written last (see compact) - without it the other files are incomplete
+            self._remove_files()
+            return
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("model_name") != self.model_name or meta.get("backend", "") != self.backend:
+            # different model or backend - the cached vectors are useless
+            self._remove_files()
+            return
+        self.dim = meta["dim"]
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, "r", encoding="utf-8") as f:
+                keys = f.read().split()
+            self.rows = {key: i for i, key in enumerate(keys)}
+        # drop vectors written without their keys (interrupted run)
+        expected_size = len(self.rows) * self.dim * 4
+        if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) != expected_size:
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(expected_size)
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{self.backend}\0{text}".encode("utf-8")).hexdigest()
+
+    def vectors(self):
+        if self._vectors is None or len(self._vectors) != len(self.rows):
+            if not self.rows:
+                return np.empty((0, self.dim or 0), dtype=np.float32)
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.rows), self.dim))
+        return self._vectors
+
+    def _write_meta(self):
+        with open(self.meta_path, "w", encoding="utf-8") as f:
+            json.dump({"model_name": self.model_name, "backend": self.backend, "dim": self.dim}, f)
+
+    def _append(self, keys, vectors):
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self._write_meta()
+        # vectors first, then keys - a crash in between only leaves unreferenced vectors
+        with open(self.vectors_path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(self.keys_path, "a", encoding="utf-8") as f:
+            f.write("".join(f"{key}\n" for key in keys))
+        start = len(self.rows)
+        for i, key in enumerate(keys):
+            self.rows[key] = start + i
+
+    def embed(self, texts, embeddings, batch_size=64):
+        """
+        Returns an (n, dim) float32 array of embeddings for texts, computing cache misses
+        with embeddings.embed_documents in batches of batch_size.
+        """
+        keys = [self.key(text) for text in texts]
+        missing = {}
+        for i, key in enumerate(keys):
+            if key not in self.rows:
+                missing.setdefault(key, i)
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+
+        missing_keys = list(missing)
+        for start in range(0, len(missing_keys), batch_size):
+            batch_keys = missing_keys[start:start + batch_size]
+            batch = embeddings.embed_documents([texts[missing[key]] for key in batch_keys])
+            self._append(batch_keys, np.asarray(batch, dtype=np.float32))
+
+        if not keys:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        # fancy indexing copies the rows out of the memory map into one contiguous array
+        return self.vectors()[np.fromiter((self.rows[key] for key in keys), dtype=np.int64, count=len(keys))]
+
+    def compact(self, live_keys):
+        """
+        Rewrites the store with only the vectors of live_keys, in their current order, so
+        vectors of edited or deleted chunks do not pile up. Returns the number dropped.
+        """
+        live_keys = set(live_keys)
+        keys = [key for key in self.rows if key in live_keys]
+        dropped = len(self.rows) - len(keys)
+        if not dropped:
+            return 0
+        vectors = self.vectors()[np.fromiter((self.rows[key] for key in keys), dtype=np.int64, count=len(keys))]
+        self._vectors = None
+        # without meta.json a half-written store is discarded on the next load
+        os.remove(self.meta_path)
+        for path, data in ((self.vectors_path, np.ascontiguousarray(vectors, dtype=np.float32).tobytes()),
+                           (self.keys_path, "".join(f"{key}\n" for key in keys).encode("utf-8"))):
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+        self._write_meta()
+        self.rows = {key: i for i, key in enumerate(keys)}
+        return dropped
@@ -0,0 +1,168 @@
+import os
+import time
+import shutil
+import logging
+from pathlib import Path
+
+
+VERSIONS_SUFFIX = ".versions"
+# appended to in place by ingest (only the builder does): one copy in the versions
+# folder, linked into every version instead of copied
+SHARED_DIRS = ("embedding_cache",)
+
+
+def versions_dir(index_dir):
+    # rag/faiss_index -> rag/faiss_index.versions/<version>
+    index_dir = Path(index_dir)
+    return index_dir.parent / f"{index_dir.name}{VERSIONS_SUFFIX}"
+
+
+def is_versioned(index_dir):
+    return os.path.islink(index_dir)
+
+
+def current_version(index_dir):
+    # the version directory INDEX_DIR points to, or None
+    return Path(os.path.realpath(index_dir)) if is_versioned(index_dir) else None
+
+
+def shared_dir(index_dir, name):
+    # hidden, so list_versions never takes it for a version
+    return versions_dir(index_dir) / f".{name}"
+
+
+def link_shared_dirs(index_dir, version_dir):
+    """
+    Points version_dir/<name> at the shared copy of every SHARED_DIRS entry. A version
+    that still has its own copy (built before the copy was shared) hands it over first.
+    """
+    for name in SHARED_DIRS:
+        shared = shared_dir(index_dir, name)
+        target = version_dir / name
+        if target.is_symlink():
+            continue
+        if target.is_dir():
+            if shared.exists():
+                shutil.rmtree(target)
+            else:
+                os.rename(target, shared)
+        shared.mkdir(parents=True, exist_ok=True)
+        os.symlink(os.path.relpath(shared, version_dir), target)
+
+
+def list_versions(index_dir):
+    root = versions_dir(index_dir)
+    if not root.exists():
+        return []
+    return sorted(p for p in root.iterdir() if p.is_dir() and not p.name.startswith("."))
+
+
+def publish(index_dir, version_dir):
+    """
+    Points INDEX_DIR at version_dir. A new symlink is renamed over the old one, so readers
+    resolve either the old or the new version, never a missing path.
+    """
+    index_dir = Path(index_dir)
+    tmp_link = index_dir.parent / f".{index_dir.name}.{os.getpid()}.tmp"
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    # relative, so the rag folder can be moved as a whole
+    os.symlink(os.path.relpath(version_dir, index_dir.parent), tmp_link)
+    os.replace(tmp_link, index_dir)
+
+
+def migrate(index_dir):
+    """
+    Turns a plain INDEX_DIR into the versioned layout: an existing index becomes the first
+    version, an empty directory is removed. Run it before any worker serves INDEX_DIR.
+    """
+    index_dir = Path(index_dir)
+    if is_versioned(index_dir) or not index_dir.exists():
+        return
+    if not any(index_dir.iterdir()):
+        index_dir.rmdir()
+        return
+    version_dir = versions_dir(index_dir) / time.strftime("%Y%m%d-%H%M%S-migrated")
+    version_dir.parent.mkdir(parents=True, exist_ok=True)
+    os.rename(index_dir, version_dir)
+    publish(index_dir, version_dir)
+    print(f"Moved the index in {index_dir} to {version_dir}.")
+
+
+def new_version(index_dir):
+    """
+    Creates the next version directory, seeded from the current version so ingest only
+    has to process changed PDFs. Index files are never modified in place (they are
+    replaced), so they are hard-linked; the embedding cache is shared by all versions.
+    """
+    root = versions_dir(index_dir)
+    root.mkdir(parents=True, exist_ok=True)
+    version_dir = root / f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    version_dir.mkdir()
+    current = current_version(index_dir)
+    if current is not None:
+        link_shared_dirs(index_dir, current)
+        for entry in current.iterdir():
+            target = version_dir / entry.name
+            if entry.name.startswith(".") or entry.is_dir():
+                continue
+            try:
+                os.link(entry, target)
+            except OSError:
+                shutil.copy2(entry, target)
+    link_shared_dirs(index_dir, version_dir)
+    return version_dir
+
+
+def prune_versions(index_dir, keep=None):
+    """
+    Removes all but the newest `keep` versions (INDEX_KEEP_VERSIONS, default 3) and never
+    the current one. Workers still on a removed version keep their memory-mapped files
+    until they switch.
+    """
+    keep = keep or int(os.environ.get("INDEX_KEEP_VERSIONS") or 3)
+    current = current_version(index_dir)
+    for version_dir in list_versions(index_dir)[:-keep]:
+        if version_dir != current:
+            shutil.rmtree(version_dir, ignore_errors=True)
+
+
+def build_version(data_dir, index_dir, force=False):
+    """
+    Ingests DATA_DIR into a new version and publishes it. Nothing is published when no
+    PDF changed. Returns the published version directory or None.
+    """
+    from doc_ingest import ingest_documents, index_up_to_date
+    current = current_version(index_dir)
+    # checked against the current version first, so an unchanged DATA_DIR costs only the hashing
+    if not force and current is not None and index_up_to_date(data_dir, current):
+        print(f"Index version {current.name} is up to date.")
+        return None
+    version_dir = new_version(index_dir)
+    try:
+        changed = ingest_documents(data_dir, version_dir, force=force)
+    except BaseException:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+    if not changed and current is not None:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        return None
+    publish(index_dir, version_dir)
+    prune_versions(index_dir)
+    print(f"Published index version {version_dir.name}.")
+    return version_dir
+
+
+def run_builder(data_dir, index_dir, interval=0):
+    """
+    The single writer of INDEX_DIR: builds a version, then checks DATA_DIR again every
+    `interval` seconds (INDEX_BUILD_INTERVAL; 0 builds once).
+    """
+    while True:
+        try:
+            build_version(data_dir, index_dir)
+        except Exception as e:
+            logging.error(f"Index build failed: {e}", exc_info=True)
+        if not interval:
+            return
+        time.sleep(interval)
@@ -0,0 +1,163 @@
+import os
+import time
+import asyncio
+import threading
+import httpx
+from metrics import GenerationTimer
+
+
+PROVIDERS = ("ollama", "openai", "stub")
+
+_llms = {}
+_llms_lock = threading.Lock()
+
+
+def _http_limits():
+    max_connections = int(os.environ.get("LLM_MAX_CONNECTIONS") or 20)
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+
+
+def _http_timeout():
+    return httpx.Timeout(float(os.environ.get("LLM_TIMEOUT") or 120), connect=5.0)
+
+
+def create_ollama_llm():
+    from langchain_ollama import OllamaLLM
+    return OllamaLLM(
+        model=os.environ.get("OLLAMA_MODEL") or "llama3",
+        base_url=os.environ.get("OLLAMA_BASE_URL") or None,
+        temperature=0.1,
+        top_k=40,
+        top_p=0.9,
+        num_predict=512,
+        # keep the model loaded between bursts of traffic
+        keep_alive=os.environ.get("OLLAMA_KEEP_ALIVE") or "30m",
+        client_kwargs={"timeout": _http_timeout(), "limits": _http_limits()},
+    )
+
+
+def create_openai_llm():
+    from langchain_openai import ChatOpenAI
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        raise EnvironmentError("Environment variable OPENAI_API_KEY is not set.")
+    return ChatOpenAI(
+        model_name=os.environ.get("OPENAI_MODEL") or "gpt-4o-mini",
+        openai_api_key=api_key,
+        temperature=0.0,
+        streaming=True,
+        http_client=httpx.Client(timeout=_http_timeout(), limits=_http_limits()),
+        http_async_client=httpx.AsyncClient(timeout=_http_timeout(), limits=_http_limits()),
+    )
+
+
+class StubLLM:
+    """
+    Deterministic stand-in for benchmarks and offline runs: answers every prompt with the
+    same text, streamed word by word. first_token_delay and token_delay simulate model
+    latency.
+    """
+
+    def __init__(self, answer, first_token_delay=0.0, token_delay=0.0):
+        self.answer = answer
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.calls = 0
+
+    def _tokens(self):
+        words = self.answer.split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    def invoke(self, messages):
+        self.calls += 1
+        time.sleep(self.first_token_delay + self.token_delay * len(self._tokens()))
+        return self.answer
+
+    def stream(self, messages):
+        self.calls += 1
+        time.sleep(self.first_token_delay)
+        for i, token in enumerate(self._tokens()):
+            if i:
+                time.sleep(self.token_delay)
+            yield token
+
+    async def astream(self, messages):
+        self.calls += 1
+        await asyncio.sleep(self.first_token_delay)
+        for i, token in enumerate(self._tokens()):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            yield token
+
+
+def create_stub_llm():
+    return StubLLM(
+        os.environ.get("LLM_STUB_ANSWER") or "This is a stub answer based on the FAQ documents.",
+        first_token_delay=float(os.environ.get("LLM_STUB_FIRST_TOKEN_DELAY") or 0),
+        token_delay=float(os.environ.get("LLM_STUB_TOKEN_DELAY") or 0),
+    )
+
+
+FACTORIES = {"ollama": create_ollama_llm, "openai": create_openai_llm, "stub": create_stub_llm}
+
+
+def get_provider():
+    provider = (os.environ.get("LLM_PROVIDER") or "ollama").lower()
+    if provider not in FACTORIES:
+        raise ValueError(f"Unknown LLM_PROVIDER: {provider}. Choose one of {', '.join(PROVIDERS)}.")
+    return provider
+
+
+def get_llm(provider=None):
+    """
+    Returns the shared client of the configured provider (LLM_PROVIDER), creating it on
+    first use. Clients are safe to share between threads and keep their HTTP connections.
+    """
+    provider = provider or get_provider()
+    with _llms_lock:
+        llm = _llms.get(provider)
+        if llm is None:
+            llm = _llms[provider] = FACTORIES[provider]()
+        return llm
+
+
+def message_text(chunk):
+    # chat models return message chunks, completion models return plain strings
+    return chunk.content if hasattr(chunk, "content") else chunk
+
+
+def stream_text(llm, messages):
+    # timed as first_token / generation stages
+    timer = GenerationTimer()
+    try:
+        for chunk in llm.stream(messages):
+            text = message_text(chunk)
+            if text:
+                timer.token()
+                yield text
+    finally:
+        timer.finish()
+
+
+async def astream_text(llm, messages):
+    timer = GenerationTimer()
+    try:
+        async for chunk in llm.astream(messages):
+            text = message_text(chunk)
+            if text:
+                timer.token()
+                yield text
+    finally:
+        timer.finish()
+
+
+def warm_up(provider=None):
+    """
+    Creates the client and, for Ollama, loads the model into memory with an empty prompt
+    so the first user does not pay the model load.
+    """
+    provider = provider or get_provider()
+    llm = get_llm(provider)
+    if provider == "ollama":
+        llm.invoke("")
+    return llm
@@ -0,0 +1,165 @@
+import os
+import time
+import asyncio
+import threading
+import contextlib
+from collections import Counter as SessionCounter
+from metrics import registry, observe, Counter, Gauge
+
+
+# lower runs first
+CHAT = 0
+SUMMARY = 1
+KINDS = {CHAT: "chat", SUMMARY: "summary"}
+
+QUEUE_TIMEOUTS = registry.register(Counter("faq_llm_queue_timeouts_total", "LLM requests that gave up waiting for a slot."))
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+class SchedulerBusyError(Exception):
+    pass
+
+
+class _Waiter:
+    def __init__(self, session_id, priority, seq, grant):
+        self.session_id = session_id
+        self.priority = priority
+        self.seq = seq
+        self.grant = grant
+
+
+class GenerationScheduler:
+    """
+    Admission control in front of the LLM: at most `slots` generations run at once, the
+    others wait in a queue.
+
+    A free slot goes to the waiting request with the lowest (priority, slots its session
+    already holds, arrival) - chat turns before summaries, and a session that is already
+    generating goes behind sessions that are not. A request that waited longer than its
+    max wait (max_queue_wait for chat, summary_max_wait for summaries) raises
+    SchedulerBusyError instead of hanging.
+
+    Works for threads (slot) and for the event loop (aslot) alike.
+    """
+
+    def __init__(self, slots=4, max_queue_wait=10.0, summary_max_wait=60.0):
+        self.slots = slots
+        self.max_wait = {CHAT: max_queue_wait, SUMMARY: summary_max_wait}
+        self.active = 0
+        self._by_session = SessionCounter()
+        self._waiting = []
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            slots=int(os.environ.get("LLM_SLOTS") or 4),
+            max_queue_wait=float(os.environ.get("LLM_MAX_QUEUE_WAIT") or 10),
+            summary_max_wait=float(os.environ.get("LLM_SUMMARY_MAX_WAIT") or 60),
+        )
+
+    @property
+    def waiting(self):
+        return len(self._waiting)
+
+    def _enqueue(self, session_id, priority, grant):
+        with self._lock:
+            self._seq += 1
+            waiter = _Waiter(session_id, priority, self._seq, grant)
+            self._waiting.append(waiter)
+            self._dispatch()
+            return waiter
+
+    def _dispatch(self):
+        # called with the lock held
+        while self.active < self.slots and self._waiting:
+            waiter = min(self._waiting, key=lambda w: (w.priority, self._by_session[w.session_id], w.seq))
+            self._waiting.remove(waiter)
+            self.active += 1
+            self._by_session[waiter.session_id] += 1
+            waiter.grant()
+
+    def _cancel(self, waiter):
+        # False when the slot was granted in the meantime
+        with self._lock:
+            if waiter in self._waiting:
+                self._waiting.remove(waiter)
+                return True
+            return False
+
+    def release(self, session_id):
+        with self._lock:
+            self.active -= 1
+            self._by_session[session_id] -= 1
+            if self._by_session[session_id] <= 0:
+                del self._by_session[session_id]
+            self._dispatch()
+
+    def _admitted(self, priority, start):
+        observe(f"{KINDS[priority]}_queue_wait", time.perf_counter() - start)
+
+    def _timed_out(self, priority, start):
+        kind = KINDS[priority]
+        QUEUE_TIMEOUTS.inc(kind=kind)
+        observe(f"{kind}_queue_wait", time.perf_counter() - start, timeout=True)
+        return SchedulerBusyError(f"No LLM slot free after {self.max_wait[priority]:g}s ({self.active} busy, {self.waiting} waiting).")
+
+    @contextlib.contextmanager
+    def slot(self, session_id, priority=CHAT):
+        start = time.perf_counter()
+        granted = threading.Event()
+        waiter = self._enqueue(session_id, priority, granted.set)
+        if not granted.wait(self.max_wait[priority]) and self._cancel(waiter):
+            raise self._timed_out(priority, start)
+        self._admitted(priority, start)
+        try:
+            yield
+        finally:
+            self.release(session_id)
+
+    @contextlib.asynccontextmanager
+    async def aslot(self, session_id, priority=CHAT):
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def grant():
+            # may run on another thread, e.g. a summary worker releasing its slot
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+        waiter = self._enqueue(session_id, priority, grant)
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), self.max_wait[priority])
+        except asyncio.TimeoutError:
+            if self._cancel(waiter):
+                raise self._timed_out(priority, start)
+        except BaseException:
+            # the turn was cancelled while waiting - give back a slot granted meanwhile
+            if not self._cancel(waiter):
+                self.release(session_id)
+            raise
+        self._admitted(priority, start)
+        try:
+            yield
+        finally:
+            self.release(session_id)
+
+    def stats(self):
+        with self._lock:
+            return {"slots": self.slots, "active": self.active, "waiting": len(self._waiting)}
+
+
+def get_scheduler():
+    # one scheduler per process, configured with LLM_SLOTS, LLM_MAX_QUEUE_WAIT and LLM_SUMMARY_MAX_WAIT
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = GenerationScheduler.from_env()
+        return _scheduler
+
+
+registry.register(Gauge("faq_llm_slots_busy", "LLM generations running.", lambda: _scheduler.active if _scheduler else 0))
+registry.register(Gauge("faq_llm_queue_length", "LLM requests waiting for a slot.", lambda: _scheduler.waiting if _scheduler else 0))
@@ -0,0 +1,234 @@
+import os
+import json
+import queue
+import logging
+import threading
+from pathlib import Path
+
+
+LOG_FORMATS = ("text", "jsonl", "msgpack")
+LOG_SUFFIXES = {"text": ".log", "jsonl": ".jsonl", "msgpack": ".msgpack"}
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+_STOP = object()
+
+
+class JsonMessage:
+    """
+    Log message holding a dict. It is serialized only when the record is written (on the
+    log thread), and structured formats store the dict as is.
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return json.dumps(self.data, ensure_ascii=False, default=str)
+
+
+class RecordEncoder:
+    """
+    Turns log records into bytes: the classic "<time> [LEVEL] message" lines, one JSON
+    object per line (jsonl) or one msgpack map per record.
+    """
+
+    def __init__(self, format="text"):
+        if format not in LOG_FORMATS:
+            raise ValueError(f"Unknown LOG_FORMAT: {format}. Choose one of {', '.join(LOG_FORMATS)}.")
+        self.format = format
+        self.formatter = logging.Formatter(TEXT_FORMAT)
+        self._packb = None
+        if format == "msgpack":
+            try:
+                import msgpack
+            except ImportError:
+                raise ImportError("LOG_FORMAT=msgpack needs the msgpack package (pip install msgpack).")
+            self._packb = msgpack.packb
+
+    def fields(self, record):
+        fields = {"time": self.formatter.formatTime(record), "level": record.levelname}
+        if isinstance(record.msg, JsonMessage):
+            fields.update(record.msg.data)
+        else:
+            fields["message"] = record.getMessage()
+        if record.exc_info:
+            fields["exc"] = self.formatter.formatException(record.exc_info)
+        return fields
+
+    def encode(self, record):
+        if self.format == "text":
+            return (self.formatter.format(record) + "\n").encode("utf-8")
+        if self.format == "jsonl":
+            return (json.dumps(self.fields(record), ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        return self._packb(self.fields(record), default=str)
+
+
+class RotatingWriter:
+    """
+    Appends bytes to path, rotating it to path.1 ... path.<backup_count> before it would
+    grow past max_bytes (like logging.handlers.RotatingFileHandler).
+    """
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, backup_count=5):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "ab")
+
+    def write(self, data):
+        if self.max_bytes and self._file.tell() and self._file.tell() + len(data) > self.max_bytes:
+            self.rotate()
+        self._file.write(data)
+        self._file.flush()
+
+    def rotate(self):
+        self._file.close()
+        if self.backup_count:
+            for i in range(self.backup_count - 1, 0, -1):
+                older = self.path.with_name(f"{self.path.name}.{i}")
+                if older.exists():
+                    os.replace(older, self.path.with_name(f"{self.path.name}.{i + 1}"))
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+        self._file = open(self.path, "ab")
+
+    def close(self):
+        self._file.close()
+
+
+class AsyncLogHandler(logging.Handler):
+    """
+    Logging handler that never touches the disk in the calling thread.
+
+    emit() only puts the record on a bounded queue; a background thread formats whatever
+    has queued up (up to batch_size records), writes it in one call and rotates the file
+    by size. When the queue is full, records are dropped and counted rather than making a
+    chat turn wait for the disk.
+
+    Like logging.FileHandler, a closed handler reopens on the next record (uvicorn's
+    logging setup closes every existing handler).
+    """
+
+    def __init__(self, path, format="text", max_bytes=50 * 1024 * 1024, backup_count=5, batch_size=256, queue_size=10000):
+        super().__init__()
+        self.encoder = RecordEncoder(format)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._start()
+
+    def _start(self):
+        self.writer = RotatingWriter(self.path, self.max_bytes, self.backup_count)
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls, path):
+        """
+        Configured with LOG_FORMAT, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_BATCH_SIZE and
+        LOG_QUEUE_SIZE.
+        """
+        return cls(
+            path,
+            format=(os.environ.get("LOG_FORMAT") or "text").lower(),
+            max_bytes=int(os.environ.get("LOG_MAX_BYTES") or 50 * 1024 * 1024),
+            backup_count=int(os.environ.get("LOG_BACKUP_COUNT") or 5),
+            batch_size=int(os.environ.get("LOG_BATCH_SIZE") or 256),
+            queue_size=int(os.environ.get("LOG_QUEUE_SIZE") or 10000),
+        )
+
+    def emit(self, record):
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(record is _STOP for record in batch)
+            data = []
+            for record in batch:
+                if record is _STOP:
+                    continue
+                try:
+                    data.append(self.encoder.encode(record))
+                except Exception:
+                    self.handleError(record)
+            if data:
+                try:
+                    self.writer.write(b"".join(data))
+                    self.written += len(data)
+                except OSError:
+                    self.handleError(batch[0])
+            if stop:
+                return
+
+    def close(self):
+        # writes what is still queued, then stops the writer thread
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout=10)
+            self._thread = None
+            self.writer.close()
+            if self.dropped:
+                print(f"Log queue was full, {self.dropped} records dropped.")
+        super().close()
+
+
+def log_path(base, format=None):
+    # rag_test -> rag_test.log / rag_test.jsonl / rag_test.msgpack
+    format = format or (os.environ.get("LOG_FORMAT") or "text").lower()
+    return Path(base).with_suffix(LOG_SUFFIXES.get(format, ".log"))
+
+
+def configure_logging(base):
+    """
+    Sends the root logger to an AsyncLogHandler at log_path(base), at LOG_LEVEL (INFO by
+    default; DEBUG also logs every retrieved chunk).
+    """
+    handler = AsyncLogHandler.from_env(log_path(base))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel((os.environ.get("LOG_LEVEL") or "INFO").upper())
+    return handler
+
+
+def read_records(path):
+    """
+    Yields the JSON records (dicts) of a log file in any LOG_FORMAT, including rotated
+    backups. Text lines are parsed from their first "{"; other lines are skipped.
+    """
+    path = Path(path)
+    if ".msgpack" in path.suffixes:
+        import msgpack
+        with open(path, "rb") as f:
+            for record in msgpack.Unpacker(f, raw=False):
+                if isinstance(record, dict):
+                    yield record
+        return
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            start = line.find("{")
+            if start == -1:
+                continue
+            try:
+                record = json.loads(line[start:])
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                yield record
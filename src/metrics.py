@@ -0,0 +1,336 @@
+import os
+import json
+import asyncio
+import time
+import random
+import logging
+import threading
+import contextlib
+import contextvars
+from collections import defaultdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from log_sink import JsonMessage
+
+
+# seconds, from a cached embedding lookup to a slow LLM answer
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# the trace of the chat turn being handled, if any
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.type = "counter"
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] += amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in self._values.items()]
+
+
+class Histogram:
+    """
+    Cumulative bucket counts, sum and count per label set, as Prometheus expects them.
+    """
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.type = "histogram"
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (+Inf last), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        entry = self._values.get(tuple(sorted(labels.items())))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", labels + (("le", str(bound)),), cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class Gauge:
+    """
+    Current value read from fn() at scrape time.
+    """
+
+    def __init__(self, name, help, fn):
+        self.name = name
+        self.help = help
+        self.type = "gauge"
+        self.fn = fn
+
+    def samples(self):
+        return [(self.name, (), self.fn())]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        The metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_label_text(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+STAGE_SECONDS = registry.register(Histogram("faq_stage_seconds", "Time spent per pipeline stage."))
+STAGE_ERRORS = registry.register(Counter("faq_stage_errors_total", "Pipeline stages that raised."))
+LLM_TOKENS = registry.register(Counter("faq_llm_tokens_total", "Streamed LLM chunks (about one token each)."))
+LLM_TOKEN_RATE = registry.register(Histogram("faq_llm_tokens_per_second", "LLM generation speed per answer.", TOKEN_RATE_BUCKETS))
+
+
+def sample_rate():
+    return float(os.environ.get("TRACE_SAMPLE_RATE") or 0.1)
+
+
+class Trace:
+    """
+    One chat turn. Sampled traces log every span (and the full turn context); metrics are
+    recorded for all traces.
+    """
+
+    def __init__(self, sampled):
+        self.id = f"{random.getrandbits(64):016x}"
+        self.sampled = sampled
+
+
+def new_trace(rate=None):
+    # sampled with probability TRACE_SAMPLE_RATE
+    rate = sample_rate() if rate is None else rate
+    return Trace(random.random() < rate)
+
+
+@contextlib.contextmanager
+def trace(rate=None):
+    """
+    Runs the block as a new trace, e.g. a background summarization.
+    """
+    current = new_trace(rate)
+    token = _trace.set(current)
+    try:
+        yield current
+    finally:
+        _trace.reset(token)
+
+
+def _trace_context(rate):
+    context = contextvars.copy_context()
+    context.run(_trace.set, new_trace(rate))
+    return context
+
+
+def traced(generator, rate=None):
+    """
+    Iterates a chat turn generator inside its own trace. Every step runs in the same
+    context, even when the server advances the generator from different threads.
+    """
+    context = _trace_context(rate)
+    try:
+        while True:
+            try:
+                item = context.run(next, generator)
+            except StopIteration:
+                return
+            yield item
+    finally:
+        context.run(generator.close)
+
+
+async def atraced(generator, rate=None):
+    # async version of traced - each step runs as a task in the trace context
+    context = _trace_context(rate)
+    try:
+        while True:
+            try:
+                item = await asyncio.create_task(generator.__anext__(), context=context)
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        await asyncio.create_task(generator.aclose(), context=context)
+
+
+def current_trace():
+    return _trace.get()
+
+
+def is_sampled():
+    current = _trace.get()
+    return current is not None and current.sampled
+
+
+def log_span(stage, seconds, **attrs):
+    current = _trace.get()
+    if current is None or not current.sampled:
+        return
+    logging.info(JsonMessage({
+        "span": stage,
+        "trace_id": current.id,
+        "duration_ms": round(seconds * 1000, 3),
+        **attrs,
+    }))
+
+
+def observe(stage, seconds, **attrs):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    log_span(stage, seconds, **attrs)
+
+
+@contextlib.contextmanager
+def span(stage, **attrs):
+    """
+    Times the block as one pipeline stage: recorded in faq_stage_seconds and logged as a
+    span when the current turn is sampled. attrs can be added to while the block runs.
+    """
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        # generators closed early (the user left mid-stream) are not errors
+        if not isinstance(e, GeneratorExit):
+            STAGE_ERRORS.inc(stage=stage)
+            attrs["error"] = type(e).__name__
+        raise
+    finally:
+        observe(stage, time.perf_counter() - start, **attrs)
+
+
+class GenerationTimer:
+    """
+    Times a streamed answer: time to first token, total generation time and tokens/sec.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token_at = None
+        self.tokens = 0
+
+    def token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            observe("first_token", self.first_token_at - self.start)
+        self.tokens += 1
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.start
+        observe("generation", elapsed, tokens=self.tokens)
+        LLM_TOKENS.inc(self.tokens)
+        if self.first_token_at is not None and self.tokens > 1:
+            # decode speed, not counting the wait for the first token
+            decode = time.perf_counter() - self.first_token_at
+            if decode > 0:
+                LLM_TOKEN_RATE.observe((self.tokens - 1) / decode)
+
+
+class MetricsServer:
+    """
+    Serves registry.render() on GET /metrics from a background thread. routes maps other
+    paths to functions returning (status, JSON payload), e.g. health checks.
+    """
+
+    def __init__(self, host="127.0.0.1", port=9464, registry=registry, routes=None):
+        routes = routes or {}
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/metrics":
+                    status, content_type, body = 200, "text/plain; version=0.0.4; charset=utf-8", registry.render()
+                elif path in routes:
+                    status, payload = routes[path]()
+                    content_type, body = "application/json", json.dumps(payload)
+                else:
+                    self.send_error(404)
+                    return
+                body = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def start_metrics_server(routes=None):
+    """
+    Starts the metrics endpoint on METRICS_HOST:METRICS_PORT (127.0.0.1:9464 by default).
+    METRICS_PORT=0 disables it.
+    """
+    port = int(os.environ.get("METRICS_PORT") or 9464)
+    if not port:
+        return None
+    server = MetricsServer(os.environ.get("METRICS_HOST") or "127.0.0.1", port, routes=routes).start()
+    print(f"Metrics on {server.url}")
+    return server
@@ -0,0 +1,257 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from ttl_cache import TTLCache
+
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class SearchUnavailableError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and rejects calls for
+    reset_timeout seconds. After that a single trial call is let through: success closes
+    the circuit, failure opens it again. Every allowed call must end in record_success or
+    record_failure (or release, when it was abandoned), or a half-open circuit never lets
+    another trial through.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+    def release(self):
+        # the call was abandoned (e.g. cancelled) before the provider answered: says nothing
+        # about its health, but a half-open circuit may let the next trial through
+        with self._lock:
+            self._trial_running = False
+
+
+class LatencyStats:
+    """
+    Latency percentiles over the last `window` successful calls.
+    """
+
+    def __init__(self, window=256):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+
+    def percentile(self, q, default=None):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return default
+        return samples[min(len(samples) - 1, int(q / 100 * len(samples)))]
+
+    def stats(self):
+        return {"count": self.count, "p50": self.percentile(50), "p95": self.percentile(95)}
+
+
+class SearchClient:
+    """
+    HTTP client for one search provider.
+
+    Uses a pooled requests.Session (and an httpx.AsyncClient for the async path) with
+    connect/read timeouts, a bounded number of retries with jittered exponential backoff,
+    a circuit breaker that fails fast while the provider is down, and a TTL cache of
+    results per query.
+    """
+
+    def __init__(self, name, url, connect_timeout=3.05, read_timeout=10.0, retries=2, backoff=0.3,
+                 failure_threshold=5, reset_timeout=30.0, cache_size=512, cache_ttl=300.0, pool_size=10):
+        self.name = name
+        self.url = url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self.latency = LatencyStats()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._async_client = None
+
+    @classmethod
+    def from_env(cls, name, default_url):
+        prefix = name.upper()
+        return cls(
+            name,
+            os.environ.get(f"{prefix}_SEARCH_URL") or default_url,
+            connect_timeout=float(os.environ.get("SEARCH_CONNECT_TIMEOUT") or 3.05),
+            read_timeout=float(os.environ.get("SEARCH_READ_TIMEOUT") or 10),
+            retries=int(os.environ.get("SEARCH_RETRIES") or 2),
+            failure_threshold=int(os.environ.get("SEARCH_BREAKER_FAILURES") or 5),
+            reset_timeout=float(os.environ.get("SEARCH_BREAKER_RESET") or 30),
+            cache_ttl=float(os.environ.get("SEARCH_CACHE_TTL") or 300),
+        )
+
+    def _async(self):
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+        return self._async_client
+
+    def _delay(self, attempt):
+        # full jitter: anywhere between 0 and the exponential backoff
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    def _before_call(self, cache_key):
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        if not self.breaker.allow():
+            raise SearchUnavailableError(f"{self.name} search circuit is open")
+        return None
+
+    def _after_failure(self, error):
+        self.breaker.record_failure()
+        logging.warning(f"{self.name} search failed: {error}")
+        raise SearchUnavailableError(f"{self.name} search failed: {error}") from error
+
+    def get_json(self, params, cache_key):
+        """
+        GETs the provider URL and returns the decoded JSON. Raises SearchUnavailableError
+        when the circuit is open or all retries failed.
+        """
+        cached = self._before_call(cache_key)
+        if cached is not None:
+            return cached
+        error = None
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    time.sleep(self._delay(attempt - 1))
+                try:
+                    start = time.perf_counter()
+                    response = self.session.get(self.url, params=params, timeout=(self.connect_timeout, self.read_timeout))
+                    if response.status_code in RETRY_STATUS_CODES:
+                        error = requests.HTTPError(f"HTTP {response.status_code}")
+                        continue
+                    response.raise_for_status()
+                    data = response.json()
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error = e
+                    continue
+                except (requests.RequestException, ValueError) as e:
+                    # client errors, redirect loops and bad payloads will not get better by retrying
+                    error = e
+                    break
+                self.latency.record(time.perf_counter() - start)
+                self.breaker.record_success()
+                self.cache.set(cache_key, data)
+                return data
+        except Exception:
+            # unexpected error: still a failure, so a half-open trial is released
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # interrupted - not the provider's fault
+            self.breaker.release()
+            raise
+        self._after_failure(error)
+
+    async def aget_json(self, params, cache_key):
+        """
+        Async version of get_json.
+        """
+        cached = self._before_call(cache_key)
+        if cached is not None:
+            return cached
+        error = None
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    await asyncio.sleep(self._delay(attempt - 1))
+                try:
+                    start = time.perf_counter()
+                    response = await self._async().get(self.url, params=params)
+                    if response.status_code in RETRY_STATUS_CODES:
+                        error = httpx.HTTPStatusError(f"HTTP {response.status_code}", request=response.request, response=response)
+                        continue
+                    response.raise_for_status()
+                    data = response.json()
+                except (httpx.TransportError, asyncio.TimeoutError) as e:
+                    error = e
+                    continue
+                except (httpx.HTTPError, httpx.InvalidURL, ValueError) as e:
+                    error = e
+                    break
+                self.latency.record(time.perf_counter() - start)
+                self.breaker.record_success()
+                self.cache.set(cache_key, data)
+                return data
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # cancelled: the losing request of a hedged search, or a dropped speculative
+            # search. Only frees a half-open trial, the provider may well be healthy
+            self.breaker.release()
+            raise
+        self._after_failure(error)
+
+    def stats(self):
+        return {
+            "breaker": self.breaker.state,
+            "failures": self.breaker.failures,
+            "latency": self.latency.stats(),
+            "cache": self.cache.stats(),
+        }
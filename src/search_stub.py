@@ -0,0 +1,80 @@
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+class SearchStubServer:
+    """
+    Local stand-in for Google Custom Search and SerpAPI.
+
+    Answers every GET with canned results for the query, in Google format when the
+    request has a "cx" parameter and in SerpAPI format otherwise. delay and status can
+    be changed while the server runs to simulate slow or failing upstreams.
+
+    Point the app at it with GOOGLE_SEARCH_URL / SERPAPI_SEARCH_URL.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, delay=0.0, status=200):
+        self.delay = delay
+        self.status = status
+        self.request_count = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.request_count += 1
+                if stub.delay:
+                    time.sleep(stub.delay)
+                params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                query = params.get("q", "")
+                results = [
+                    {"title": f"Result {i} for {query}", "snippet": f"Snippet {i} about {query}.", "link": f"https://example.com/{i}"}
+                    for i in range(1, int(params.get("num", 3)) + 1)
+                ]
+                body = json.dumps({"items": results} if "cx" in params else {"organic_results": results}).encode("utf-8")
+                self.send_response(stub.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/search"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a stub search server for local testing.")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before answering")
+    parser.add_argument("--status", type=int, default=200, help="HTTP status to answer with")
+    args = parser.parse_args()
+    stub = SearchStubServer(port=args.port, delay=args.delay, status=args.status)
+    print(f"Stub search server on {stub.url}")
+    stub.server.serve_forever()
@@ -0,0 +1,132 @@
+import os
+import sys
+import time
+import signal
+import argparse
+import multiprocessing
+from pathlib import Path
+from types import SimpleNamespace
+from dotenv import load_dotenv
+from index_versions import migrate, run_builder
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def index_wait():
+    # how long a worker waits for the builder's first index version
+    return float(os.environ.get("SERVE_INDEX_WAIT") or 3600)
+
+
+def json_route(route):
+    # startup.health_routes handlers return (status, payload)
+    def handler():
+        from fastapi.responses import JSONResponse
+        status, payload = route()
+        return JSONResponse(payload, status)
+    return handler
+
+
+def create_app(worker=0):
+    """
+    One serving worker: the Gradio UI mounted on a FastAPI app, next to /healthz,
+    /readyz, /metrics and a JSON /api/chat endpoint. The worker never ingests; it serves
+    the version INDEX_DIR points to (memory-mapped, so the page cache is shared by all
+    workers) and follows it when the builder publishes a new one.
+    """
+    import gradio as gr
+    from fastapi import FastAPI, Body
+    from fastapi.responses import JSONResponse, PlainTextResponse
+    import app as chat_app
+    from log_sink import configure_logging
+    from metrics import registry
+    from startup import Readiness, start_background, health_routes
+
+    # one log file per worker, each rotated by its own writer thread
+    configure_logging(chat_app.RAG_DIR / f"rag_test-worker{worker}")
+    readiness = Readiness()
+    start_background(
+        readiness, chat_app.DATA_DIR, chat_app.INDEX_DIR,
+        prebuilt=True, warm_up_llm=chat_app.warm_up, index_wait=index_wait(),
+    )
+
+    api = FastAPI()
+    for path, route in health_routes(readiness).items():
+        api.add_api_route(path, json_route(route), methods=["GET"])
+
+    @api.get("/metrics")
+    def metrics():
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+    @api.post("/api/chat")
+    def chat(body: dict = Body(...)):
+        # {"message": ..., "history": [[user, assistant], ...], "session_id": ...} -> {"response": ...}
+        if not readiness.is_ready:
+            return JSONResponse({"response": chat_app.STARTING_UP_RESPONSE}, 503)
+        request = SimpleNamespace(session_hash=body.get("session_id"))
+        response = ""
+        for response in chat_app.chat_fn(body["message"], body.get("history") or [], request):
+            pass
+        return {"response": response}
+
+    return gr.mount_gradio_app(api, chat_app.build_ui(readiness), path="/")
+
+
+def run_worker(worker, host, port):
+    import uvicorn
+    uvicorn.run(create_app(worker), host=host, port=port, log_level="warning")
+
+
+def start_worker(context, worker, host, port):
+    process = context.Process(target=run_worker, args=(worker, host, port), name=f"worker-{worker}")
+    process.start()
+    print(f"Worker {worker} (pid {process.pid}) on http://{host}:{port}")
+    return process
+
+
+def set_thread_defaults(workers):
+    # split the cores between the workers instead of every worker using all of them
+    threads = str(max(1, (os.cpu_count() or 1) // workers))
+    for name in ("EMBEDDING_THREADS", "OMP_NUM_THREADS"):
+        os.environ.setdefault(name, threads)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Serve the chatbot from several worker processes sharing one index.")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("SERVE_WORKERS") or os.cpu_count() or 1))
+    parser.add_argument("--host", default=os.environ.get("SERVE_HOST") or "127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("SERVE_PORT") or 7860),
+                        help="worker i listens on port + i")
+    args = parser.parse_args()
+
+    data_dir = BASE_DIR / (os.environ.get("DATA_DIR") or "docs")
+    index_dir = BASE_DIR / (os.environ.get("INDEX_DIR") or "rag/faiss_index")
+    set_thread_defaults(args.workers)
+    migrate(index_dir)
+
+    # spawn: workers do not inherit the supervisor's threads or locks
+    context = multiprocessing.get_context("spawn")
+    builder = None
+    if os.environ.get("PREBUILT_INDEX", "").lower() not in ("1", "true", "yes"):
+        interval = float(os.environ.get("INDEX_BUILD_INTERVAL") or 0)
+        builder = context.Process(target=run_builder, args=(data_dir, index_dir, interval), name="index-builder")
+        builder.start()
+    workers = [start_worker(context, i, args.host, args.port + i) for i in range(args.workers)]
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        while True:
+            time.sleep(1)
+            for i, process in enumerate(workers):
+                if not process.is_alive():
+                    print(f"Worker {i} exited with code {process.exitcode}, restarting.")
+                    workers[i] = start_worker(context, i, args.host, args.port + i)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        for process in workers + ([builder] if builder else []):
+            if process.is_alive():
+                process.terminate()
+        for process in workers + ([builder] if builder else []):
+            process.join(timeout=10)
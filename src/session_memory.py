@@ -0,0 +1,142 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class InMemorySessionStore:
+    """
+    Conversation summaries per session, kept in this process.
+
+    Sessions are spread over independently locked shards so concurrent users do not
+    contend on one lock. Each shard is an LRU: the least recently used session is dropped
+    when the shard is full, and sessions idle for longer than idle_ttl are evicted.
+    """
+
+    def __init__(self, max_sessions=10000, idle_ttl=3600, shards=16):
+        self.idle_ttl = idle_ttl
+        self.max_per_shard = max(1, max_sessions // shards)
+        self._shards = [(OrderedDict(), threading.Lock()) for _ in range(shards)]
+
+    def _shard(self, session_id):
+        return self._shards[hash(session_id) % len(self._shards)]
+
+    def _evict_idle(self, sessions, now):
+        # oldest entries are at the front
+        while sessions:
+            _, (_, updated_at) = next(iter(sessions.items()))
+            if now - updated_at <= self.idle_ttl:
+                break
+            sessions.popitem(last=False)
+
+    def get(self, session_id):
+        sessions, lock = self._shard(session_id)
+        now = time.monotonic()
+        with lock:
+            self._evict_idle(sessions, now)
+            item = sessions.get(session_id)
+            if item is None:
+                return ""
+            sessions.move_to_end(session_id)
+            sessions[session_id] = (item[0], now)
+            return item[0]
+
+    def set(self, session_id, value):
+        sessions, lock = self._shard(session_id)
+        now = time.monotonic()
+        with lock:
+            sessions[session_id] = (value, now)
+            sessions.move_to_end(session_id)
+            self._evict_idle(sessions, now)
+            while len(sessions) > self.max_per_shard:
+                sessions.popitem(last=False)
+
+    def delete(self, session_id):
+        sessions, lock = self._shard(session_id)
+        with lock:
+            sessions.pop(session_id, None)
+
+    def __len__(self):
+        return sum(len(sessions) for sessions, _ in self._shards)
+
+
+class SQLiteSessionStore:
+    """
+    Conversation summaries per session in a SQLite file, so several worker processes
+    can share them. Each thread uses its own connection; WAL mode lets readers run
+    alongside the writer.
+    """
+
+    def __init__(self, path, max_sessions=10000, idle_ttl=3600, sweep_every=100):
+        self.path = str(path)
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.sweep_every = sweep_every
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, summary TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id):
+        row = self._connect().execute(
+            "SELECT summary FROM sessions WHERE session_id = ? AND updated_at > ?",
+            (session_id, time.time() - self.idle_ttl),
+        ).fetchone()
+        return row[0] if row else ""
+
+    def set(self, session_id, value):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO sessions (session_id, summary, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET summary = excluded.summary, updated_at = excluded.updated_at",
+                (session_id, value, time.time()),
+            )
+        self._writes += 1
+        if self._writes % self.sweep_every == 0:
+            self.sweep()
+
+    def delete(self, session_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def sweep(self):
+        # drop idle sessions, then the least recently updated ones above max_sessions
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE updated_at <= ?", (time.time() - self.idle_ttl,))
+            conn.execute(
+                "DELETE FROM sessions WHERE session_id IN ("
+                "SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,),
+            )
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+def create_session_store(backend=None, sqlite_path=None):
+    """
+    Builds the session store selected by MEMORY_BACKEND ("memory" or "sqlite").
+    """
+    backend = (backend or os.environ.get("MEMORY_BACKEND") or "memory").lower()
+    max_sessions = int(os.environ.get("MEMORY_MAX_SESSIONS") or 10000)
+    idle_ttl = float(os.environ.get("MEMORY_IDLE_TTL") or 3600)
+    if backend == "memory":
+        return InMemorySessionStore(max_sessions, idle_ttl)
+    if backend == "sqlite":
+        path = os.environ.get("MEMORY_SQLITE_PATH") or sqlite_path or "sessions.db"
+        return SQLiteSessionStore(path, max_sessions, idle_ttl)
+    raise ValueError(f"Unknown MEMORY_BACKEND: {backend}")
@@ -0,0 +1,148 @@
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+from doc_retrieve import get_retriever, INDEX_FILES
+from index_versions import is_versioned, build_version
+
+
+class Readiness:
+    """
+    Startup state shared by the background startup thread and the health endpoints.
+
+    The app is live as soon as the process serves requests, and ready once a FAISS
+    index and the embedding model are loaded. Each startup phase is timed.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phase = "starting"
+        self.error = None
+        self.timings = {}
+        self._ready = threading.Event()
+        self._phase_start = self.started_at
+
+    @property
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def set_phase(self, phase):
+        now = time.perf_counter()
+        self.timings[self.phase] = now - self._phase_start
+        self.phase = phase
+        self._phase_start = now
+
+    def mark_ready(self):
+        if not self._ready.is_set():
+            self.timings["time_to_ready"] = time.perf_counter() - self.started_at
+            self._ready.set()
+
+    def fail(self, error):
+        self.error = f"{type(error).__name__}: {error}"
+        self.set_phase("failed")
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def status(self):
+        return {
+            "ready": self.is_ready,
+            "phase": self.phase,
+            "error": self.error,
+            "uptime": round(time.perf_counter() - self.started_at, 3),
+            "timings": {name: round(seconds, 3) for name, seconds in self.timings.items()},
+        }
+
+
+def index_exists(index_dir):
+    return all((Path(index_dir) / name).exists() for name in INDEX_FILES)
+
+
+def prebuilt_index():
+    # PREBUILT_INDEX=true serves INDEX_DIR as is and never ingests at startup
+    return os.environ.get("PREBUILT_INDEX", "").lower() in ("1", "true", "yes")
+
+
+def load_index(readiness, index_dir):
+    readiness.set_phase("load_index")
+    retriever = get_retriever(index_dir)
+    retriever.get_vectorstore()
+    readiness.set_phase("embedding_warm_up")
+    # loads the embedding model and runs it once
+    retriever.embed_query("warm up")
+    readiness.mark_ready()
+
+
+def wait_for_index(readiness, index_dir, timeout, poll=0.5):
+    readiness.set_phase("wait_for_index")
+    deadline = time.monotonic() + timeout
+    while not index_exists(index_dir) and time.monotonic() < deadline:
+        time.sleep(poll)
+
+
+def run_startup(readiness, data_dir, index_dir, prebuilt=False, warm_up_llm=None, index_wait=0):
+    """
+    The slow part of startup, meant for a background thread: loads the index (an existing
+    one right away, so the app is ready while a new ingest runs), ingests changed PDFs
+    unless prebuilt is set, then warms up the LLM with warm_up_llm.
+
+    Serving workers pass prebuilt and index_wait: they wait up to index_wait seconds for
+    the builder to publish the first index version.
+    """
+    try:
+        if index_wait and not index_exists(index_dir):
+            wait_for_index(readiness, index_dir, index_wait)
+        if not Path(index_dir).exists():
+            raise FileNotFoundError(f"Index directory {index_dir} does not exist. Please check your environment variables.")
+        serving = index_exists(index_dir)
+        if prebuilt and not serving:
+            raise FileNotFoundError(f"PREBUILT_INDEX is set but there is no index in {index_dir}.")
+        if serving:
+            load_index(readiness, index_dir)
+        if not prebuilt:
+            if not Path(data_dir).exists():
+                raise FileNotFoundError(f"Data directory {data_dir} does not exist. Please check your environment variables.")
+            readiness.set_phase("ingest")
+            if is_versioned(index_dir):
+                # workers may be serving the current version - ingest into a new one
+                build_version(data_dir, index_dir)
+            else:
+                # imported here: PDF parsing and chunking are not needed to serve a prebuilt index
+                from doc_ingest import ingest_documents
+                ingest_documents(data_dir, index_dir)
+            if not serving:
+                load_index(readiness, index_dir)
+        if warm_up_llm is not None:
+            readiness.set_phase("llm_warm_up")
+            try:
+                warm_up_llm()
+            except Exception as e:
+                logging.warning(f"LLM warm-up failed: {e}")
+        readiness.set_phase("ready")
+    except Exception as e:
+        logging.error(f"Startup failed: {e}", exc_info=True)
+        # an index loaded before the failure keeps being served
+        readiness.fail(e)
+
+
+def start_background(readiness, data_dir, index_dir, prebuilt=False, warm_up_llm=None, index_wait=0):
+    thread = threading.Thread(
+        target=run_startup,
+        args=(readiness, data_dir, index_dir, prebuilt, warm_up_llm, index_wait),
+        name="startup",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+def health_routes(readiness):
+    """
+    /healthz answers 200 while the process is up; /readyz answers 200 once ready and 503
+    before (or after a startup failure without any index).
+    """
+    return {
+        "/healthz": lambda: (200, {"status": "ok"}),
+        "/readyz": lambda: (200 if readiness.is_ready else 503, readiness.status()),
+    }
@@ -0,0 +1,129 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+
+class LiveRequests:
+    """
+    Counts chat turns in flight, so background work can yield to them.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with self._lock:
+            self.count += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self.count -= 1
+
+    def busy(self):
+        return self.count > 0
+
+
+class SummaryWorker:
+    """
+    Fixed pool of threads that summarizes conversations in the background.
+
+    Only one job per session is queued: submitting again for a session that is still
+    waiting replaces its history with the newer one. The queue is bounded (the oldest job
+    is dropped when it is full) and jobs that waited longer than max_age are dropped as
+    stale. Before running a job a worker waits, up to max_defer seconds, while is_busy()
+    reports live chat traffic.
+    """
+
+    def __init__(self, summarize, workers=1, max_pending=256, max_age=120.0, is_busy=None, max_defer=5.0):
+        self.summarize = summarize
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self.is_busy = is_busy
+        self.max_defer = max_defer
+        # session_id -> (history, submitted_at), oldest first
+        self._pending = OrderedDict()
+        # sessions being summarized right now - never run two jobs of one session at once
+        self._running = set()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self.stats = {"submitted": 0, "coalesced": 0, "dropped": 0, "stale": 0, "completed": 0, "failed": 0}
+        self._threads = [
+            threading.Thread(target=self._run, name=f"summary-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @classmethod
+    def from_env(cls, summarize, is_busy=None):
+        return cls(
+            summarize,
+            workers=int(os.environ.get("SUMMARY_WORKERS") or 1),
+            max_pending=int(os.environ.get("SUMMARY_MAX_PENDING") or 256),
+            max_age=float(os.environ.get("SUMMARY_MAX_AGE") or 120),
+            is_busy=is_busy,
+        )
+
+    def submit(self, session_id, history):
+        with self._cond:
+            self.stats["submitted"] += 1
+            if session_id in self._pending:
+                self.stats["coalesced"] += 1
+            elif len(self._pending) >= self.max_pending:
+                self._pending.popitem(last=False)
+                self.stats["dropped"] += 1
+            # replacing a key keeps its place in the queue
+            self._pending[session_id] = (history, time.monotonic())
+            self._cond.notify()
+
+    def depth(self):
+        with self._cond:
+            return len(self._pending)
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _next_job(self):
+        with self._cond:
+            while not self._stopped:
+                session_id = next((s for s in self._pending if s not in self._running), None)
+                if session_id is not None:
+                    self._running.add(session_id)
+                    return session_id, self._pending.pop(session_id)
+                self._cond.wait()
+            return None
+
+    def _finish(self, session_id, outcome):
+        with self._cond:
+            self._running.discard(session_id)
+            self.stats[outcome] += 1
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            session_id, (history, submitted_at) = job
+
+            deferred_until = time.monotonic() + self.max_defer
+            while self.is_busy is not None and self.is_busy() and time.monotonic() < deferred_until:
+                time.sleep(0.05)
+
+            if time.monotonic() - submitted_at > self.max_age:
+                self._finish(session_id, "stale")
+                continue
+            try:
+                self.summarize(history, session_id)
+                self._finish(session_id, "completed")
+            except Exception:
+                logging.exception(f"Failed to update summary for session {session_id}")
+                self._finish(session_id, "failed")
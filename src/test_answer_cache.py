@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from answer_cache import AnswerCache
+
+FEE = [Document(page_content="Booking fee refunds take 14 working days.")]
+LOAN = [Document(page_content="Car loans run for up to 7 years.")]
+
+
+def vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_near_duplicate_query_hits():
+    cache = AnswerCache(max_distance=0.05)
+    cache.store(vector(1, 0), FEE, "global", 1, "14 working days.")
+    assert cache.lookup(vector(1, 0.1), FEE, "global", 1) == "14 working days."
+    assert cache.stats() == {"hits": 1, "misses": 0, "size": 1}
+
+
+def test_max_distance_cutoff():
+    cache = AnswerCache(max_distance=0.05)
+    cache.store(vector(1, 0), FEE, "global", 1, "14 working days.")
+    # cosine distance of (1, 0.3) to (1, 0) is about 0.042, of (1, 0.4) about 0.072
+    assert cache.lookup(vector(1, 0.3), FEE, "global", 1) == "14 working days."
+    assert cache.lookup(vector(1, 0.4), FEE, "global", 1) is None
+
+
+def test_max_distance_from_env(monkeypatch):
+    monkeypatch.setenv("ANSWER_CACHE_MAX_DISTANCE", "0.1")
+    cache = AnswerCache.from_env()
+    cache.store(vector(1, 0), FEE, "global", 1, "14 working days.")
+    assert cache.lookup(vector(1, 0.4), FEE, "global", 1) == "14 working days."
+
+
+def test_different_context_misses():
+    cache = AnswerCache()
+    cache.store(vector(1, 0), FEE, "global", 1, "14 working days.")
+    assert cache.lookup(vector(1, 0), LOAN, "global", 1) is None
+    assert cache.lookup(vector(1, 0), FEE + LOAN, "global", 1) is None
+
+
+def test_session_answers_stay_in_their_session():
+    cache = AnswerCache()
+    scope = AnswerCache.scope("a", "User asked about financing.")
+    cache.store(vector(1, 0), FEE, scope, 1, "As discussed, 14 working days.")
+    assert cache.lookup(vector(1, 0), FEE, scope, 1) == "As discussed, 14 working days."
+    assert cache.lookup(vector(1, 0), FEE, AnswerCache.scope("b", "User asked about financing."), 1) is None
+    assert cache.lookup(vector(1, 0), FEE, AnswerCache.scope("a", ""), 1) is None
+
+    # global answers are not shared with sessions either
+    cache.store(vector(0, 1), LOAN, AnswerCache.scope("a", ""), 1, "Up to 7 years.")
+    assert cache.lookup(vector(0, 1), LOAN, scope, 1) is None
+
+
+def test_different_summary_misses():
+    cache = AnswerCache()
+    cache.store(vector(1, 0), FEE, AnswerCache.scope("a", "User asked about financing."), 1, "14 working days.")
+    assert cache.lookup(vector(1, 0), FEE, AnswerCache.scope("a", "User asked about inspections."), 1) is None
+
+
+def test_new_index_version_flushes_the_cache():
+    cache = AnswerCache()
+    cache.store(vector(1, 0), FEE, "global", 1, "14 working days.")
+    cache.store(vector(0, 1), LOAN, "global", 1, "Up to 7 years.")
+    assert cache.lookup(vector(1, 0), FEE, "global", 2) is None
+    assert cache.stats()["size"] == 0
+    cache.store(vector(1, 0), FEE, "global", 2, "10 working days.")
+    assert cache.lookup(vector(1, 0), FEE, "global", 2) == "10 working days."
+
+
+@pytest.mark.parametrize("max_per_key", [1, 2, 3])
+def test_store_keeps_the_newest_queries_per_context(max_per_key):
+    cache = AnswerCache(max_per_key=max_per_key)
+    queries = [vector(1, 0), vector(0, 1), vector(1, 1), vector(1, -1)]
+    for i, query in enumerate(queries):
+        cache.store(query, FEE, "global", 1, f"answer {i}")
+    kept = [cache.lookup(query, FEE, "global", 1) for query in queries]
+    assert kept == [None] * (len(queries) - max_per_key) + [f"answer {i}" for i in range(len(queries) - max_per_key, len(queries))]
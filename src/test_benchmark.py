@@ -0,0 +1,46 @@
+import json
+from benchmark import check_gates, load_replay
+from llm_provider import StubLLM, stream_text
+
+
+def results(recall, retrieval_p95, generation_p95):
+    return {
+        "recall_at_k": recall,
+        "stages": {"retrieval": {"p95": retrieval_p95}, "generation": {"p95": generation_p95}, "ingest": None},
+    }
+
+
+def test_gates_pass_within_tolerance():
+    baseline = results(0.9, 10.0, 100.0)
+    assert check_gates(results(0.9, 12.0, 120.0), baseline) == []
+    # tiny stages get an absolute slack
+    assert check_gates(results(0.9, 0.5, 100.0), results(0.9, 0.2, 100.0)) == []
+
+
+def test_gates_fail_on_recall_drop_and_slowdown():
+    failures = check_gates(results(0.8, 20.0, 100.0), results(0.9, 10.0, 100.0))
+    assert len(failures) == 2
+    assert failures[0].startswith("recall@k dropped")
+    assert failures[1].startswith("retrieval p95")
+    assert check_gates(results(0.85, 10.0, 100.0), results(0.9, 10.0, 100.0), max_recall_drop=0.1) == []
+
+
+def test_load_replay_reads_jsonl_and_app_logs(tmp_path):
+    path = tmp_path / "chat.log"
+    path.write_text("\n".join([
+        json.dumps({"question": "What is the booking fee?", "expected": "Booking Fee"}),
+        '2025-06-01 10:00:00,000 [INFO] ' + json.dumps({"query": "Can I cancel?", "response": "Yes"}),
+        "2025-06-01 10:00:01,000 [WARNING] LLM warm-up failed: {oops",
+        json.dumps(["not", "a", "record"]),
+    ]), encoding="utf-8")
+    assert load_replay(path) == [
+        {"question": "What is the booking fee?", "expected": "Booking Fee"},
+        {"question": "Can I cancel?", "expected": None},
+    ]
+
+
+def test_stub_llm_streams_the_same_answer():
+    llm = StubLLM("Stub answer from FAQ.")
+    assert "".join(stream_text(llm, [])) == "Stub answer from FAQ."
+    assert llm.invoke([]) == "Stub answer from FAQ."
+    assert llm.calls == 2
@@ -0,0 +1,32 @@
+from bm25_index import BM25Index, tokenize, reciprocal_rank_fusion
+
+
+def test_tokenize_keeps_compound_terms_and_their_parts():
+    assert tokenize("What is the Cooling-off period in PART B1, clause 1.2?") == [
+        "cooling-off", "cooling", "off", "period", "part", "b1", "clause", "1.2", "1", "2",
+    ]
+
+
+def test_search_ranks_rare_terms_higher():
+    index = BM25Index.build(
+        ["a", "b", "c"],
+        ["vehicle inspection report", "vehicle delivery", "vehicle cooling-off period"],
+    )
+    results = index.search("cooling-off for my vehicle", 3)
+    assert [id_ for id_, _ in results][0] == "c"
+    assert index.search("weather in paris", 3) == []
+    assert len(index.search("vehicle", 2)) == 2
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = BM25Index.build(["a", "b"], ["booking fee refund", "deposit within seven days"])
+    path = tmp_path / "bm25.npz"
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert len(loaded) == 2
+    assert loaded.search("refund of the booking fee", 2) == index.search("refund of the booking fee", 2)
+
+
+def test_reciprocal_rank_fusion_prefers_ids_in_both_lists():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]])
+    assert [id_ for id_, _ in fused] == ["c", "a", "b", "d"]
@@ -0,0 +1,28 @@
+from langchain_core.documents import Document
+from chunk_store import ChunkStore, write_chunk_store
+
+
+DOCS = [
+    Document(id="b", page_content="[PART B1]\nSelling your used vehicle", metadata={"source": "terms.pdf", "level1_title": "PART B1"}),
+    Document(id="a", page_content="Délivrance – 5-Day Period", metadata={"source": "terms.pdf", "type": "toc"}),
+    Document(id="c", page_content="", metadata={}),
+]
+
+
+def test_round_trip_keeps_order_text_and_metadata(tmp_path):
+    write_chunk_store(tmp_path, DOCS)
+    store = ChunkStore(tmp_path)
+
+    assert len(store) == 3
+    assert list(store.documents()) == DOCS
+    assert dict(store.index_to_docstore_id()) == {0: "b", 1: "a", 2: "c"}
+    # one dictionary entry per distinct value
+    assert store.values[store.keys.index("source")] == ["terms.pdf"]
+
+
+def test_search_by_id(tmp_path):
+    write_chunk_store(tmp_path, DOCS)
+    store = ChunkStore(tmp_path)
+
+    assert store.search("a") == DOCS[1]
+    assert store.search("missing") == "ID missing not found."
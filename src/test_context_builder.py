@@ -0,0 +1,64 @@
+from langchain_core.documents import Document
+from doc_ingest import sliding_chunk_with_metadata_delimiter
+from context_builder import build_rag_context, estimate_tokens, merge_section_chunks, split_title
+
+
+SECTION = {"source": "terms.pdf", "level1_title": "Carro Services", "level2_title": "PART A:", "level3_title": ""}
+SENTENCES = [f"Clause {i} says that the buyer may cancel the purchase within {i} days of delivery." for i in range(20)]
+
+
+def section_chunks(chunk_overlap=100):
+    doc = Document(page_content=" ".join(SENTENCES), metadata=SECTION)
+    return sliding_chunk_with_metadata_delimiter([doc], chunk_size=300, chunk_overlap=chunk_overlap)
+
+
+def test_overlapping_chunks_of_a_section_are_merged():
+    chunks = section_chunks()
+    assert len(chunks) > 2
+    # retrieval order is not text order
+    merged = merge_section_chunks([chunks[1], chunks[0], chunks[2]])
+    assert len(merged) == 1
+    body = merged[0].page_content
+    assert body.startswith("[Carro Services | PART A:]\n")
+    for sentence in SENTENCES[:6]:
+        assert body.count(sentence) == 1
+
+
+def test_neighbouring_chunks_without_overlap_are_merged():
+    chunks = section_chunks(chunk_overlap=0)
+    assert [doc.metadata["chunk_index"] for doc in chunks] == list(range(len(chunks)))
+    merged = merge_section_chunks([chunks[2], chunks[0], chunks[1]])
+    assert len(merged) == 1
+    body = merged[0].page_content
+    assert body.count("[Carro Services | PART A:]") == 1
+    # reading order, and the split points read like the source text
+    assert body == "[Carro Services | PART A:]\n" + " ".join(SENTENCES[:9]).rstrip(".")
+
+
+def test_all_chunks_of_a_section_share_one_prefix():
+    chunks = section_chunks()
+    # chunks 4 and 5 overlap and are joined; the gap after chunk 0 becomes a line break
+    merged = merge_section_chunks([chunks[4], chunks[0], chunks[5]])
+    assert len(merged) == 1
+    prefix, body = merged[0].page_content.split("\n", 1)
+    assert prefix == "[Carro Services | PART A:]"
+    assert body.index(SENTENCES[0]) < body.index("\n") < body.index(split_title(chunks[4].page_content)[1][:40])
+    assert merged[0].id == chunks[4].id and merged[0].metadata == chunks[4].metadata
+
+
+def test_duplicates_and_other_sections_are_kept_apart():
+    chunks = section_chunks()
+    other = Document(page_content=chunks[1].page_content, metadata={**SECTION, "level2_title": "PART B:"})
+    merged = merge_section_chunks([chunks[0], chunks[0], other])
+    assert [doc.metadata["level2_title"] for doc in merged] == ["PART A:", "PART B:"]
+
+
+def test_chunks_are_packed_in_rank_order_within_budget():
+    docs = [
+        Document(page_content="a" * 400, metadata={"level1_title": "A"}),
+        Document(page_content="b" * 400, metadata={"level1_title": "B"}),
+        Document(page_content="c" * 40, metadata={"level1_title": "C"}),
+    ]
+    context, packed = build_rag_context(docs, token_budget=150)
+    assert [doc.page_content[0] for doc in packed] == ["a", "c"]
+    assert estimate_tokens(context) <= 150
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+import doc_retrieve
+from doc_ingest import save_vectorstore
+from embedding_backend import OnnxEmbeddings, check_embedding_parity, create_embeddings, quantize_model, PARITY_TEXTS
+
+onnx = pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("tokenizers")
+
+WORDS = "how do i get my booking fee refunded what documents need for a test drive car".split()
+VOCAB = ["[PAD]", "[UNK]", "[CLS]", "[SEP]"] + WORDS + sorted({w for w in " ".join(PARITY_TEXTS).lower().replace("?", " ? ").replace(".", " . ").split()} - set(WORDS))
+
+
+def write_tokenizer(path):
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers, processors
+    tokenizer = Tokenizer(models.WordPiece({token: i for i, token in enumerate(VOCAB)}, unk_token="[UNK]"))
+    tokenizer.normalizer = normalizers.BertNormalizer(lowercase=True)
+    tokenizer.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="[CLS] $A [SEP]", special_tokens=[("[CLS]", 2), ("[SEP]", 3)]
+    )
+    tokenizer.save(str(path))
+
+
+def write_model(path, seed=0, dim=16):
+    # token embedding lookup and a dense layer: last_hidden_state = E[input_ids] @ W
+    from onnx import helper, numpy_helper, TensorProto
+    rng = np.random.default_rng(seed)
+    table = rng.normal(size=(len(VOCAB), dim)).astype(np.float32)
+    weight = rng.normal(size=(dim, dim)).astype(np.float32)
+    graph = helper.make_graph(
+        [helper.make_node("Gather", ["table", "input_ids"], ["tokens"]),
+         helper.make_node("MatMul", ["tokens", "weight"], ["last_hidden_state"])],
+        "tiny-encoder",
+        [helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "seq"]),
+         helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["batch", "seq"])],
+        [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["batch", "seq", dim])],
+        [numpy_helper.from_array(table, "table"), numpy_helper.from_array(weight, "weight")],
+    )
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)], ir_version=8), str(path))
+    return table @ weight
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    write_tokenizer(tmp_path / "tokenizer.json")
+    hidden = write_model(tmp_path / "model.onnx")
+    return tmp_path, hidden
+
+
+def reference(hidden, text):
+    ids = [2] + [VOCAB.index(w) for w in text.lower().split()] + [3]
+    pooled = hidden[ids].mean(axis=0)
+    return pooled / np.linalg.norm(pooled)
+
+
+def test_mean_pooling_ignores_padding(model_dir):
+    path, hidden = model_dir
+    embeddings = OnnxEmbeddings(path / "model.onnx", path / "tokenizer.json", threads=1, batch_size=2)
+    texts = ["booking fee", "how do i get my booking fee refunded", "test drive", "car"]
+    vectors = np.array(embeddings.embed_documents(texts))
+
+    for text, vector in zip(texts, vectors):
+        assert np.allclose(vector, reference(hidden, text), atol=1e-5)
+        assert np.allclose(embeddings.embed_query(text), vector, atol=1e-5)
+    assert embeddings.session.get_session_options().intra_op_num_threads == 1
+
+
+def test_backend_from_env(model_dir, monkeypatch):
+    path, _ = model_dir
+    quantize_model(path / "model.onnx", path / "model_int8.onnx")
+    monkeypatch.setenv("EMBEDDING_ONNX_DIR", str(path))
+    monkeypatch.setenv("EMBEDDING_BACKEND", "onnx_int8")
+    monkeypatch.setenv("EMBEDDING_THREADS", "2")
+    embeddings = create_embeddings("tiny")
+    assert embeddings.backend == "onnx_int8"
+    assert embeddings.session.get_session_options().intra_op_num_threads == 2
+    assert (path / "model_int8.onnx").stat().st_size < (path / "model.onnx").stat().st_size
+
+    monkeypatch.setenv("EMBEDDING_BACKEND", "tensorflow")
+    with pytest.raises(ValueError):
+        create_embeddings("tiny")
+
+
+def test_int8_model_passes_the_parity_check(model_dir):
+    path, _ = model_dir
+    quantize_model(path / "model.onnx", path / "model_int8.onnx")
+    fp32 = OnnxEmbeddings(path / "model.onnx", path / "tokenizer.json")
+    int8 = OnnxEmbeddings(path / "model_int8.onnx", path / "tokenizer.json", backend="onnx_int8")
+    index = FAISS.from_documents([Document(page_content=t) for t in ("booking fee", "test drive")], fp32)
+    save_vectorstore(index, path)
+
+    assert check_embedding_parity(path, fp32) > 0.999
+    assert check_embedding_parity(path, int8) >= 0.98
+
+
+def test_parity_check_rejects_a_different_model(model_dir, monkeypatch):
+    path, _ = model_dir
+    write_model(path / "other.onnx", seed=1)
+    index = FAISS.from_documents([Document(page_content="booking fee")], OnnxEmbeddings(path / "model.onnx", path / "tokenizer.json"))
+    save_vectorstore(index, path)
+
+    other = OnnxEmbeddings(path / "other.onnx", path / "tokenizer.json")
+    with pytest.raises(RuntimeError, match="do not match"):
+        check_embedding_parity(path, other)
+    with pytest.raises(RuntimeError, match="dim 16"):
+        check_embedding_parity(path, DeterministicFakeEmbedding(size=32))
+
+    # the retriever refuses to serve the index with the wrong query model
+    monkeypatch.setattr(doc_retrieve, "_embeddings", other)
+    with pytest.raises(RuntimeError):
+        doc_retrieve.Retriever(path).retrieve("booking fee", k=1, threshold=10)
+
+
+def test_indexes_without_probe_vectors_are_not_checked(tmp_path):
+    assert check_embedding_parity(tmp_path, DeterministicFakeEmbedding(size=32)) is None
@@ -0,0 +1,149 @@
+import os
+import shutil
+import pytest
+from pathlib import Path
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+import doc_retrieve
+import index_versions
+from doc_ingest import save_vectorstore
+from index_versions import build_version, current_version, list_versions, migrate, new_version, prune_versions, publish
+
+
+PDF_PATH = next((Path(__file__).resolve().parent.parent / "docs").glob("*.pdf"))
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    fake = DeterministicFakeEmbedding(size=32)
+    monkeypatch.setattr(doc_retrieve, "_embeddings", fake)
+    return fake
+
+
+def save_index(index_dir, embeddings, texts):
+    os.makedirs(index_dir, exist_ok=True)
+    save_vectorstore(FAISS.from_documents([Document(page_content=t) for t in texts], embeddings), index_dir)
+
+
+def test_retriever_follows_the_published_version(tmp_path, embeddings):
+    index_dir = tmp_path / "index"
+    save_index(index_dir, embeddings, ["booking fee refund"])
+    migrate(index_dir)
+    assert index_dir.is_symlink() and len(list_versions(index_dir)) == 1
+
+    retriever = doc_retrieve.get_retriever(index_dir)
+    docs = [doc.page_content for doc, _ in retriever.retrieve("booking fee refund", k=5, threshold=10)]
+    assert docs == ["booking fee refund"] and retriever.version == 1
+
+    version_dir = new_version(index_dir)
+    save_index(version_dir, embeddings, ["booking fee refund", "test drive documents"])
+    publish(index_dir, version_dir)
+    assert current_version(index_dir) == version_dir
+
+    docs = [doc.page_content for doc, _ in retriever.retrieve("test drive documents", k=5, threshold=10)]
+    assert "test drive documents" in docs and retriever.version == 2
+    assert retriever.stats()["embedding_parity"] == pytest.approx(1.0)
+
+
+def test_new_version_links_index_files_and_shares_the_cache(tmp_path, embeddings):
+    index_dir = tmp_path / "index"
+    save_index(index_dir, embeddings, ["booking fee refund"])
+    (index_dir / "embedding_cache").mkdir()
+    (index_dir / "embedding_cache" / "vectors.f32").write_bytes(b"\0" * 8)
+    migrate(index_dir)
+
+    current = current_version(index_dir)
+    version_dir = new_version(index_dir)
+    assert os.stat(version_dir / "index.faiss").st_ino == os.stat(current / "index.faiss").st_ino
+    # the migrated version's cache became the shared one; both versions link to it
+    for version in (current, version_dir):
+        assert (version / "embedding_cache").is_symlink()
+        assert (version / "embedding_cache").resolve() == (tmp_path / "index.versions" / ".embedding_cache").resolve()
+    assert (version_dir / "embedding_cache" / "vectors.f32").read_bytes() == b"\0" * 8
+    assert list_versions(index_dir) == sorted([current, version_dir])
+
+    # removing a version leaves the shared cache alone
+    prune_versions(index_dir, keep=1)
+    assert (tmp_path / "index.versions" / ".embedding_cache" / "vectors.f32").exists()
+
+
+def test_prune_keeps_the_newest_and_the_current_version(tmp_path, embeddings):
+    index_dir = tmp_path / "index"
+    versions = []
+    for i in range(4):
+        version_dir = new_version(index_dir)
+        # names are timestamps; make them sort in creation order
+        versions.append(version_dir.rename(version_dir.with_name(f"v{i}")))
+    publish(index_dir, versions[0])
+
+    prune_versions(index_dir, keep=2)
+    assert list_versions(index_dir) == [versions[0], versions[2], versions[3]]
+
+
+def test_unchanged_pdfs_publish_nothing(tmp_path, embeddings, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    shutil.copy(PDF_PATH, data_dir / "terms.pdf")
+    index_dir = tmp_path / "index"
+
+    first = build_version(data_dir, index_dir)
+    assert current_version(index_dir) == first
+
+    # decided from the current version's manifest, without seeding a new version
+    monkeypatch.setattr(index_versions, "new_version", lambda *args: pytest.fail("new version created"))
+    assert build_version(data_dir, index_dir) is None
+    assert list_versions(index_dir) == [first]
+
+    # an added or removed PDF publishes a new version
+    monkeypatch.undo()
+    monkeypatch.setattr(doc_retrieve, "_embeddings", embeddings)
+    shutil.copy(PDF_PATH, data_dir / "terms-copy.pdf")
+    second = build_version(data_dir, index_dir)
+    assert second is not None and current_version(index_dir) == second
+    (data_dir / "terms-copy.pdf").unlink()
+    assert build_version(data_dir, index_dir) is not None
+
+
+def test_version_failing_the_parity_check_is_not_reloaded(tmp_path, embeddings, monkeypatch):
+    index_dir = tmp_path / "index"
+    save_index(index_dir, embeddings, ["booking fee refund"])
+    migrate(index_dir)
+    retriever = doc_retrieve.get_retriever(index_dir)
+    assert retriever.retrieve("booking fee refund", k=5, threshold=10) and retriever.version == 1
+
+    # built with other embeddings: the probes stored with the index do not match
+    version_dir = new_version(index_dir)
+    save_index(version_dir, DeterministicFakeEmbedding(size=16), ["test drive documents"])
+    publish(index_dir, version_dir)
+    loads = []
+    load_vectorstore = doc_retrieve.load_vectorstore
+    monkeypatch.setattr(doc_retrieve, "load_vectorstore", lambda *args, **kwargs: loads.append(args) or load_vectorstore(*args, **kwargs))
+    for _ in range(2):
+        retriever.result_cache.clear()
+        docs = [doc.page_content for doc, _ in retriever.retrieve("booking fee refund", k=5, threshold=10)]
+        assert docs == ["booking fee refund"] and retriever.version == 1
+    assert len(loads) == 1
+
+    # version names are per second; any directory in the versions folder will do
+    version_dir = version_dir.with_name(f"{version_dir.name}-rebuilt")
+    save_index(version_dir, embeddings, ["test drive documents"])
+    publish(index_dir, version_dir)
+    docs = [doc.page_content for doc, _ in retriever.retrieve("test drive documents", k=5, threshold=10)]
+    assert docs == ["test drive documents"] and retriever.version == 2
+
+
+def test_failed_first_load_is_not_retried_until_the_files_change(tmp_path, embeddings, monkeypatch):
+    index_dir = tmp_path / "index"
+    save_index(index_dir, DeterministicFakeEmbedding(size=16), ["booking fee refund"])
+    retriever = doc_retrieve.get_retriever(index_dir)
+    loads = []
+    load_vectorstore = doc_retrieve.load_vectorstore
+    monkeypatch.setattr(doc_retrieve, "load_vectorstore", lambda *args, **kwargs: loads.append(args) or load_vectorstore(*args, **kwargs))
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            retriever.retrieve("booking fee refund", k=5, threshold=10)
+    assert len(loads) == 1
+
+    save_index(index_dir, embeddings, ["booking fee refund"])
+    assert retriever.retrieve("booking fee refund", k=5, threshold=10)
@@ -0,0 +1,232 @@
+import re
+import json
+import shutil
+import pytest
+from pathlib import Path
+from langchain_core.embeddings import DeterministicFakeEmbedding
+import doc_retrieve
+from doc_ingest import ingest_documents, open_embedding_cache, load_manifest, load_pdf_docs, chunk_lines, clean_lines, chunk_pdf_text_to_docs
+from doc_retrieve import load_vectorstore
+from bm25_index import BM25Index, LEXICAL_INDEX_FILE
+from ann_index import load_index_meta
+from embedding_cache import EmbeddingCache
+
+
+PDF_PATH = next((Path(__file__).resolve().parent.parent / "docs").glob("*.pdf"))
+# load_pdf_docs output of the previous (whole-text) chunker on PDF_PATH
+GOLDEN_CHUNKS = Path(__file__).resolve().parent / "test_data" / "golden_chunks.json"
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    embedded: int = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    fake = CountingEmbedding(size=32)
+    monkeypatch.setattr(doc_retrieve, "_embeddings", fake)
+    return fake
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    data_dir = tmp_path / "data"
+    index_dir = tmp_path / "index"
+    data_dir.mkdir()
+    index_dir.mkdir()
+    shutil.copy(PDF_PATH, data_dir / "terms.pdf")
+    return data_dir, index_dir
+
+
+def test_chunker_matches_golden_output():
+    with open(GOLDEN_CHUNKS, "r", encoding="utf-8") as f:
+        golden = json.load(f)
+    docs = load_pdf_docs(PDF_PATH)
+    assert [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs] == golden
+
+
+def whole_text_clean_lines(text):
+    # clean_text before pages were streamed line by line
+    text = re.sub(r'https?://\S+', '', text)
+    text = re.sub(r'^\s*\d+\s*\/\d+$', '', text, flags=re.MULTILINE)
+    text = re.sub(r'\d{1,2}/\d{1,2}/\d{2,4},\s*\d{1,2}:\d{2}\s*(AM|PM)?', '', text)
+    text = re.sub(r'Carro Malaysia Terms of Use', '', text, flags=re.IGNORECASE)
+    return [line.strip() for line in text.split("\n") if line.strip()]
+
+
+def test_streamed_pages_chunk_like_joined_text():
+    pages = [
+        "Carro Services Overview\nThese Carro Services T&C comprises of:-\n1. Part A : data;\n2. Part B1 : selling;",
+        "https://carro.co/my/en/terms 1/47\n5/19/25, 1:57 PM Carro Malaysia Terms of Use\nPART B1:\n1. Inspection",
+        "We shall conduct a physical inspection of Your Used Vehicle and collect details and photographs.\n"
+        "a. at any one of Our outlets during Our operating hours, subject always to Our availability.\n12/47",
+        # time stamps split across lines and across pages
+        "b. by appointment at Your premises 6/2/25,\n\n9:05 AM within Klang Valley.\nc. as agreed with Us 6/2/25,",
+        "9:05 AM\n2. Valuation\nThe price is valid for 7 days from 1/2/25, unless stated otherwise.",
+    ]
+    streamed = list(chunk_lines(clean_lines(pages)))
+    assert streamed == chunk_pdf_text_to_docs("\n".join(pages))
+    assert streamed[0].metadata == {"type": "toc", "level1_title": "Carro Services Overview"}
+    content = " ".join(doc.page_content for doc in streamed)
+    assert "physical inspection" in content
+    assert not any(noise in content for noise in ("carro.co", "1/47", "1:57", "Terms of Use", "12/47", "6/2/25", "9:05"))
+    # a date without a time is kept
+    assert "valid for 7 days from 1/2/25, unless stated otherwise." in content
+    # same lines as the previous whole-text cleaning, whose \s* spanned line breaks
+    assert list(clean_lines(pages)) == whole_text_clean_lines("\n".join(pages))
+
+
+def test_unchanged_corpus_skips_ingestion(dirs, embeddings):
+    data_dir, index_dir = dirs
+    assert ingest_documents(data_dir, index_dir)
+    embedded = embeddings.embedded
+    assert embedded > 0
+
+    assert not ingest_documents(data_dir, index_dir)
+    assert embeddings.embedded == embedded
+
+
+def test_lexical_index_matches_vectorstore(dirs, embeddings):
+    data_dir, index_dir = dirs
+    ingest_documents(data_dir, index_dir)
+    vectorstore = load_vectorstore(index_dir)
+    bm25 = BM25Index.load(index_dir / LEXICAL_INDEX_FILE)
+    assert bm25.doc_ids == [vectorstore.index_to_docstore_id[i] for i in range(vectorstore.index.ntotal)]
+
+    # indexes from before the BM25 index get one on the next run
+    (index_dir / LEXICAL_INDEX_FILE).unlink()
+    assert not ingest_documents(data_dir, index_dir)
+    assert len(BM25Index.load(index_dir / LEXICAL_INDEX_FILE)) == vectorstore.index.ntotal
+
+
+def test_added_and_deleted_files_update_index(dirs, embeddings):
+    data_dir, index_dir = dirs
+    ingest_documents(data_dir, index_dir)
+    total = load_vectorstore(index_dir).index.ntotal
+    embedded = embeddings.embedded
+
+    shutil.copy(PDF_PATH, data_dir / "terms_copy.pdf")
+    assert ingest_documents(data_dir, index_dir)
+    # the copy has the same chunk texts, so its vectors come from the embedding cache
+    assert embeddings.embedded == embedded
+    assert load_vectorstore(index_dir).index.ntotal == 2 * total
+
+    (data_dir / "terms.pdf").unlink()
+    assert ingest_documents(data_dir, index_dir)
+    assert embeddings.embedded == embedded
+    vectorstore = load_vectorstore(index_dir)
+    assert vectorstore.index.ntotal == total
+    assert {doc.metadata["source"] for doc in vectorstore.docstore._dict.values()} == {"terms_copy.pdf"}
+    assert list(load_manifest(index_dir)["files"]) == ["terms_copy.pdf"]
+
+
+def test_parallel_ingest_reports_broken_files(dirs, embeddings):
+    data_dir, index_dir = dirs
+    shutil.copy(PDF_PATH, data_dir / "terms_copy.pdf")
+    (data_dir / "broken.pdf").write_bytes(b"not a pdf")
+
+    assert ingest_documents(data_dir, index_dir, workers=2)
+    vectorstore = load_vectorstore(index_dir)
+    assert {doc.metadata["source"] for doc in vectorstore.docstore._dict.values()} == {"terms.pdf", "terms_copy.pdf"}
+    # the broken file is not recorded, so it is retried next time
+    assert sorted(load_manifest(index_dir)["files"]) == ["terms.pdf", "terms_copy.pdf"]
+
+
+def test_forced_rebuild_reuses_cached_embeddings(dirs, embeddings):
+    data_dir, index_dir = dirs
+    ingest_documents(data_dir, index_dir)
+    embedded = embeddings.embedded
+    query = load_vectorstore(index_dir).similarity_search("cooling-off period", k=3)
+
+    assert ingest_documents(data_dir, index_dir, force=True)
+    assert embeddings.embedded == embedded
+    assert load_vectorstore(index_dir).similarity_search("cooling-off period", k=3) == query
+
+
+def test_embedding_cache_is_per_backend(tmp_path):
+    texts = ["Booking fee refunds take 14 working days.", "Car loans run for up to 7 years."]
+    embeddings = CountingEmbedding(size=32)
+    EmbeddingCache(tmp_path, "all-MiniLM-L6-v2", "onnx").embed(texts, embeddings)
+    assert embeddings.embedded == 2
+
+    # the int8 model gives slightly different vectors: nothing is reused
+    cache = EmbeddingCache(tmp_path, "all-MiniLM-L6-v2", "onnx_int8")
+    assert cache.key(texts[0]) != EmbeddingCache(tmp_path / "other", "all-MiniLM-L6-v2", "onnx").key(texts[0])
+    cache.embed(texts, embeddings)
+    assert (cache.hits, cache.misses) == (0, 2) and embeddings.embedded == 4
+
+    cache = EmbeddingCache(tmp_path, "all-MiniLM-L6-v2", "onnx_int8")
+    cache.embed(texts, embeddings)
+    assert (cache.hits, cache.misses) == (2, 0)
+
+
+def test_compacted_embedding_cache_keeps_live_vectors(tmp_path):
+    texts = ["Booking fee refunds take 14 working days.", "Car loans run for up to 7 years.", "Inspections are free."]
+    embeddings = CountingEmbedding(size=32)
+    cache = EmbeddingCache(tmp_path, "all-MiniLM-L6-v2", "onnx")
+    vectors = cache.embed(texts, embeddings)
+    assert cache.compact(cache.key(text) for text in texts[1:]) == 1
+
+    cache = EmbeddingCache(tmp_path, "all-MiniLM-L6-v2", "onnx")
+    assert (cache.embed(texts[1:], embeddings) == vectors[1:]).all()
+    assert (cache.hits, cache.misses) == (2, 0)
+    cache.embed(texts[:1], embeddings)
+    assert cache.misses == 1
+
+
+def test_cache_without_meta_is_discarded(tmp_path):
+    cache = EmbeddingCache(tmp_path, "all-MiniLM-L6-v2")
+    cache.embed(["Inspections are free."], CountingEmbedding(size=32))
+    # a compaction interrupted before meta.json was written back
+    (tmp_path / "meta.json").unlink()
+    cache = EmbeddingCache(tmp_path, "all-MiniLM-L6-v2")
+    assert cache.rows == {} and not (tmp_path / "vectors.f32").exists()
+
+
+def test_ingest_drops_unused_cached_vectors(dirs, embeddings):
+    data_dir, index_dir = dirs
+    ingest_documents(data_dir, index_dir)
+    cache = open_embedding_cache(index_dir, embeddings)
+    live = len(cache.rows)
+    cache.embed(["A clause that was edited away."], embeddings)
+
+    assert ingest_documents(data_dir, index_dir, force=True)
+    cache = open_embedding_cache(index_dir, embeddings)
+    assert len(cache.rows) == live
+    texts = {doc.page_content for doc in load_vectorstore(index_dir).docstore._dict.values()}
+    assert set(cache.rows) == {cache.key(text) for text in texts}
+
+
+@pytest.mark.parametrize("index_type", ["ivf_flat", "ivf_pq", "hnsw"])
+def test_ann_index_is_rebuilt_on_deletion(dirs, embeddings, monkeypatch, index_type):
+    data_dir, index_dir = dirs
+    monkeypatch.setenv("FAISS_INDEX_TYPE", index_type)
+    shutil.copy(PDF_PATH, data_dir / "terms_copy.pdf")
+    ingest_documents(data_dir, index_dir)
+    meta = load_index_meta(index_dir)
+    assert meta["index_type"] == index_type
+    total = meta["ntotal"]
+
+    (data_dir / "terms.pdf").unlink()
+    assert ingest_documents(data_dir, index_dir)
+    vectorstore = load_vectorstore(index_dir, mmap=True)
+    assert vectorstore.index.ntotal == total // 2
+    assert load_index_meta(index_dir)["index_type"] == index_type
+    assert {doc.metadata["source"] for doc, _ in vectorstore.similarity_search_with_score("cooling-off period", k=5)} == {"terms_copy.pdf"}
+
+
+def test_changing_index_type_rebuilds_from_cache(dirs, embeddings, monkeypatch):
+    data_dir, index_dir = dirs
+    ingest_documents(data_dir, index_dir)
+    embedded = embeddings.embedded
+    assert load_index_meta(index_dir)["index_type"] == "flat"
+
+    monkeypatch.setenv("FAISS_INDEX_TYPE", "hnsw")
+    assert ingest_documents(data_dir, index_dir)
+    assert embeddings.embedded == embedded
+    assert load_index_meta(index_dir)["index_type"] == "hnsw"
+    assert not ingest_documents(data_dir, index_dir)
@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import pytest
+from langchain_core.messages import AIMessageChunk
+import llm_provider
+from llm_provider import StubLLM, get_llm, get_provider, message_text, stream_text, astream_text
+
+
+class ChunkLLM:
+    """
+    Streams fixed chunks, like a chat model (message chunks) or a completion model (strings).
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def stream(self, messages):
+        yield from self.chunks
+
+    async def astream(self, messages):
+        for chunk in self.chunks:
+            await asyncio.sleep(0)
+            yield chunk
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    created = []
+
+    def factory(name):
+        def create():
+            created.append(name)
+            return StubLLM(f"{name} answer")
+        return create
+
+    monkeypatch.setattr(llm_provider, "_llms", {})
+    monkeypatch.setattr(llm_provider, "FACTORIES", {name: factory(name) for name in ("ollama", "stub")})
+    return created
+
+
+def test_one_client_per_provider(registry, monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "Stub")
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(get_llm())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(client) for client in clients}) == 1
+    assert get_llm("ollama") is not clients[0]
+    assert registry == ["stub", "ollama"]
+
+
+def test_default_provider_is_ollama(monkeypatch):
+    monkeypatch.delenv("LLM_PROVIDER", raising=False)
+    assert get_provider() == "ollama"
+
+
+def test_unknown_provider_is_rejected(registry, monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "llamacpp")
+    with pytest.raises(ValueError, match="Unknown LLM_PROVIDER: llamacpp"):
+        get_llm()
+    assert registry == []
+
+
+def test_message_text():
+    assert message_text("plain completion") == "plain completion"
+    assert message_text(AIMessageChunk(content="chat chunk")) == "chat chunk"
+    assert message_text(AIMessageChunk(content="")) == ""
+
+
+@pytest.mark.parametrize("chunks", [
+    ["Refunds", "", " take", " 14 days."],
+    [AIMessageChunk(content=text) for text in ("Refunds", "", " take", " 14 days.")],
+])
+def test_stream_text_skips_empty_chunks(chunks):
+    assert list(stream_text(ChunkLLM(chunks), [])) == ["Refunds", " take", " 14 days."]
+
+    async def collect():
+        return [text async for text in astream_text(ChunkLLM(chunks), [])]
+    assert asyncio.run(collect()) == ["Refunds", " take", " 14 days."]
+
+
+def test_stub_llm_streams_word_by_word():
+    llm = StubLLM("one two three")
+    assert list(stream_text(llm, [])) == ["one", " two", " three"]
+    assert llm.calls == 1
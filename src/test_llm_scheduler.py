@@ -0,0 +1,96 @@
+import time
+import asyncio
+import threading
+import pytest
+from llm_scheduler import GenerationScheduler, SchedulerBusyError, CHAT, SUMMARY
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def start_waiter(scheduler, session_id, priority, order):
+    def run():
+        with scheduler.slot(session_id, priority):
+            order.append((session_id, priority))
+
+    thread = threading.Thread(target=run)
+    expected = scheduler.waiting + 1
+    thread.start()
+    wait_for(lambda: scheduler.waiting == expected)
+    return thread
+
+
+def test_chat_before_summaries_and_idle_sessions_first():
+    scheduler = GenerationScheduler(slots=2)
+    order = []
+    with scheduler.slot("a"):
+        with scheduler.slot("x"):
+            threads = [
+                start_waiter(scheduler, "c", SUMMARY, order),
+                start_waiter(scheduler, "a", CHAT, order),
+                start_waiter(scheduler, "b", CHAT, order),
+            ]
+        # one slot free while "a" still generates: "b" goes first
+        wait_for(lambda: len(order) >= 2)
+    for thread in threads:
+        thread.join()
+    assert order == [("b", CHAT), ("a", CHAT), ("c", SUMMARY)]
+    assert scheduler.stats() == {"slots": 2, "active": 0, "waiting": 0}
+
+
+def test_queue_wait_is_bounded():
+    scheduler = GenerationScheduler(slots=1, max_queue_wait=0.05)
+    with scheduler.slot("a"):
+        start = time.monotonic()
+        with pytest.raises(SchedulerBusyError):
+            with scheduler.slot("b"):
+                pass
+        assert time.monotonic() - start < 1
+    assert scheduler.stats() == {"slots": 1, "active": 0, "waiting": 0}
+
+
+def test_async_slots_share_the_queue_with_threads():
+    scheduler = GenerationScheduler(slots=1, max_queue_wait=2)
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with scheduler.slot("thread"):
+            held.set()
+            release.wait()
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    held.wait()
+
+    async def run():
+        async def cancelled_turn():
+            async with scheduler.aslot("gone"):
+                pass
+
+        gone = asyncio.create_task(cancelled_turn())
+        await asyncio.sleep(0.02)
+        gone.cancel()
+        admitted = asyncio.Event()
+
+        async def turn():
+            async with scheduler.aslot("b"):
+                admitted.set()
+                await asyncio.sleep(0.02)
+
+        task = asyncio.create_task(turn())
+        await asyncio.sleep(0.02)
+        assert scheduler.waiting == 1 and not admitted.is_set()
+        # released from another thread
+        release.set()
+        await asyncio.wait_for(admitted.wait(), 1)
+        assert scheduler.stats()["active"] == 1
+        await task
+
+    asyncio.run(run())
+    thread.join()
+    assert scheduler.stats() == {"slots": 1, "active": 0, "waiting": 0}
@@ -0,0 +1,90 @@
+import json
+import logging
+import pytest
+from log_sink import AsyncLogHandler, JsonMessage, read_records, log_path
+
+
+def make_logger(handler, name):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    return logger
+
+
+def test_text_format_keeps_the_classic_lines(tmp_path):
+    path = tmp_path / "chat.log"
+    handler = AsyncLogHandler(path)
+    logger = make_logger(handler, "test_log_sink.text")
+    logger.info(JsonMessage({"query": "Can I cancel?", "response": "Yes"}))
+    logger.warning("search failed")
+    handler.close()
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert lines[0].endswith('[INFO] {"query": "Can I cancel?", "response": "Yes"}')
+    assert lines[1].endswith("[WARNING] search failed")
+    assert list(read_records(path)) == [{"query": "Can I cancel?", "response": "Yes"}]
+
+
+def test_jsonl_records_are_structured(tmp_path):
+    path = log_path(tmp_path / "chat", "jsonl")
+    handler = AsyncLogHandler(path, format="jsonl")
+    logger = make_logger(handler, "test_log_sink.jsonl")
+    logger.info(JsonMessage({"query": "hi", "history": [["a", "b"]]}))
+    try:
+        raise ValueError("bad question")
+    except ValueError:
+        logger.error("ValueError: bad question", exc_info=True)
+    handler.close()
+
+    first, second = read_records(path)
+    assert path.suffix == ".jsonl"
+    assert first["level"] == "INFO" and first["query"] == "hi" and first["history"] == [["a", "b"]]
+    assert second["message"] == "ValueError: bad question"
+    assert "Traceback" in second["exc"]
+
+
+def test_size_based_rotation(tmp_path):
+    path = tmp_path / "chat.jsonl"
+    handler = AsyncLogHandler(path, format="jsonl", max_bytes=400, backup_count=2, batch_size=1)
+    logger = make_logger(handler, "test_log_sink.rotation")
+    for i in range(30):
+        logger.info(JsonMessage({"query": f"question {i}"}))
+    handler.close()
+
+    files = sorted(p.name for p in tmp_path.iterdir())
+    assert files == ["chat.jsonl", "chat.jsonl.1", "chat.jsonl.2"]
+    assert all(p.stat().st_size <= 400 for p in tmp_path.iterdir())
+    # the newest records are kept, oldest backups dropped
+    queries = [r["query"] for p in ("chat.jsonl.2", "chat.jsonl.1", "chat.jsonl") for r in read_records(tmp_path / p)]
+    assert queries[-1] == "question 29"
+    assert queries == sorted(queries, key=lambda q: int(q.split()[1]))
+
+
+def test_reopens_after_close(tmp_path):
+    path = tmp_path / "chat.log"
+    handler = AsyncLogHandler(path)
+    logger = make_logger(handler, "test_log_sink.reopen")
+    logger.info("before")
+    # logging.config.dictConfig closes the existing handlers
+    handler.close()
+    logger.info("after")
+    handler.close()
+    assert [line.split("] ")[1] for line in path.read_text(encoding="utf-8").splitlines()] == ["before", "after"]
+
+
+def test_msgpack_round_trip(tmp_path):
+    pytest.importorskip("msgpack")
+    path = log_path(tmp_path / "chat", "msgpack")
+    handler = AsyncLogHandler(path, format="msgpack")
+    logger = make_logger(handler, "test_log_sink.msgpack")
+    logger.info(JsonMessage({"query": "hi"}))
+    handler.close()
+    assert [r["query"] for r in read_records(path)] == ["hi"]
+
+
+def test_json_message_is_serialized_lazily():
+    data = {"query": "hi"}
+    message = JsonMessage(data)
+    data["response"] = "hello"
+    assert json.loads(str(message)) == {"query": "hi", "response": "hello"}
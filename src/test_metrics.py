@@ -0,0 +1,100 @@
+import json
+import asyncio
+import logging
+import threading
+import httpx
+from metrics import Registry, Histogram, Counter, MetricsServer, STAGE_SECONDS, span, traced, atraced, current_trace
+from llm_provider import StubLLM, stream_text
+
+
+def span_records(caplog):
+    return [json.loads(r.getMessage()) for r in caplog.records if r.getMessage().startswith('{"span"')]
+
+
+def test_render_prometheus_text():
+    registry = Registry()
+    latency = registry.register(Histogram("test_seconds", "Test latency.", buckets=(0.1, 1.0)))
+    errors = registry.register(Counter("test_errors_total", "Test errors."))
+    latency.observe(0.05, stage="a")
+    latency.observe(0.5, stage="a")
+    latency.observe(5.0, stage="a")
+    errors.inc(stage="a")
+    text = registry.render()
+    assert "# TYPE test_seconds histogram" in text
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{stage="a",le="1.0"} 2' in text
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 3' in text
+    assert 'test_seconds_count{stage="a"} 3' in text
+    assert 'test_errors_total{stage="a"} 1' in text
+
+
+def test_traced_turn_keeps_one_trace_across_threads(caplog):
+    caplog.set_level(logging.INFO)
+    seen = []
+
+    def turn():
+        with span("test_retrieval"):
+            seen.append(current_trace())
+        yield "a"
+        with span("test_generation"):
+            seen.append(current_trace())
+        yield "b"
+
+    steps = traced(turn(), rate=1.0)
+    out = [next(steps)]
+    # the server may advance the generator from another thread
+    worker = threading.Thread(target=lambda: out.extend(steps))
+    worker.start()
+    worker.join()
+
+    assert out == ["a", "b"]
+    assert seen[0] is seen[1] and seen[0].sampled
+    spans = span_records(caplog)
+    assert [s["span"] for s in spans] == ["test_retrieval", "test_generation"]
+    assert {s["trace_id"] for s in spans} == {seen[0].id}
+    assert current_trace() is None
+
+
+def test_unsampled_turns_record_metrics_without_logging(caplog):
+    caplog.set_level(logging.INFO)
+    before = STAGE_SECONDS.count(stage="test_unsampled")
+
+    def turn():
+        with span("test_unsampled"):
+            yield "a"
+
+    assert list(traced(turn(), rate=0.0)) == ["a"]
+    assert STAGE_SECONDS.count(stage="test_unsampled") == before + 1
+    assert span_records(caplog) == []
+
+
+def test_async_turn_and_generation_timing(caplog):
+    caplog.set_level(logging.INFO)
+    first_tokens = STAGE_SECONDS.count(stage="first_token")
+
+    async def turn():
+        yield "".join(stream_text(StubLLM("one two three"), []))
+        yield current_trace()
+
+    async def run():
+        return [item async for item in atraced(turn(), rate=1.0)]
+
+    answer, trace = asyncio.run(run())
+    assert answer == "one two three"
+    assert STAGE_SECONDS.count(stage="first_token") == first_tokens + 1
+    generation = [s for s in span_records(caplog) if s["span"] == "generation"]
+    assert generation[-1]["tokens"] == 3
+    assert generation[-1]["trace_id"] == trace.id
+
+
+def test_metrics_endpoint():
+    registry = Registry()
+    registry.register(Counter("test_requests_total", "Test requests.")).inc()
+    server = MetricsServer(port=0, registry=registry).start()
+    try:
+        response = httpx.get(server.url)
+        assert response.status_code == 200
+        assert "test_requests_total 1" in response.text
+        assert httpx.get(server.url.replace("/metrics", "/other")).status_code == 404
+    finally:
+        server.stop()
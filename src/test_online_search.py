@@ -0,0 +1,78 @@
+import time
+import asyncio
+import pytest
+from concurrent.futures import ThreadPoolExecutor, wait
+import api_online_search
+from api_online_search import hedged_search, hedged_search_async, submit_search
+from search_client import SearchClient
+from search_stub import SearchStubServer
+
+
+@pytest.fixture
+def stubs(monkeypatch):
+    with SearchStubServer() as google, SearchStubServer() as serpapi:
+        clients = {
+            "google": SearchClient("google", google.url, retries=0, read_timeout=2),
+            "serpapi": SearchClient("serpapi", serpapi.url, retries=0, read_timeout=2),
+        }
+        monkeypatch.setattr(api_online_search, "_clients", clients)
+        yield google, serpapi
+
+
+def test_slow_google_is_hedged_with_serpapi(stubs):
+    google, serpapi = stubs
+    google.delay = 0.5
+    wins = api_online_search._hedge_wins["serpapi"]
+    results = hedged_search("slow google", "key", "cx", "serp", delay=0.05)
+    assert results[0]["title"] == "Result 1 for slow google"
+    assert serpapi.request_count == 1
+    assert api_online_search._hedge_wins["serpapi"] == wins + 1
+
+
+def test_fast_google_is_not_hedged(stubs):
+    google, serpapi = stubs
+    assert hedged_search("fast google", "key", "cx", "serp", delay=0.5)
+    assert (google.request_count, serpapi.request_count) == (1, 0)
+
+
+def test_hedged_search_gives_up_at_the_deadline(stubs):
+    google, serpapi = stubs
+    google.delay = serpapi.delay = 1.0
+    start = time.perf_counter()
+    assert hedged_search("both slow", "key", "cx", "serp", delay=0.05, deadline=0.2) == []
+    assert time.perf_counter() - start < 0.6
+    assert asyncio.run(hedged_search_async("both slow async", "key", "cx", "serp", delay=0.05, deadline=0.2)) == []
+
+
+def test_speculative_hedged_searches_do_not_deadlock(stubs, monkeypatch):
+    google, _ = stubs
+    google.delay = 0.2
+    # as many concurrent hedged searches as search threads
+    monkeypatch.setattr(api_online_search, "_executor", ThreadPoolExecutor(max_workers=2))
+    futures = [submit_search(hedged_search, f"query {i}", "key", "cx", "serp", 0.05) for i in range(2)]
+    done, pending = wait(futures, timeout=5)
+    assert not pending
+    assert all(future.result() for future in done)
+
+
+def test_async_hedge_returns_the_first_answer(stubs):
+    google, serpapi = stubs
+    google.delay = 0.5
+    results = asyncio.run(hedged_search_async("slow google async", "key", "cx", "serp", delay=0.05))
+    assert results[0]["title"] == "Result 1 for slow google async"
+
+
+def test_cancelled_hedges_leave_the_breaker_closed(stubs):
+    google, serpapi = stubs
+    google.delay = 0.5
+    breaker = api_online_search._clients["google"].breaker
+
+    async def hedges():
+        for i in range(2 * breaker.failure_threshold):
+            results = await hedged_search_async(f"hedge {i}", "key", "cx", "serp", delay=0.05)
+            assert results[0]["title"] == f"Result 1 for hedge {i}"
+        # let the cancelled Google requests unwind
+        await asyncio.sleep(0.1)
+
+    asyncio.run(hedges())
+    assert (breaker.state, breaker.failures) == ("closed", 0)
@@ -0,0 +1,143 @@
+import os
+import time
+import asyncio
+import threading
+import pytest
+from concurrent.futures import Future
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+import doc_retrieve
+import api_online_search
+from answer_cache import AnswerCache
+from doc_ingest import save_vectorstore
+from llm_provider import StubLLM
+from search_client import SearchClient
+from search_stub import SearchStubServer
+
+FAQ = "Booking fee refunds take 14 working days."
+
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    # app reads its settings when it is imported
+    for name, value in (("DATA_DIR", "docs"), ("RAG_DIR", str(tmp_path_factory.mktemp("rag"))),
+                        ("INDEX_DIR", str(tmp_path_factory.mktemp("index"))), ("RAG_DIST_THRESHOLD", "0.8")):
+        os.environ.setdefault(name, value)
+    import app
+    return app
+
+
+@pytest.fixture
+def chat(app, tmp_path, monkeypatch):
+    """
+    app with a one-chunk FAQ index, the stub LLM and a stub search server.
+    """
+    embeddings = DeterministicFakeEmbedding(size=32)
+    monkeypatch.setattr(doc_retrieve, "_embeddings", embeddings)
+    save_vectorstore(FAISS.from_documents([Document(page_content=FAQ)], embeddings), tmp_path)
+    monkeypatch.setattr(app, "INDEX_DIR", tmp_path)
+    monkeypatch.setattr(app, "get_llm", lambda: StubLLM("Stub answer."))
+    monkeypatch.setattr(app, "answer_cache", None)
+    monkeypatch.setattr(app.summary_worker, "submit", lambda *args: None)
+    contexts = []
+    monkeypatch.setattr(app, "log_response", lambda query, history, context, *args: contexts.append(context))
+    for name, value in (("SEARCH_ENABLED", True), ("SEARCH_HEDGE", False), ("SPECULATIVE_SEARCH", True),
+                        ("GOOGLE_API_KEY", "key"), ("GOOGLE_CSE_ID", "cx")):
+        monkeypatch.setattr(app, name, value)
+    with SearchStubServer() as stub:
+        monkeypatch.setattr(api_online_search, "_clients", {"google": SearchClient("google", stub.url, retries=0)})
+        yield app, stub, contexts
+
+
+def run_turn(app, query):
+    return list(app.chat_fn(query, []))[-1]
+
+
+def run_turn_async(app, query):
+    async def turn():
+        return [response async for response in app.chat_fn_async(query, [])][-1]
+    return asyncio.run(turn())
+
+
+def test_borderline_match_starts_the_search_during_retrieval(chat, monkeypatch):
+    app, stub, contexts = chat
+    # no chunk is close enough: the search starts as soon as the vector search is done
+    monkeypatch.setattr(app, "RAG_DIST_THRESHOLD", "0.0")
+    started = []
+    submit_search = app.submit_search
+    monkeypatch.setattr(app, "submit_search", lambda *args: started.append(True) or submit_search(*args))
+
+    assert run_turn(app, "What is the current car loan rate?") == "Stub answer."
+    assert started == [True] and stub.request_count == 1
+    assert "Result 1 for What is the current car loan rate?" in contexts[0]
+
+
+def test_faq_answer_does_not_use_the_speculative_search(chat, monkeypatch):
+    app, stub, contexts = chat
+    monkeypatch.setattr(app, "RAG_DIST_THRESHOLD", "0.05")
+    # a clear FAQ match never starts a search
+    monkeypatch.setattr(app, "SEARCH_BAND", 0.0)
+    run_turn(app, FAQ)
+    assert stub.request_count == 0
+
+    # within the band: the search starts, but the FAQ chunk is used
+    monkeypatch.setattr(app, "SEARCH_BAND", 0.1)
+    doc_retrieve.get_retriever(app.INDEX_DIR).result_cache.clear()
+    run_turn(app, FAQ)
+    assert FAQ in contexts[1] and "online search results" not in contexts[1]
+
+
+def test_slow_speculative_search_is_abandoned(chat, monkeypatch):
+    app, _, _ = chat
+    monkeypatch.setenv("SEARCH_DEADLINE", "0.1")
+    start = time.perf_counter()
+    context = app.build_context("anything", "", Future())
+    assert time.perf_counter() - start < 1
+    assert "facing some problems" in context
+
+
+def test_async_turn_searches_and_caches_off_the_event_loop(chat, monkeypatch):
+    app, stub, contexts = chat
+    monkeypatch.setattr(app, "RAG_DIST_THRESHOLD", "0.0")
+    monkeypatch.setattr(app, "answer_cache", AnswerCache())
+    lookup_threads = []
+    lookup_cached_answer = app.lookup_cached_answer
+    monkeypatch.setattr(app, "lookup_cached_answer",
+                        lambda *args: lookup_threads.append(threading.current_thread()) or lookup_cached_answer(*args))
+
+    assert run_turn_async(app, "What is the current car loan rate?") == "Stub answer."
+    assert stub.request_count == 1
+    assert "Result 1 for What is the current car loan rate?" in contexts[0]
+    # the answer cache lookup embeds the query, so it must not run on the event loop
+    assert lookup_threads and threading.main_thread() not in lookup_threads
+
+
+def test_async_turn_answers_from_the_faq(chat, monkeypatch):
+    app, stub, contexts = chat
+    monkeypatch.setattr(app, "RAG_DIST_THRESHOLD", "0.05")
+    monkeypatch.setattr(app, "SEARCH_BAND", 0.0)
+    assert run_turn_async(app, FAQ) == "Stub answer."
+    assert FAQ in contexts[0] and stub.request_count == 0
+
+
+def test_dropped_speculative_searches_leave_the_breaker_closed(chat, monkeypatch):
+    app, stub, contexts = chat
+    stub.delay = 0.5
+    monkeypatch.setattr(app, "RAG_DIST_THRESHOLD", "0.05")
+    monkeypatch.setattr(app, "SEARCH_BAND", 0.1)
+    breaker = api_online_search._clients["google"].breaker
+    for _ in range(2 * breaker.failure_threshold):
+        doc_retrieve.get_retriever(app.INDEX_DIR).result_cache.clear()
+        assert run_turn_async(app, FAQ) == "Stub answer."
+    # every turn started a search and dropped it for the FAQ chunk
+    assert all(FAQ in context for context in contexts)
+    assert stub.request_count > 0
+    assert (breaker.state, breaker.failures) == ("closed", 0)
+
+
+def test_speculation_band(app, monkeypatch):
+    monkeypatch.setattr(app, "SPECULATIVE_SEARCH", True)
+    monkeypatch.setattr(app, "RAG_DIST_THRESHOLD", "0.8")
+    monkeypatch.setattr(app, "SEARCH_BAND", 0.1)
+    assert [app.should_speculate(d) for d in (None, 0.5, 0.75, 0.9)] == [False, False, True, True]
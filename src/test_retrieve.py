@@ -0,0 +1,68 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+import doc_retrieve
+from doc_retrieve import Retriever
+from doc_ingest import save_vectorstore
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    fake = DeterministicFakeEmbedding(size=32)
+    monkeypatch.setattr(doc_retrieve, "_embeddings", fake)
+    return fake
+
+
+def build_index(index_dir, texts, embeddings):
+    save_vectorstore(FAISS.from_documents([Document(page_content=text) for text in texts], embeddings), index_dir)
+
+
+def test_retrieve_is_cached_per_query_and_threshold(tmp_path, embeddings):
+    build_index(tmp_path, ["cooling-off period", "car inspection", "financing"], embeddings)
+    retriever = Retriever(tmp_path, mode="dense")
+
+    first = retriever.retrieve("Cooling-off  period", 2, 100.0)
+    assert first[0][0].page_content == "cooling-off period"
+    assert retriever.retrieve("cooling-off period", 2, 100.0) == first
+    assert retriever.result_cache.stats()["hits"] == 1
+
+    retriever.retrieve("cooling-off period", 2, 0.5)
+    stats = retriever.stats()
+    assert stats["result_cache"]["misses"] == 2
+    # the query embedding is reused for the new threshold
+    assert stats["query_cache"]["hits"] == 1
+
+
+def test_index_change_reloads_and_invalidates_cache(tmp_path, embeddings):
+    build_index(tmp_path, ["cooling-off period"], embeddings)
+    retriever = Retriever(tmp_path, mode="dense")
+    assert retriever.retrieve("financing", 1, 1000.0)[0][0].page_content == "cooling-off period"
+    assert retriever.version == 1
+
+    build_index(tmp_path, ["financing"], embeddings)
+    assert retriever.retrieve("financing", 1, 1000.0)[0][0].page_content == "financing"
+    assert retriever.version == 2
+    assert retriever.stats()["load_count"] == 2
+
+
+def test_hybrid_retrieval_adds_exact_term_matches(tmp_path, embeddings):
+    texts = ["PART B1 : selling your used vehicle to us", "the cooling-off period lasts five days", "financing options", "insurance"]
+    build_index(tmp_path, texts, embeddings)
+    query = "How long is the cooling-off period?"
+
+    # random fake vectors are never within the threshold, so only BM25 can find the chunk
+    assert Retriever(tmp_path, mode="dense").retrieve(query, 2, 1.0) == []
+    results = Retriever(tmp_path, bm25_min_score=0).retrieve(query, 2, 1.0)
+    assert [(doc.page_content, distance) for doc, distance in results] == [(texts[1], None)]
+
+
+def test_hybrid_retrieval_ranks_chunks_found_by_both_first(tmp_path, embeddings):
+    texts = ["financing options", "financing is arranged by partner financiers", "insurance"]
+    build_index(tmp_path, texts, embeddings)
+    retriever = Retriever(tmp_path, bm25_min_score=0)
+
+    results = retriever.retrieve("financing options", 3, 1.0)
+    assert [doc.page_content for doc, _ in results] == texts[:2]
+    assert results[0][1] == pytest.approx(0.0)
+    assert retriever.stats()["bm25_count"] == 1
@@ -0,0 +1,112 @@
+import time
+import asyncio
+import pytest
+import requests
+from search_client import SearchClient, SearchUnavailableError
+from search_stub import SearchStubServer
+
+
+@pytest.fixture
+def stub():
+    with SearchStubServer() as server:
+        yield server
+
+
+def make_client(url, **kwargs):
+    kwargs = {"retries": 1, "backoff": 0.01, "read_timeout": 0.5, **kwargs}
+    return SearchClient("google", url, **kwargs)
+
+
+def test_results_are_cached_per_query(stub):
+    client = make_client(stub.url)
+    params = {"q": "carro", "cx": "x", "num": 2}
+    first = client.get_json(params, ("carro", 2))
+    assert [item["title"] for item in first["items"]] == ["Result 1 for carro", "Result 2 for carro"]
+    assert client.get_json(params, ("carro", 2)) == first
+    assert stub.request_count == 1
+
+
+def test_slow_upstream_times_out_and_is_retried(stub):
+    stub.delay = 0.3
+    client = make_client(stub.url, read_timeout=0.1)
+    with pytest.raises(SearchUnavailableError):
+        client.get_json({"q": "carro", "cx": "x"}, "carro")
+    assert stub.request_count == 2
+
+
+def test_open_circuit_fails_fast(stub):
+    stub.status = 503
+    client = make_client(stub.url, retries=0, failure_threshold=2, reset_timeout=60)
+    for query in ("a", "b"):
+        with pytest.raises(SearchUnavailableError):
+            client.get_json({"q": query, "cx": "x"}, query)
+    assert client.breaker.state == "open"
+
+    with pytest.raises(SearchUnavailableError):
+        client.get_json({"q": "c", "cx": "x"}, "c")
+    assert stub.request_count == 2
+
+
+def test_half_open_trial_closes_circuit(stub):
+    stub.status = 503
+    client = make_client(stub.url, retries=0, failure_threshold=1, reset_timeout=0.05)
+    with pytest.raises(SearchUnavailableError):
+        client.get_json({"q": "a", "cx": "x"}, "a")
+
+    stub.status = 200
+    time.sleep(0.1)
+    data = asyncio.run(client.aget_json({"q": "b", "cx": "x"}, "b"))
+    assert data["items"]
+    assert client.breaker.state == "closed"
+
+
+def test_cancelled_half_open_trial_releases_the_circuit(stub):
+    stub.status = 503
+    client = make_client(stub.url, retries=0, failure_threshold=1, reset_timeout=0.05)
+    with pytest.raises(SearchUnavailableError):
+        client.get_json({"q": "a", "cx": "x"}, "a")
+
+    async def cancel_trial():
+        trial = asyncio.ensure_future(client.aget_json({"q": "b", "cx": "x"}, "b"))
+        await asyncio.sleep(0.1)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+    stub.status, stub.delay = 200, 0.4
+    time.sleep(0.1)
+    asyncio.run(cancel_trial())
+    # not counted as a failure, but the next trial gets through right away
+    assert client.breaker.state == "half-open" and client.breaker.failures == 1
+
+    stub.delay = 0
+    assert client.get_json({"q": "c", "cx": "x"}, "c")["items"]
+    assert client.breaker.state == "closed"
+
+
+def test_cancelled_calls_do_not_open_the_circuit(stub):
+    stub.delay = 0.4
+    client = make_client(stub.url, retries=0, failure_threshold=2)
+
+    async def cancel_calls():
+        for i in range(5):
+            call = asyncio.ensure_future(client.aget_json({"q": f"q{i}", "cx": "x"}, f"q{i}"))
+            await asyncio.sleep(0.05)
+            call.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await call
+
+    asyncio.run(cancel_calls())
+    assert client.breaker.state == "closed" and client.breaker.failures == 0
+
+
+def test_unexpected_request_errors_count_as_failures(stub, monkeypatch):
+    client = make_client(stub.url, retries=0, failure_threshold=1, reset_timeout=60)
+
+    def redirect_loop(*args, **kwargs):
+        raise requests.TooManyRedirects("Exceeded 30 redirects.")
+
+    monkeypatch.setattr(client.session, "get", redirect_loop)
+    with pytest.raises(SearchUnavailableError):
+        client.get_json({"q": "a", "cx": "x"}, "a")
+    assert client.breaker.state == "open"
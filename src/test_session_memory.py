@@ -0,0 +1,39 @@
+import time
+import pytest
+from session_memory import InMemorySessionStore, SQLiteSessionStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "memory":
+            return InMemorySessionStore(shards=1, **kwargs)
+        return SQLiteSessionStore(tmp_path / "sessions.db", sweep_every=1, **kwargs)
+    return make
+
+
+def test_sessions_are_isolated(make_store):
+    store = make_store()
+    store.set("a", "User asked about financing.")
+    store.set("b", "User asked about inspections.")
+    assert store.get("a") == "User asked about financing."
+    assert store.get("b") == "User asked about inspections."
+    assert store.get("c") == ""
+
+
+def test_least_recently_used_session_is_evicted(make_store):
+    store = make_store(max_sessions=2)
+    store.set("a", "1")
+    time.sleep(0.01)
+    store.set("b", "2")
+    time.sleep(0.01)
+    store.set("c", "3")
+    assert store.get("a") == ""
+    assert len(store) == 2
+
+
+def test_idle_sessions_expire(make_store):
+    store = make_store(idle_ttl=0.05)
+    store.set("a", "summary")
+    time.sleep(0.1)
+    assert store.get("a") == ""
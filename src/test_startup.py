@@ -0,0 +1,63 @@
+import httpx
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+import doc_retrieve
+from doc_ingest import save_vectorstore
+from metrics import MetricsServer, Registry
+from startup import Readiness, run_startup, health_routes
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    fake = DeterministicFakeEmbedding(size=32)
+    monkeypatch.setattr(doc_retrieve, "_embeddings", fake)
+    return fake
+
+
+def build_index(index_dir, embeddings):
+    docs = [Document(page_content=text) for text in ("booking fee", "test drive")]
+    save_vectorstore(FAISS.from_documents(docs, embeddings), index_dir)
+
+
+def test_prebuilt_index_is_ready_without_ingest(tmp_path, embeddings):
+    build_index(tmp_path, embeddings)
+    readiness = Readiness()
+    warmed = []
+    run_startup(readiness, tmp_path / "missing-docs", tmp_path, prebuilt=True, warm_up_llm=lambda: warmed.append(True))
+
+    status = readiness.status()
+    assert status["ready"] and status["phase"] == "ready" and status["error"] is None
+    assert "ingest" not in status["timings"]
+    assert {"load_index", "embedding_warm_up", "llm_warm_up", "time_to_ready"} <= set(status["timings"])
+    assert warmed == [True]
+
+
+def test_existing_index_keeps_serving_when_ingest_fails(tmp_path, embeddings):
+    build_index(tmp_path, embeddings)
+    readiness = Readiness()
+    run_startup(readiness, tmp_path / "missing-docs", tmp_path)
+    assert readiness.is_ready
+    assert readiness.phase == "failed" and "missing-docs" in readiness.error
+
+
+def test_readyz_reports_startup_state(tmp_path, embeddings):
+    readiness = Readiness()
+    server = MetricsServer(port=0, registry=Registry(), routes=health_routes(readiness)).start()
+    base = server.url.replace("/metrics", "")
+    try:
+        assert httpx.get(f"{base}/healthz").status_code == 200
+        assert httpx.get(f"{base}/readyz").status_code == 503
+
+        # prebuilt mode without an index fails and never becomes ready
+        run_startup(readiness, tmp_path, tmp_path, prebuilt=True)
+        response = httpx.get(f"{base}/readyz")
+        assert response.status_code == 503
+        assert response.json()["phase"] == "failed"
+
+        build_index(tmp_path, embeddings)
+        run_startup(readiness, tmp_path, tmp_path, prebuilt=True)
+        assert httpx.get(f"{base}/readyz").json()["ready"] is True
+    finally:
+        server.stop()
@@ -0,0 +1,117 @@
+import time
+import threading
+import pytest
+from summary_worker import SummaryWorker, LiveRequests
+
+
+class Summarizer:
+    """
+    Records calls; a call for session "block" waits until release() is called.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.blocked = threading.Event()
+        self._release = threading.Event()
+        self.done = threading.Condition()
+
+    def __call__(self, history, session_id):
+        if session_id == "block":
+            self.blocked.set()
+            self._release.wait(5)
+        with self.done:
+            self.calls.append((session_id, history))
+            self.done.notify_all()
+
+    def release(self):
+        self._release.set()
+
+    def wait_for(self, count, timeout=5):
+        with self.done:
+            assert self.done.wait_for(lambda: len(self.calls) >= count, timeout)
+
+
+@pytest.fixture
+def summarizer():
+    return Summarizer()
+
+
+def make_worker(summarizer, **kwargs):
+    worker = SummaryWorker(summarizer, **kwargs)
+    # keep the only worker thread busy, so later submissions stay queued
+    worker.submit("block", [])
+    assert summarizer.blocked.wait(5)
+    return worker
+
+
+def test_pending_updates_of_a_session_are_coalesced(summarizer):
+    worker = make_worker(summarizer)
+    worker.submit("a", [("q1", "a1")])
+    worker.submit("b", [("q1", "a1")])
+    worker.submit("a", [("q1", "a1"), ("q2", "a2")])
+    assert worker.depth() == 2
+    summarizer.release()
+    summarizer.wait_for(3)
+    worker.stop(5)
+
+    # "a" keeps its place in the queue and is summarized once, with the newest history
+    assert summarizer.calls[1:] == [("a", [("q1", "a1"), ("q2", "a2")]), ("b", [("q1", "a1")])]
+    assert worker.stats["coalesced"] == 1 and worker.stats["completed"] == 3
+
+
+def test_full_queue_drops_the_oldest_job(summarizer):
+    worker = make_worker(summarizer, max_pending=2)
+    for session_id in ("a", "b", "c"):
+        worker.submit(session_id, [])
+    assert worker.depth() == 2
+    summarizer.release()
+    summarizer.wait_for(3)
+    worker.stop(5)
+    assert [session_id for session_id, _ in summarizer.calls] == ["block", "b", "c"]
+    assert worker.stats["dropped"] == 1
+
+
+def test_stale_jobs_are_dropped(summarizer):
+    worker = make_worker(summarizer, max_age=0.05)
+    worker.submit("a", [])
+    time.sleep(0.1)
+    summarizer.release()
+    summarizer.wait_for(1)
+    worker.stop(5)
+    assert [session_id for session_id, _ in summarizer.calls] == ["block"]
+    assert worker.stats["stale"] == 1
+
+
+def test_jobs_wait_while_chat_turns_are_running(summarizer):
+    live_requests = LiveRequests()
+    worker = SummaryWorker(summarizer, is_busy=live_requests.busy, max_defer=5)
+    with live_requests:
+        worker.submit("a", [])
+        time.sleep(0.2)
+        assert summarizer.calls == []
+    summarizer.wait_for(1)
+    worker.stop(5)
+
+
+def test_deferral_is_bounded_by_max_defer(summarizer):
+    worker = SummaryWorker(summarizer, is_busy=lambda: True, max_defer=0.1)
+    start = time.monotonic()
+    worker.submit("a", [])
+    summarizer.wait_for(1)
+    assert 0.1 <= time.monotonic() - start < 1
+    worker.stop(5)
+
+
+def test_failures_are_logged_and_counted(caplog):
+    def fail(history, session_id):
+        raise RuntimeError("LLM unavailable")
+
+    worker = SummaryWorker(fail)
+    worker.submit("a", [])
+    deadline = time.monotonic() + 5
+    while worker.stats["failed"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    worker.stop(5)
+    assert worker.stats["failed"] == 1
+    assert "Failed to update summary for session a" in caplog.text
+    assert "RuntimeError: LLM unavailable" in caplog.text